@@ -14,7 +14,7 @@ parent_dir = Path(__file__).resolve().parent.parent
 sys.path.append(str(parent_dir))
 
 # Hopsworks import
-from src.citi_interface import get_feature_store
+from src.citi_interface import get_cached_feature_view
 
 # =============================
 # 📥 Load Citi Bike Data
@@ -22,12 +22,8 @@ from src.citi_interface import get_feature_store
 
 @st.cache_data
 def load_citibike_data():
-    feature_store = get_feature_store()
-    feature_view = feature_store.get_feature_view(
-        name=config.FEATURE_VIEW_NAME,
-        version=config.FEATURE_VIEW_VERSION
-    )
-    df = feature_view.get_batch_data()
+    # Local read-through cache: reruns only fetch hours newer than the cached ones
+    df = get_cached_feature_view().get_batch_data()
     return df
 
 # =============================
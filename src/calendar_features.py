@@ -0,0 +1,153 @@
+# src/calendar_features.py (FOR CITI BIKE PROJECT)
+
+from functools import lru_cache
+from pathlib import Path
+
+import holidays
+import numpy as np
+import pandas as pd
+
+from src.parallel_util import atomic_output_path
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / "data" / "calendar"
+NS_PER_HOUR = 3_600 * 1_000_000_000
+PEAK_HOURS = [7, 8, 9, 16, 17, 18, 19]
+
+CALENDAR_FEATURES = [
+    "hour", "hour_sin", "hour_cos", "day_of_week", "is_holiday_or_weekend",
+    "month", "is_peak_hour", "day_of_year", "time_of_day",
+    "day", "week_of_year", "quarter", "is_start_of_month", "is_end_of_month",
+]
+
+# ==============================
+# 🕰 Hour Helpers
+# ==============================
+
+def map_time_of_day(hour: int) -> str:
+    """Categorize hour into parts of day."""
+    if 0 <= hour <= 5:
+        return "Night"
+    elif 6 <= hour <= 11:
+        return "Morning"
+    elif 12 <= hour <= 17:
+        return "Afternoon"
+    else:
+        return "Evening"
+
+TIME_OF_DAY_BY_HOUR = np.array([map_time_of_day(hour) for hour in range(24)], dtype=object)
+
+# ==============================
+# 📅 Calendar Dimension Table
+# ==============================
+
+def build_calendar(start_year: int, end_year: int, tz: str = "America/New_York") -> pd.DataFrame:
+    """
+    One row per hour from Jan 1 ``start_year`` to Dec 31 ``end_year`` (local
+    time in ``tz``) with every calendar feature the pipelines use.
+    """
+    # tz-aware endpoints make this a range of real instants, so DST days
+    # simply have 23 or 25 rows and every hour in range appears exactly once
+    hour_ts = pd.date_range(
+        start=pd.Timestamp(year=start_year, month=1, day=1, tz=tz),
+        end=pd.Timestamp(year=end_year, month=12, day=31, hour=23, tz=tz),
+        freq="h",
+    ).as_unit("ns")
+
+    us_holidays = holidays.US(years=range(start_year, end_year + 1))
+
+    calendar = pd.DataFrame({"hour_ts": hour_ts})
+    hour = hour_ts.hour.to_numpy()
+    day_of_week = hour_ts.dayofweek.to_numpy()
+    is_holiday = pd.Index(hour_ts.date).isin(list(us_holidays.keys()))
+
+    calendar["hour"] = hour
+    calendar["hour_sin"] = np.sin(2 * np.pi * hour / 24)
+    calendar["hour_cos"] = np.cos(2 * np.pi * hour / 24)
+    calendar["day_of_week"] = day_of_week
+    calendar["is_holiday_or_weekend"] = ((day_of_week >= 5) | is_holiday).astype(int)
+    calendar["month"] = hour_ts.month.to_numpy()
+    calendar["is_peak_hour"] = np.isin(hour, PEAK_HOURS).astype(int)
+    calendar["day_of_year"] = hour_ts.dayofyear.to_numpy()
+    calendar["time_of_day"] = TIME_OF_DAY_BY_HOUR[hour]
+    calendar["day"] = hour_ts.day.to_numpy()
+    calendar["week_of_year"] = hour_ts.isocalendar().week.to_numpy().astype(int)
+    calendar["quarter"] = hour_ts.quarter.to_numpy()
+    calendar["is_start_of_month"] = hour_ts.is_month_start.astype(int)
+    calendar["is_end_of_month"] = hour_ts.is_month_end.astype(int)
+
+    return calendar
+
+@lru_cache(maxsize=32)
+def _load_calendar_year(year: int, tz: str, cache_dir: str) -> pd.DataFrame:
+    """One year of the calendar, cached on disk as one file per (tz, year)."""
+    cache_file = Path(cache_dir) / f"calendar_{tz.replace('/', '_')}_{year}.parquet"
+
+    if cache_file.exists():
+        try:
+            return pd.read_parquet(cache_file)
+        except Exception as e:
+            print(f"⚠️ Rebuilding unreadable calendar cache {cache_file.name}: {e}")
+
+    calendar = build_calendar(year, year, tz)
+
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_output_path(cache_file) as tmp_file:
+            calendar.to_parquet(tmp_file, index=False)
+    except OSError as e:
+        print(f"⚠️ Could not cache calendar at {cache_file}: {e}")
+
+    return calendar
+
+@lru_cache(maxsize=8)
+def _load_calendar(start_year: int, end_year: int, tz: str, cache_dir: str) -> pd.DataFrame:
+    years = [_load_calendar_year(year, tz, cache_dir) for year in range(start_year, end_year + 1)]
+    return years[0] if len(years) == 1 else pd.concat(years, ignore_index=True)
+
+def load_calendar(start_year: int, end_year: int, tz: str = "America/New_York", cache_dir=None) -> pd.DataFrame:
+    """
+    Calendar table for ``[start_year, end_year]``, stitched from per-year
+    tables read from the disk cache (each built and written on first use),
+    so overlapping ranges share files. Memoized for the process.
+    """
+    return _load_calendar(int(start_year), int(end_year), tz, str(cache_dir or DEFAULT_CACHE_DIR))
+
+def add_calendar_features(
+    df: pd.DataFrame,
+    time_col: str = "hour_ts",
+    columns: list = None,
+    cache_dir=None,
+) -> pd.DataFrame:
+    """
+    Join calendar features onto ``df`` by hour instead of recomputing them.
+
+    Features are evaluated in the timezone of ``df[time_col]`` (naive
+    timestamps are read as UTC wall time, as ``.dt`` accessors would), over
+    whatever years the data spans. Because the calendar is a gap-free hourly
+    table, the join is a positional ``take`` and keeps ``df``'s row order.
+    Returns a new frame; ``df`` itself is left unchanged.
+    """
+    columns = list(columns or CALENDAR_FEATURES)
+    df = df.copy(deep=False)  # new columns only, so the existing ones can be shared
+    if df.empty:
+        for col in columns:
+            df[col] = pd.Series(dtype="object" if col == "time_of_day" else "int64")
+        return df
+
+    times = pd.DatetimeIndex(pd.to_datetime(df[time_col]))
+    if times.hasnans:
+        raise ValueError(f"'{time_col}' contains missing timestamps; drop them before adding calendar features.")
+
+    tz = str(times.tz) if times.tz is not None else "UTC"
+    if times.tz is None:
+        times = times.tz_localize("UTC")
+
+    calendar = load_calendar(times.min().year, times.max().year, tz, cache_dir)
+
+    first_hour_ns = calendar["hour_ts"].iloc[0].value
+    positions = (times.as_unit("ns").asi8 - first_hour_ns) // NS_PER_HOUR
+
+    for col in columns:
+        df[col] = calendar[col].to_numpy()[positions]
+
+    return df
@@ -1,38 +1,83 @@
 # src/citi_interface.py
 
+import os
 from datetime import datetime, timedelta, timezone
-import hopsworks
-import numpy as np
 import pandas as pd
-from hsfs.feature_store import FeatureStore
 import joblib
 from pathlib import Path
 
 import src.config as config
+from src.feature_spec import FeatureSpec, spec_path_for
+from src.feature_view_cache import FEATURE_VIEW_CACHE_DIR, CachedFeatureView
+from src.model_export import export_dir_for, has_export, load_lean_model
+from src.storage_backend import LocalBackend, get_backend, get_session
+
+LOCAL_MODEL_PATH = Path(__file__).parent.parent / "models" / "lgbmhyper.pkl"
 
 # ===============================
 # ✨ Basic Utilities
 # ===============================
 
-def get_hopsworks_project() -> hopsworks.project.Project:
-    return hopsworks.login(
-        project=config.HOPSWORKS_PROJECT_NAME,
-        api_key_value=config.HOPSWORKS_API_KEY
-    )
+# Reads, writes and the registry go through get_backend() (STORAGE_BACKEND=
+# hopsworks|local); the handles below are for Hopsworks-only code.
+
+def get_hopsworks_project():
+    return get_session().project()
+
+def get_feature_store():
+    return get_session().feature_store()
+
+def get_model_registry():
+    return get_session().model_registry()
 
-def get_feature_store() -> FeatureStore:
-    project = get_hopsworks_project()
-    return project.get_feature_store()
+def get_feature_view(feature_store=None):
+    if feature_store is not None:
+        return feature_store.get_feature_view(
+            name=config.FEATURE_VIEW_NAME,
+            version=config.FEATURE_VIEW_VERSION
+        )
+    return get_backend().feature_view(config.FEATURE_VIEW_NAME, config.FEATURE_VIEW_VERSION)
+
+def get_cached_feature_view(cache_dir=None, feature_view=None):
+    """
+    The configured feature view behind a local read-through cache
+    (``data/feature_view_cache/``). Hopsworks is only logged into when rows
+    are missing locally, and then only the missing range is fetched.
+
+    With ``LOCAL_FEATURE_VIEW_DIR`` set, the feature view of a local store
+    rooted there (``LocalBackend``) stands in for Hopsworks behind the
+    cache, for offline runs of the cache itself. A local storage backend
+    is already local, so its view is returned without a cache.
+    """
+    if feature_view is None:
+        local_dir = os.environ.get("LOCAL_FEATURE_VIEW_DIR")
+        if local_dir:
+            feature_view = LocalBackend(local_dir).feature_view(config.FEATURE_VIEW_NAME, config.FEATURE_VIEW_VERSION)
+        elif not get_backend().remote:
+            return get_feature_view()
+        else:
+            feature_view = get_feature_view
+
+    cache_dir = cache_dir or FEATURE_VIEW_CACHE_DIR / f"{config.FEATURE_VIEW_NAME}_v{config.FEATURE_VIEW_VERSION}"
+    return CachedFeatureView(feature_view, cache_dir)
 
 # ===============================
 # ✨ Model Loading & Saving
 # ===============================
 
-def load_model_from_local():
+def load_model_from_local(model_path=None, prefer_lean: bool = True):
     """
     Load a pre-trained model from the models/ directory inside the repo.
+
+    If a native export (``python -m src.model_export``) sits next to the
+    pickle, e.g. ``models/lgbmhyper/``, the lean booster is loaded instead:
+    no unpickling and no sklearn on the prediction path.
     """
-    model_path = Path(__file__).parent.parent / "models" / "lgbmhyper.pkl"
+    model_path = Path(model_path or LOCAL_MODEL_PATH)
+
+    export_dir = export_dir_for(model_path)
+    if prefer_lean and has_export(export_dir):
+        return load_lean_model(export_dir)
     
     if not model_path.exists():
         raise FileNotFoundError(f"❌ Model file not found at {model_path}")
@@ -40,36 +85,77 @@ def load_model_from_local():
     model = joblib.load(model_path)
     return model
 
-def save_model_to_registry(model_name: str, metrics: dict = None):
+def load_feature_spec_for_model(model, model_path=None) -> FeatureSpec:
     """
-    Upload the trained model to Hopsworks Model Registry.
-    Assumes model file already saved locally as {model_name}.pkl
+    Feature spec the model was trained with, read from the
+    ``<model>.features.json`` saved next to it. Older models without one get
+    a spec rebuilt from the columns they were fitted on.
     """
-    project = get_hopsworks_project()
-    model_registry = project.get_model_registry()
+    if getattr(model, "feature_spec", None):
+        return FeatureSpec.from_dict(model.feature_spec)
 
-    model_path = Path(f"{model_name}.pkl")
-    if not model_path.exists():
-        raise FileNotFoundError(f"❌ Cannot find model file {model_path} to upload!")
+    spec_path = spec_path_for(model_path or LOCAL_MODEL_PATH)
+    if spec_path.exists():
+        return FeatureSpec.load(spec_path)
+
+    feature_names = getattr(model, "feature_names_in_", None)
+    if feature_names is None:
+        raise FileNotFoundError(f"❌ No feature spec at {spec_path} and the model does not record its input columns")
+
+    print(f"⚠️ No feature spec at {spec_path}; using the model's {len(feature_names)} fitted columns.")
+    return FeatureSpec.from_columns(list(feature_names))
+
+def download_latest_registered_model(model_name: str = None):
+    """
+    Download the latest registered version of ``model_name`` and return its
+    local directory, or None if nothing is registered yet.
+    """
+    try:
+        return get_backend().download_model(model_name or config.MODEL_NAME)
+
+    except Exception as e:
+        print(f"⚠️ Could not download the latest registered model: {e}")
+        return None
 
-    model_registry.upload_model(
-        str(model_path),
-        model_name=model_name,
+def save_model_to_registry(model_name: str, metrics: dict = None, model_dir=None):
+    """
+    Register the trained model as a new version on the configured backend
+    (Hopsworks, or the local store with STORAGE_BACKEND=local).
+    Assumes the model was saved locally under models/{model_name}/.
+    """
+    model_dir = Path(model_dir or Path("models") / model_name)
+    if not model_dir.exists():
+        raise FileNotFoundError(f"❌ Cannot find model directory {model_dir} to upload!")
+
+    registered_model = get_backend().register_model(
+        model_name,
+        model_dir,
         metrics=metrics if metrics else {},
         description="Trained model uploaded from GitHub Actions",
-        overwrite=True,
     )
-    print(f"✅ Model '{model_name}' uploaded successfully to registry.")
+    print(f"✅ Model '{model_name}' registered as version {registered_model.version}.")
+    return registered_model
+
+# ===============================
+# 🔎 Query Layer
+# ===============================
 
-def save_metrics_to_registry(model_name: str, metrics: dict):
+def query_feature_group(
+    name: str,
+    version: int = 1,
+    start=None,
+    end=None,
+    stations=None,
+    columns=None,
+) -> pd.DataFrame:
     """
-    Save evaluation metrics to Hopsworks Model Registry.
+    Read rows with ``start <= hour_ts < end`` for ``stations`` from a
+    feature group. The time range and station list are pushed down as
+    feature-group filters and only ``columns`` are selected (``hour_ts``
+    and ``start_station_id`` always come along), so transfer follows what
+    the caller uses. ``None`` means no restriction.
     """
-    project = get_hopsworks_project()
-    model_registry = project.get_model_registry()
-    model = model_registry.get_model(model_name, version=None)
-    model.save_metrics(metrics)
-    print(f"✅ Metrics for model '{model_name}' saved to registry.")
+    return get_backend().read_feature_group(name, version, start=start, end=end, stations=stations, columns=columns)
 
 # ===============================
 # ✨ Feature Fetching
@@ -79,17 +165,12 @@ def load_batch_of_features_from_store(current_date: datetime) -> pd.DataFrame:
     """
     Fetch latest batch features for prediction from Feature Store.
     """
-    feature_store = get_feature_store()
-
     fetch_data_to = current_date - timedelta(hours=1)
     fetch_data_from = current_date - timedelta(days=29)
 
     print(f"Fetching CitiBike data from {fetch_data_from} to {fetch_data_to}")
 
-    feature_view = feature_store.get_feature_view(
-        name=config.FEATURE_VIEW_NAME,
-        version=config.FEATURE_VIEW_VERSION
-    )
+    feature_view = get_cached_feature_view()
 
     ts_data = feature_view.get_batch_data(
         start_time=(fetch_data_from - timedelta(days=1)),
@@ -102,7 +183,7 @@ def load_batch_of_features_from_store(current_date: datetime) -> pd.DataFrame:
     print(f"✅ Loaded {ts_data.shape[0]} samples for batch prediction.")
     return ts_data
 
-def fetch_days_data(days: int) -> pd.DataFrame:
+def fetch_days_data(days: int, stations=None, columns=None) -> pd.DataFrame:
     """
     Fetch historical Citi Bike data for model training.
     """
@@ -112,52 +193,56 @@ def fetch_days_data(days: int) -> pd.DataFrame:
 
     print(f"Fetching CitiBike ride data from {fetch_data_from} to {fetch_data_to}")
 
-    fs = get_feature_store()
-    fg = fs.get_feature_group(name=config.FEATURE_GROUP_NAME, version=1)
-
-    df = fg.select_all().read()
-    cond = (df["hour_ts"] >= fetch_data_from) & (df["hour_ts"] <= fetch_data_to)
-
-    return df[cond]
+    # The query's end is exclusive; widen it and keep hour_ts <= fetch_data_to
+    df = query_feature_group(
+        config.FEATURE_GROUP_NAME,
+        start=fetch_data_from,
+        end=fetch_data_to + timedelta(hours=1),
+        stations=stations,
+        columns=columns,
+    )
+    return df[pd.to_datetime(df["hour_ts"], utc=True) <= fetch_data_to]
 
 # ===============================
 # ✨ Fetch Past Predictions (for dashboard or monitoring)
 # ===============================
 
-def fetch_next_hour_predictions():
+def fetch_next_hour_predictions(stations=None, columns=None):
     now = datetime.now(timezone.utc)
     next_hour = (now + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
 
-    fs = get_feature_store()
-    fg = fs.get_feature_group(name=config.FEATURE_GROUP_MODEL_PREDICTION, version=1)
-    df = fg.read()
-
-    df = df[df["hour_ts"] == next_hour]
+    df = query_feature_group(
+        config.FEATURE_GROUP_MODEL_PREDICTION,
+        start=next_hour,
+        end=next_hour + timedelta(hours=1),
+        stations=stations,
+        columns=columns,
+    )
 
     print(f"Current UTC time: {now}")
     print(f"Next hour: {next_hour}")
     print(f"Found {len(df)} prediction records")
     return df
 
-def fetch_predictions(hours: int) -> pd.DataFrame:
+def fetch_predictions(hours: int, stations=None, columns=None) -> pd.DataFrame:
     current_hour = (pd.Timestamp.now(tz="Etc/UTC") - timedelta(hours=hours)).floor("h")
 
-    fs = get_feature_store()
-    fg = fs.get_feature_group(name=config.FEATURE_GROUP_MODEL_PREDICTION, version=1)
-
-    df = fg.filter(fg.hour_ts >= current_hour).read()
-    return df
+    return query_feature_group(
+        config.FEATURE_GROUP_MODEL_PREDICTION,
+        start=current_hour,
+        stations=stations,
+        columns=columns,
+    )
 
-def fetch_hourly_rides(hours: int) -> pd.DataFrame:
+def fetch_hourly_rides(hours: int, stations=None, columns=None) -> pd.DataFrame:
     current_hour = (pd.Timestamp.now(tz="Etc/UTC") - timedelta(hours=hours)).floor("h")
 
-    fs = get_feature_store()
-    fg = fs.get_feature_group(name=config.FEATURE_GROUP_NAME, version=1)
-
-    query = fg.select_all()
-    query = query.filter(fg.hour_ts >= current_hour)
-
-    return query.read()
+    return query_feature_group(
+        config.FEATURE_GROUP_NAME,
+        start=current_hour,
+        stations=stations,
+        columns=columns,
+    )
 
 # ===============================
 # ✨ Model Check
@@ -165,12 +250,9 @@ def fetch_hourly_rides(hours: int) -> pd.DataFrame:
 
 def assert_model_trained_for_8_hours():
     try:
-        project = get_hopsworks_project()
-        model_registry = project.get_model_registry()
-        models = model_registry.get_models(name=config.MODEL_NAME)
-        model = max(models, key=lambda model: model.version)
+        model = get_backend().latest_model(config.MODEL_NAME)
 
-        target_gap = model.training_metrics.get('target_gap_hours', 8)
+        target_gap = model.metrics.get('target_gap_hours', 8)
         assert target_gap == 8, "⚠️ Model not trained for 8-hour ahead forecasting!"
         print(f"✅ Confirmed model is trained for {target_gap}-hour prediction.")
     except Exception as e:
@@ -182,15 +264,12 @@ def load_metrics_from_registry() -> dict:
     If no model is found, return a very high MAE by default.
     """
     try:
-        project = get_hopsworks_project()
-        model_registry = project.get_model_registry()
-        models = model_registry.get_models(name=config.MODEL_NAME)
+        latest_model = get_backend().latest_model(config.MODEL_NAME)
 
-        if not models:
+        if latest_model is None:
             print("⚠️ No previous model found. Returning default high MAE.")
             return {"test_mae": float("inf")}
 
-        latest_model = max(models, key=lambda model: model.version)
         return latest_model.metrics
 
     except Exception as e:
@@ -1,86 +1,197 @@
+import os
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from pathlib import Path
 from collections import Counter
 
+from src.ingest_manifest import IngestManifest, stat_fingerprint
+from src.parallel_util import atomic_output_path, run_monthly_tasks
+from src.rides_dataset import VALIDATED_TRIP_COLUMNS, write_partitioned_month
+from src.trip_schema import CATEGORICAL_COLUMNS, TIMESTAMP_COLUMNS, to_compact_trip_frame
+
+def count_start_stations(parquet_file: Path) -> dict:
+    """
+    Count rides per ``start_station_id`` in one monthly file.
+
+    The count runs inside Arrow on the (dictionary-encoded) column, so only
+    the few thousand distinct station ids ever become Python objects.
+    """
+    column = pq.read_table(parquet_file, columns=["start_station_id"]).column("start_station_id")
+    value_counts = pc.value_counts(column)
+
+    station_ids = value_counts.field("values")
+    if pa.types.is_dictionary(station_ids.type):
+        station_ids = station_ids.cast(pa.string())
+
+    return {
+        station_id: count
+        for station_id, count in zip(station_ids.to_pylist(), value_counts.field("counts").to_pylist())
+        if station_id is not None
+    }
+
+def month_output_files(output_path: Path, month_key: str, layout: str = "flat") -> list:
+    """Files that hold one validated month in the given output layout."""
+    if layout == "partitioned":
+        return sorted(output_path.glob(f"year=*/month=*/station_bucket=*/part-{month_key}.parquet"))
+    return [output_path / f"{month_key}.parquet"]
+
+def clean_month_file(parquet_file: Path, output_path: Path, top_station_ids: list, layout: str = "flat"):
+    """
+    Filter one monthly file down to the top stations, clean it, and write it
+    under ``output_path``. Returns the number of rows kept (None if unreadable).
+
+    ``layout="flat"`` writes ``rides_YYYY_MM.parquet``; ``"partitioned"``
+    writes a hive year/month/station_bucket layout (see ``src.rides_dataset``).
+
+    The station filter is pushed into the Parquet read: row groups whose
+    statistics exclude every top station are skipped, and non-matching rows
+    are dropped in Arrow before any pandas conversion.
+    """
+    print(f"\n🔄 Processing: {parquet_file.name}")
+
+    try:
+        # Read only important columns first to filter down
+        df = pd.read_parquet(
+            parquet_file,
+            columns=VALIDATED_TRIP_COLUMNS,
+            filters=[("start_station_id", "in", list(top_station_ids))],
+        )
+    except Exception as e:
+        print(f"⚠️ Failed to read {parquet_file.name}: {e}")
+        return None
+
+    # Files written before TRIP_SCHEMA existed still carry object/float64 columns
+    df = to_compact_trip_frame(df)
+
+    if df.empty:
+        print(f"🚫 No top stations found in {parquet_file.name}")
+        return 0
+
+    for col in TIMESTAMP_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+            df[col] = (
+                df[col]
+                .dt.tz_localize("UTC", ambiguous="NaT", nonexistent="NaT")
+                .dt.tz_convert("America/New_York")
+            )
+
+    if {"started_at", "ended_at"}.issubset(df.columns):
+        df["duration_min"] = (df["ended_at"] - df["started_at"]).dt.total_seconds() / 60.0
+
+    if "duration_min" in df.columns:
+        df = df[(df["duration_min"] >= 1) & (df["duration_min"] <= 240)]
+
+    drop_cols = ["start_station_id", "end_station_id", "end_lat", "end_lng"]
+    if set(drop_cols).issubset(df.columns):
+        df = df.dropna(subset=drop_cols)
+
+    if {"start_lat", "start_lng"}.issubset(df.columns):
+        df = df[
+            df["start_lat"].between(40.4774, 40.9176)
+          & df["start_lng"].between(-74.2591, -73.7004)
+        ]
+
+    if "started_at" in df.columns:
+        df = df.sort_values("started_at")
+
+    # Drop the thousands of stations filtered out above from the dictionaries
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].cat.remove_unused_categories()
+
+    if layout == "partitioned":
+        written = write_partitioned_month(df, output_path, parquet_file.stem)
+        print(f"✅ Cleaned and saved: {len(written)} partitions under {output_path} ({len(df)} rows after filtering)")
+        return len(df)
+
+    output_file = output_path / parquet_file.name
+    with atomic_output_path(output_file) as tmp_file:
+        df.to_parquet(tmp_file, index=False)
+    print(f"✅ Cleaned and saved: {output_file} ({len(df)} rows after filtering)")
+    return len(df)
+
 def validate_and_save_citibike_data(
     input_dir: str = "C:/Users/MD/Desktop/citi/data/processed/monthly",
-    output_dir: str = "C:/Users/MD/Desktop/citi/data/processed/validated"
+    output_dir: str = "C:/Users/MD/Desktop/citi/data/processed/validated",
+    max_workers: int = 1,
+    memory_limit_mb: int = None,
+    incremental: bool = False,
+    top_n: int = 5,
+    layout: str = "flat",
 ):
+    """
+    Keep the ``top_n`` busiest start stations, clean every monthly file, and save it.
+
+    Months are validated independently, so ``max_workers > 1`` runs them on
+    a process pool with ``memory_limit_mb`` as the per-worker cap. With
+    ``incremental=True`` per-file station counts and cleaned outputs are
+    reused from the ingest manifest unless their input changed.
+
+    ``layout="partitioned"`` writes a year/month/station_bucket hive layout
+    with ``started_at``-sorted row groups instead of one flat file per month;
+    read it back with ``src.rides_dataset.read_validated_rides``.
+    """
+    if layout not in ("flat", "partitioned"):
+        raise ValueError(f"Unknown layout '{layout}', expected 'flat' or 'partitioned'.")
+
     input_path = Path(input_dir)
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
 
+    manifest = IngestManifest.for_directory(output_path) if incremental else None
+    parquet_files = sorted(input_path.glob("rides_20*.parquet"))
+
     station_counter = Counter()
 
-    print("🔍 Scanning all files to find top 5 busiest start_station_ids...")
+    print(f"🔍 Scanning all files to find top {top_n} busiest start_station_ids...")
+
+    for parquet_file in parquet_files:
+        source = stat_fingerprint([parquet_file])
+        counts = manifest.cached_value("station_counts", parquet_file.name, source) if manifest is not None else None
 
-    for parquet_file in sorted(input_path.glob("rides_20*.parquet")):
-        try:
-            df = pd.read_parquet(parquet_file, columns=["start_station_id"])
-            station_counter.update(df["start_station_id"].dropna().tolist())
-        except Exception as e:
-            print(f"⚠️ Skipped {parquet_file.name}: {e}")
+        if counts is None:
+            try:
+                counts = count_start_stations(parquet_file)
+            except Exception as e:
+                print(f"⚠️ Skipped {parquet_file.name}: {e}")
+                continue
+            if manifest is not None:
+                manifest.store_value("station_counts", parquet_file.name, counts, source=source)
+
+        station_counter.update(counts)
 
     if not station_counter:
         print("🚫 No valid data found to compute top stations!")
         return
 
-    top5_station_ids = [station_id for station_id, _ in station_counter.most_common(5)]
-    print(f"✅ Top 5 Station IDs: {top5_station_ids}")
-
-    for parquet_file in sorted(input_path.glob("rides_20*.parquet")):
-        print(f"\n🔄 Processing: {parquet_file.name}")
-
-        try:
-            # Read only important columns first to filter down
-            important_cols = [
-                "start_station_id", "start_station_name", "start_lat", "start_lng",
-                "end_station_id", "end_station_name", "end_lat", "end_lng",
-                "started_at", "ended_at"
-            ]
-            df = pd.read_parquet(parquet_file, columns=important_cols)
-        except Exception as e:
-            print(f"⚠️ Failed to read {parquet_file.name}: {e}")
-            continue
+    top_station_ids = [station_id for station_id, _ in station_counter.most_common(top_n)]
+    print(f"✅ Top {top_n} Station IDs: {top_station_ids}")
 
-        # Small dataframe after reading only necessary columns
-        df = df[df["start_station_id"].isin(top5_station_ids)]
+    tasks = {}
+    sources = {}
+    for parquet_file in parquet_files:
+        key = parquet_file.stem
+        # The cleaned month depends on its input file, the stations that made the cut and the layout
+        sources[key] = f"{stat_fingerprint([parquet_file])}:{','.join(top_station_ids)}:{layout}"
 
-        if df.empty:
-            print(f"🚫 No top 5 stations found in {parquet_file.name}")
+        if manifest is not None and manifest.is_current("validate", key, month_output_files(output_path, key, layout), source=sources[key]):
+            print(f"⏭️ {parquet_file.name} unchanged since last run")
             continue
 
-        for col in ("started_at", "ended_at"):
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col], errors="coerce")
-                df[col] = (
-                    df[col]
-                    .dt.tz_localize("UTC", ambiguous="NaT", nonexistent="NaT")
-                    .dt.tz_convert("America/New_York")
-                )
-
-        if {"started_at", "ended_at"}.issubset(df.columns):
-            df["duration_min"] = (df["ended_at"] - df["started_at"]).dt.total_seconds() / 60.0
-
-        if "duration_min" in df.columns:
-            df = df[(df["duration_min"] >= 1) & (df["duration_min"] <= 240)]
-
-        drop_cols = ["start_station_id", "end_station_id", "end_lat", "end_lng"]
-        if set(drop_cols).issubset(df.columns):
-            df = df.dropna(subset=drop_cols)
+        tasks[key] = (parquet_file, output_path, top_station_ids, layout)
 
-        if {"start_lat", "start_lng"}.issubset(df.columns):
-            df = df[
-                df["start_lat"].between(40.4774, 40.9176)
-              & df["start_lng"].between(-74.2591, -73.7004)
-            ]
+    report = run_monthly_tasks(clean_month_file, tasks, max_workers=max_workers, memory_limit_mb=memory_limit_mb)
 
-        if "started_at" in df.columns:
-            df = df.sort_values("started_at")
+    if manifest is not None:
+        for key, outcome in report.items():
+            if outcome["result"]:
+                manifest.record("validate", key, month_output_files(output_path, key, layout), rows=outcome["result"], source=sources[key])
+        manifest.save()
 
-        output_file = output_path / parquet_file.name
-        df.to_parquet(output_file, index=False)
-        print(f"✅ Cleaned and saved: {output_file} ({len(df)} rows after filtering)")
+    return report
 
 if __name__ == "__main__":
-    validate_and_save_citibike_data()
+    validate_and_save_citibike_data(max_workers=os.cpu_count(), incremental=True)
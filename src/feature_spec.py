@@ -0,0 +1,168 @@
+# src/feature_spec.py (FOR CITI BIKE PROJECT)
+
+import json
+import re
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import pandas as pd
+
+from src.calendar_features import CALENDAR_FEATURES, add_calendar_features
+from src.lag_features import add_lag_features
+from src.parallel_util import atomic_output_path
+
+FEATURE_SPEC_SUFFIX = ".features.json"
+
+# ==============================
+# 📐 Feature Spec
+# ==============================
+
+@dataclass(frozen=True)
+class FeatureSpec:
+    """
+    Versioned description of the model's inputs.
+
+    Offline feature building, training and inference all derive their
+    columns from one spec, and the spec is saved next to the model, so the
+    features served are always the features trained on.
+    """
+
+    version: int = 1
+    lags: tuple = (1, 2, 3, 24, 48, 168, 336, 672)
+    rolling_windows: tuple = (3,)
+    calendar_features: tuple = (
+        "hour", "hour_sin", "hour_cos", "day_of_week", "is_holiday_or_weekend",
+        "month", "is_peak_hour", "day_of_year",
+    )
+    extra_features: tuple = ()
+    horizon: int = 8
+    station_col: str = "start_station_id"
+    time_col: str = "hour_ts"
+    count_col: str = "ride_count"
+    target_col: str = "target_ride_count"
+
+    def __post_init__(self):
+        # Normalize so specs built from lists or JSON compare (and hash) equal
+        object.__setattr__(self, "lags", tuple(sorted(set(int(lag) for lag in self.lags))))
+        object.__setattr__(self, "rolling_windows", tuple(sorted(set(int(w) for w in self.rolling_windows))))
+        object.__setattr__(self, "calendar_features", tuple(self.calendar_features))
+        object.__setattr__(self, "extra_features", tuple(self.extra_features))
+
+        unknown = set(self.calendar_features) - set(CALENDAR_FEATURES)
+        if unknown:
+            raise ValueError(f"Unknown calendar features in spec: {sorted(unknown)}")
+
+    # ---------- columns ----------
+
+    @property
+    def max_lag(self) -> int:
+        """Hours of history needed before the first usable row."""
+        return max(self.lags + self.rolling_windows)
+
+    @property
+    def lag_columns(self) -> list:
+        return [f"{self.count_col}_lag_{lag}" for lag in self.lags]
+
+    @property
+    def rolling_columns(self) -> list:
+        return [f"{self.count_col}_roll{window}" for window in self.rolling_windows]
+
+    def feature_columns(self) -> list:
+        """Model input columns, in training order."""
+        return list(self.calendar_features) + self.rolling_columns + self.lag_columns + list(self.extra_features)
+
+    # ---------- building ----------
+
+    def build_features(self, df: pd.DataFrame, extra_calendar: list = None) -> pd.DataFrame:
+        """
+        Add this spec's lag, rolling and calendar features (and the target,
+        if missing) to per-station hourly counts. ``extra_calendar`` adds
+        descriptive calendar columns that are not model inputs.
+        """
+        df = add_lag_features(
+            df,
+            lags=self.lags,
+            station_col=self.station_col,
+            time_col=self.time_col,
+            count_col=self.count_col,
+            target_col=self.target_col,
+            horizon=self.horizon,
+            rolling_windows=self.rolling_windows,
+        )
+        calendar_columns = list(dict.fromkeys(list(self.calendar_features) + list(extra_calendar or [])))
+        return add_calendar_features(df, time_col=self.time_col, columns=calendar_columns)
+
+    def select_features(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Exactly this spec's feature columns from ``df``, computing calendar
+        features that are missing. Raises ``KeyError`` for other missing columns.
+        """
+        missing_calendar = [col for col in self.calendar_features if col not in df.columns]
+        if missing_calendar:
+            df = add_calendar_features(df, time_col=self.time_col, columns=missing_calendar)
+
+        columns = self.feature_columns()
+        missing = [col for col in columns if col not in df.columns]
+        if missing:
+            raise KeyError(f"Missing {len(missing)} feature columns for spec v{self.version}: {missing[:5]}...")
+        return df[columns]
+
+    # ---------- persistence ----------
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FeatureSpec":
+        return cls(**data)
+
+    @classmethod
+    def from_columns(cls, columns, version: int = 0, **overrides) -> "FeatureSpec":
+        """
+        Reverse-engineer a spec from a fitted model's input columns (e.g. a
+        legacy pickle without a saved spec). Columns that are not lags,
+        rolling means or calendar features are kept as ``extra_features``.
+        """
+        count_col = overrides.get("count_col", cls.count_col)
+        lag_pattern = re.compile(rf"^{re.escape(count_col)}_lag_(\d+)$")
+        roll_pattern = re.compile(rf"^{re.escape(count_col)}_roll(\d+)$")
+
+        lags, rolling_windows, calendar, extra = [], [], [], []
+        for col in columns:
+            if lag_pattern.match(col):
+                lags.append(int(lag_pattern.match(col).group(1)))
+            elif roll_pattern.match(col):
+                rolling_windows.append(int(roll_pattern.match(col).group(1)))
+            elif col in CALENDAR_FEATURES:
+                calendar.append(col)
+            else:
+                extra.append(col)
+
+        return cls(
+            version=version,
+            lags=tuple(lags),
+            rolling_windows=tuple(rolling_windows),
+            calendar_features=tuple(calendar),
+            extra_features=tuple(extra),
+            **overrides,
+        )
+
+    def save(self, path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_output_path(path) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f, indent=2)
+        return path
+
+    @classmethod
+    def load(cls, path) -> "FeatureSpec":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+DEFAULT_FEATURE_SPEC = FeatureSpec()
+
+def spec_path_for(model_path) -> Path:
+    """Where the feature spec of ``model_path`` lives (``<model>.features.json``)."""
+    model_path = Path(model_path)
+    return model_path.with_name(model_path.stem + FEATURE_SPEC_SUFFIX)
@@ -0,0 +1,195 @@
+# src/feature_view_cache.py (FOR CITI BIKE PROJECT)
+
+import json
+import shutil
+import uuid
+from pathlib import Path
+
+import pandas as pd
+
+from src.parallel_util import atomic_output_path
+
+FEATURE_VIEW_CACHE_DIR = Path(__file__).resolve().parent.parent / "data" / "feature_view_cache"
+CACHE_STATE_FILE_NAME = "_cache_state.json"
+MAX_CACHE_PARTS = 48  # loose fetch parts allowed before they are merged into monthly parts
+
+# ==============================
+# 🕒 Time Ranges
+# ==============================
+
+def _utc(value) -> pd.Timestamp:
+    """``value`` as a UTC Timestamp (naive values are taken as UTC), or None."""
+    if value is None:
+        return None
+    value = pd.Timestamp(value)
+    return value.tz_localize("UTC") if value.tzinfo is None else value.tz_convert("UTC")
+
+def _time_mask(hour_ts: pd.Series, start: pd.Timestamp = None, end: pd.Timestamp = None):
+    """Boolean array selecting ``start <= hour_ts < end`` (either bound optional)."""
+    times = pd.to_datetime(hour_ts, utc=True)
+    mask = pd.Series(True, index=hour_ts.index)
+    if start is not None:
+        mask &= times >= start
+    if end is not None:
+        mask &= times < end
+    return mask.to_numpy()
+
+# ==============================
+# ⚡ Read-Through Cache
+# ==============================
+
+class CachedFeatureView:
+    """
+    Read-through cache in front of a feature view's ``get_batch_data``.
+
+    Fetched rows are kept as Parquet parts under ``cache_dir``, and
+    ``_cache_state.json`` records the contiguous range they cover: from
+    ``covered_from`` (or the start of the view) up to the ``hour_ts``
+    high-water mark. A read fetches only what lies outside that range (the
+    tail after the high-water mark and, if asked for, history before
+    ``covered_from``) and answers the rest from local parts.
+
+    ``feature_view`` may be a zero-argument callable returning one; it is
+    called on the first fetch only, so reads the cache fully covers never
+    log in. Cached hours are assumed complete, since hours are inserted
+    whole; ``clear()`` drops everything.
+    """
+
+    def __init__(self, feature_view, cache_dir=FEATURE_VIEW_CACHE_DIR, time_col: str = "hour_ts"):
+        self._feature_view = feature_view
+        self.cache_dir = Path(cache_dir)
+        self.time_col = time_col
+
+    @property
+    def feature_view(self):
+        if not hasattr(self._feature_view, "get_batch_data"):
+            self._feature_view = self._feature_view()
+        return self._feature_view
+
+    # ---------- state ----------
+
+    def _load_state(self) -> dict:
+        state_file = self.cache_dir / CACHE_STATE_FILE_NAME
+        if not state_file.exists():
+            return {"covered_from": None, "head_complete": False, "high_water": None, "parts": []}
+        with open(state_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_state(self, state: dict):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with atomic_output_path(self.cache_dir / CACHE_STATE_FILE_NAME) as tmp_file:
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(state, f, indent=2)
+
+    def high_water_mark(self) -> pd.Timestamp:
+        """Latest cached ``hour_ts`` (UTC), or None for an empty cache."""
+        return _utc(self._load_state()["high_water"])
+
+    def clear(self):
+        if self.cache_dir.exists():
+            shutil.rmtree(self.cache_dir)
+
+    # ---------- fetch & store ----------
+
+    def _fetch(self, state: dict, start: pd.Timestamp, end: pd.Timestamp, after: pd.Timestamp = None) -> int:
+        """Fetch ``[start, end)`` (rows after ``after`` only) and store it as a new part."""
+        bounds = {"start_time": start, "end_time": end}
+        df = self.feature_view.get_batch_data(**{k: v for k, v in bounds.items() if v is not None})
+        if df.empty:
+            return 0
+
+        mask = _time_mask(df[self.time_col], start, end)
+        if after is not None:
+            mask &= (pd.to_datetime(df[self.time_col], utc=True) > after).to_numpy()
+        df = df[mask]
+        if df.empty:
+            return 0
+
+        self._write_part(state, df)
+        return len(df)
+
+    def _write_part(self, state: dict, df: pd.DataFrame, month: str = None):
+        times = pd.to_datetime(df[self.time_col], utc=True)
+        part_name = f"part-{uuid.uuid4().hex}.parquet"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with atomic_output_path(self.cache_dir / part_name) as tmp_file:
+            df.to_parquet(tmp_file, index=False)
+
+        state["parts"].append({
+            "file": part_name,
+            "min": str(times.min()),
+            "max": str(times.max()),
+            "rows": len(df),
+            "month": month,
+        })
+        high_water = _utc(state["high_water"])
+        if high_water is None or times.max() > high_water:
+            state["high_water"] = str(times.max())
+
+    def _compact(self, state: dict):
+        """Merge the loose fetch parts into one part per month of ``hour_ts``."""
+        loose = [part for part in state["parts"] if part.get("month") is None]
+        touched = set()
+        for part in loose:
+            touched.update(str(month) for month in pd.period_range(
+                _utc(part["min"]).tz_localize(None), _utc(part["max"]).tz_localize(None), freq="M"
+            ))
+
+        # Monthly parts of the touched months are rewritten with the loose rows
+        rewrite = loose + [part for part in state["parts"] if part.get("month") in touched]
+        old_parts = [part["file"] for part in rewrite]
+        df = pd.concat([pd.read_parquet(self.cache_dir / name) for name in old_parts], ignore_index=True)
+
+        state["parts"] = [part for part in state["parts"] if part not in rewrite]
+        months = pd.to_datetime(df[self.time_col], utc=True).dt.strftime("%Y-%m")
+        for month, index in df.groupby(months.to_numpy(), sort=True).groups.items():
+            self._write_part(state, df.loc[index], month=month)
+
+        self._save_state(state)
+        for name in old_parts:
+            (self.cache_dir / name).unlink(missing_ok=True)
+        print(f"🗜 Compacted {len(old_parts)} cache parts into {len(state['parts'])}")
+
+    # ---------- read ----------
+
+    def get_batch_data(self, start_time=None, end_time=None) -> pd.DataFrame:
+        """Rows with ``start_time <= hour_ts < end_time``, fetching only what is not cached."""
+        start, end = _utc(start_time), _utc(end_time)
+        state = self._load_state()
+        high_water = _utc(state["high_water"])
+        fetched = 0
+
+        if high_water is None:
+            fetched += self._fetch(state, start, end)
+            state["covered_from"] = str(start) if start is not None else None
+            state["head_complete"] = start is None
+        else:
+            covered_from = _utc(state["covered_from"])
+            if not state["head_complete"] and (start is None or start < covered_from):
+                print(f"🌐 Fetching history before {covered_from}...")
+                fetched += self._fetch(state, start, covered_from)
+                state["covered_from"] = str(start) if start is not None else None
+                state["head_complete"] = start is None
+
+            if end is None or end > high_water:
+                # Only the missing tail; the high-water hour itself is already cached
+                print(f"🌐 Fetching rows after high-water mark {high_water}...")
+                fetched += self._fetch(state, high_water, end, after=high_water)
+
+        if state["parts"]:
+            self._save_state(state)
+            if sum(part.get("month") is None for part in state["parts"]) > MAX_CACHE_PARTS:
+                self._compact(state)
+
+        # Answer from local parts, reading only those overlapping the range
+        parts = [
+            part for part in sorted(state["parts"], key=lambda part: part["min"])
+            if (start is None or _utc(part["max"]) >= start) and (end is None or _utc(part["min"]) < end)
+        ]
+        if not parts:
+            return pd.DataFrame()
+
+        df = pd.concat([pd.read_parquet(self.cache_dir / part["file"]) for part in parts], ignore_index=True)
+        df = df[_time_mask(df[self.time_col], start, end)].reset_index(drop=True)
+        print(f"⚡ {len(df)} rows from the feature view cache ({fetched} fetched)")
+        return df
@@ -3,38 +3,215 @@
 import requests
 import zipfile
 import pandas as pd
+import os
 import re
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from src.ingest_manifest import IngestManifest, schema_fingerprint, stat_fingerprint
+from src.parallel_util import atomic_output_path, run_monthly_tasks
+from src.trip_schema import CSV_DTYPES, TRIP_SCHEMA, trip_chunk_to_table
+
+BASE_URL = "https://s3.amazonaws.com/tripdata"
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MiB per write keeps RSS flat regardless of archive size
 
 # === Part 1: Download and Unzip ===
 
-def download_and_unzip_citibike_files(file_names: list, raw_dir="C:/Users/MD/Desktop/citi/data/raw", unzip_dir="C:/Users/MD/Desktop/citi/data/unzipped"):
+def make_download_session(pool_size: int = 8, retries: int = 3) -> requests.Session:
     """
-    Download Citi Bike tripdata zip files and extract them to a folder.
+    Build one pooled HTTP session shared by all download threads.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=1.0,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def download_citibike_file(
+    session: requests.Session,
+    url: str,
+    zip_file_path: Path,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    max_attempts: int = 3,
+    timeout: int = 30,
+    etag: str = None,
+) -> Path:
     """
-    base_url = "https://s3.amazonaws.com/tripdata"
+    Stream a single tripdata zip to disk.
+
+    Bytes go to ``<name>.part`` first and the file is renamed only once it is
+    complete, so an interrupted download is picked up again with an HTTP
+    Range request instead of starting from zero. When ``etag`` is known the
+    resume is sent with ``If-Range`` so a republished archive is fetched in
+    full rather than spliced onto stale bytes.
+    """
+    zip_file_path = Path(zip_file_path)
+    part_path = zip_file_path.with_name(zip_file_path.name + ".part")
+
+    for attempt in range(1, max_attempts + 1):
+        resume_from = part_path.stat().st_size if part_path.exists() else 0
+        headers = {"Range": f"bytes={resume_from}-"} if resume_from else {}
+        if resume_from and etag:
+            headers["If-Range"] = etag
+
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 416:
+                    # Range starts at/after the end: the partial file may already be complete
+                    total = response.headers.get("Content-Range", "").rpartition("/")[2]
+                    if total.isdigit() and int(total) == resume_from:
+                        part_path.replace(zip_file_path)
+                        return zip_file_path
+                    part_path.unlink()
+                    continue
+
+                response.raise_for_status()
+
+                if resume_from and response.status_code != 206:
+                    # Server ignored the Range header and is sending the whole file
+                    resume_from = 0
+
+                expected = response.headers.get("Content-Length")
+                expected = resume_from + int(expected) if expected is not None else None
+
+                with open(part_path, "ab" if resume_from else "wb") as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+
+            written = part_path.stat().st_size
+            if expected is not None and written != expected:
+                raise IOError(f"incomplete download ({written} of {expected} bytes)")
+
+            part_path.replace(zip_file_path)
+            return zip_file_path
+
+        except requests.HTTPError:
+            # Status errors (404 for a month not yet published, ...) won't fix themselves
+            raise
+        except (requests.RequestException, IOError) as e:
+            if attempt == max_attempts:
+                raise
+            print(f"⚠️ Retrying {zip_file_path.name} (attempt {attempt + 1}/{max_attempts}) after: {e}")
+
+    raise IOError(f"Could not download {url}")
+
+def remote_etag(session: requests.Session, url: str, timeout: int = 30):
+    """Return the ETag the bucket reports for ``url`` (None if unavailable)."""
+    try:
+        response = session.head(url, timeout=timeout, allow_redirects=True)
+        response.raise_for_status()
+    except requests.RequestException:
+        return None
+    return response.headers.get("ETag")
+
+def download_citibike_files(
+    file_names: list,
+    raw_dir="C:/Users/MD/Desktop/citi/data/raw",
+    base_url: str = BASE_URL,
+    max_workers: int = 4,
+    overwrite: bool = False,
+    incremental: bool = False,
+) -> dict:
+    """
+    Download several monthly zip files concurrently on a bounded thread pool.
+
+    Returns a mapping of file name -> local path for every file that is
+    available on disk afterwards. ``base_url`` can point at any HTTP server
+    laid out like the S3 tripdata bucket (e.g. a local test server).
 
+    With ``incremental=True`` each archive's ETag is compared with the one
+    recorded in ``raw_dir``'s ingest manifest, and only new, republished or
+    damaged archives are fetched again. The HEAD request for the ETag runs
+    in the same pooled task as the download, so the checks overlap too.
+    """
     raw_path = Path(raw_dir)
-    unzip_path = Path(unzip_dir)
     raw_path.mkdir(parents=True, exist_ok=True)
-    unzip_path.mkdir(parents=True, exist_ok=True)
+    manifest = IngestManifest.for_directory(raw_path) if incremental else None
 
-    for file_name in file_names:
-        url = f"{base_url}/{file_name}"
+    downloaded = {}
+
+    def fetch(session: requests.Session, file_name: str):
+        """``(path, etag, fetched)`` for one archive; ``fetched`` is False if it was unchanged."""
+        url = f"{base_url.rstrip('/')}/{file_name}"
         zip_file_path = raw_path / file_name
 
+        etag = None
+        if manifest is not None:
+            etag = remote_etag(session, url)
+            entry = manifest.entry("download", file_name)
+            if etag is None and entry is not None:
+                etag = entry["source"]  # bucket unreachable: trust the recorded copy if intact
+            if manifest.is_current("download", file_name, zip_file_path, source=etag):
+                print(f"⏭️ Unchanged since last run: {zip_file_path}")
+                return zip_file_path, etag, False
+
         print(f"🔵 Downloading: {url}")
+        return download_citibike_file(session, url, zip_file_path, etag=etag), etag, True
 
-        try:
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
+    pending = []
+    for file_name in file_names:
+        zip_file_path = raw_path / file_name
+        if manifest is None and zip_file_path.exists() and not overwrite:
+            print(f"⏭️ Already downloaded: {zip_file_path}")
+            downloaded[file_name] = zip_file_path
+        else:
+            pending.append(file_name)
+
+    if pending:
+        with make_download_session(pool_size=max_workers) as session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(fetch, session, file_name): file_name for file_name in pending}
 
-            with open(zip_file_path, "wb") as f:
-                f.write(response.content)
+            for future in as_completed(futures):
+                file_name = futures[future]
+                try:
+                    zip_file_path, etag, fetched = future.result()
+                except Exception as e:
+                    print(f"❌ Failed to download {file_name}. Error: {e}")
+                    continue
 
-            print(f"✅ Downloaded: {zip_file_path}")
+                downloaded[file_name] = zip_file_path
+                if fetched:
+                    print(f"✅ Downloaded: {zip_file_path}")
+                    if manifest is not None:
+                        manifest.record("download", file_name, zip_file_path, source=etag, etag=etag)
 
-            # === Unzip
+    if manifest is not None:
+        manifest.save()
+
+    return downloaded
+
+def download_and_unzip_citibike_files(
+    file_names: list,
+    raw_dir="C:/Users/MD/Desktop/citi/data/raw",
+    unzip_dir="C:/Users/MD/Desktop/citi/data/unzipped",
+    base_url: str = BASE_URL,
+    max_workers: int = 4,
+):
+    """
+    Download Citi Bike tripdata zip files and extract them to a folder.
+    """
+    unzip_path = Path(unzip_dir)
+    unzip_path.mkdir(parents=True, exist_ok=True)
+
+    downloaded = download_citibike_files(file_names, raw_dir=raw_dir, base_url=base_url, max_workers=max_workers)
+
+    for file_name in file_names:
+        if file_name not in downloaded:
+            continue
+
+        zip_file_path = downloaded[file_name]
+        try:
             print(f"🔵 Unzipping: {zip_file_path}")
             with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
                 zip_ref.extractall(unzip_path)
@@ -46,9 +223,124 @@ def download_and_unzip_citibike_files(file_names: list, raw_dir="C:/Users/MD/Des
 
 # === Part 2: Chunk Read and Save Monthly Parquet ===
 
-def save_monthly_files_with_chunks(unzip_dir="C:/Users/MD/Desktop/citi/data/unzipped", output_dir="C:/Users/MD/Desktop/citi/data/processed/monthly", chunk_size=500_000):
+MONTH_PATTERN = re.compile(r"(20\d{2})(\d{2})")
+
+def _month_key(name: str):
+    """Return the ``YYYY_MM`` key encoded in a tripdata file name, or None."""
+    match = MONTH_PATTERN.search(name)
+    if match:
+        year, month = match.groups()
+        return f"{year}_{month}"
+    return None
+
+def _write_csv_chunks_to_parquet(csv_sources: list, output_file: Path, chunk_size: int) -> int:
+    """
+    Stream CSV sources into one Parquet file, one row group per chunk.
+
+    ``csv_sources`` is a list of ``(label, open_fn)`` pairs where ``open_fn``
+    returns a readable binary file object. Only a single chunk is held in
+    memory at any time, and the file only appears under its final name once
+    it is complete. Every chunk is written with the compact ``TRIP_SCHEMA``
+    (dictionary-encoded text, float32 coordinates, epoch-ms timestamps).
+    Returns the number of rows written.
+
+    A source that fails to read fails the whole month: the temporary file
+    is discarded, so a partial month is never saved (or recorded as done).
+    """
+    writer = None
+    rows = 0
+
+    with atomic_output_path(output_file) as tmp_file:
+        try:
+            for label, open_fn in csv_sources:
+                try:
+                    print(f"  🔄 Reading: {label}")
+                    with open_fn() as fh:
+                        for chunk in pd.read_csv(fh, dtype=CSV_DTYPES, chunksize=chunk_size):
+                            if writer is None:
+                                writer = pq.ParquetWriter(tmp_file, TRIP_SCHEMA)
+                            writer.write_table(trip_chunk_to_table(chunk))
+                            rows += len(chunk)
+                except Exception as e:
+                    print(f"❌ Failed to read {label}: {e}")
+                    raise
+        finally:
+            if writer is not None:
+                writer.close()
+
+    return rows
+
+@contextmanager
+def _open_zip_member(zip_file_path: Path, member: str):
+    """Yield a decompressing stream over one member of a zip archive."""
+    with zipfile.ZipFile(zip_file_path, "r") as zip_ref, zip_ref.open(member) as fh:
+        yield fh
+
+def convert_month_from_csvs(file_list: list, output_file: Path, chunk_size: int) -> int:
+    """Write one month of extracted CSV files to ``output_file``."""
+    sources = [(file.name, lambda file=file: open(file, "rb")) for file in sorted(file_list)]
+    return _write_csv_chunks_to_parquet(sources, output_file, chunk_size)
+
+def convert_month_from_zips(member_list: list, output_file: Path, chunk_size: int) -> int:
+    """Write one month of ``(zip_path, member)`` CSV members to ``output_file``."""
+    sources = [
+        (f"{zip_file_path.name}:{member}", lambda zip_file_path=zip_file_path, member=member: _open_zip_member(zip_file_path, member))
+        for zip_file_path, member in sorted(member_list)
+    ]
+    return _write_csv_chunks_to_parquet(sources, output_file, chunk_size)
+
+def _run_monthly_conversion(convert_fn, monthly_inputs: dict, output_path: Path, chunk_size: int,
+                            max_workers: int, memory_limit_mb: int, incremental: bool = False) -> dict:
+    """Fan the per-month conversions out and print a summary line per month."""
+    manifest = IngestManifest.for_directory(output_path) if incremental else None
+    schema = schema_fingerprint(TRIP_SCHEMA)
+
+    tasks = {}
+    sources = {}
+    for key, inputs in sorted(monthly_inputs.items()):
+        output_file = output_path / f"rides_{key}.parquet"
+        # inputs are CSV paths or (zip_path, member) pairs
+        sources[key] = stat_fingerprint({item[0] if isinstance(item, tuple) else item for item in inputs})
+
+        if manifest is not None and manifest.is_current("convert", key, output_file, source=sources[key], schema=schema):
+            print(f"⏭️ Month {key} unchanged since last run")
+            continue
+
+        print(f"\n📦 Processing month: {key} with {len(inputs)} files")
+        tasks[key] = (inputs, output_file, chunk_size)
+
+    report = run_monthly_tasks(convert_fn, tasks, max_workers=max_workers, memory_limit_mb=memory_limit_mb)
+
+    for key, outcome in report.items():
+        output_file = output_path / f"rides_{key}.parquet"
+        if outcome["error"]:
+            continue
+        if outcome["result"]:
+            print(f"✅ Saved: {output_file} with {outcome['result']} rows ({outcome['seconds']:.1f}s)")
+            if manifest is not None:
+                manifest.record("convert", key, output_file, rows=outcome["result"], source=sources[key], schema=schema)
+        else:
+            print(f"🚫 No valid data for {key}")
+
+    if manifest is not None:
+        manifest.save()
+
+    return report
+
+def save_monthly_files_with_chunks(
+    unzip_dir="C:/Users/MD/Desktop/citi/data/unzipped",
+    output_dir="C:/Users/MD/Desktop/citi/data/processed/monthly",
+    chunk_size=500_000,
+    max_workers: int = 1,
+    memory_limit_mb: int = None,
+    incremental: bool = False,
+):
     """
     Read extracted CSV files, group by month, and save each month as a single .parquet file.
+
+    Months are independent, so ``max_workers > 1`` converts them on a process
+    pool; ``memory_limit_mb`` caps each worker. ``incremental=True`` skips
+    months whose inputs and output match the ingest manifest.
     """
     unzip_path = Path(unzip_dir)
     output_path = Path(output_dir)
@@ -59,32 +351,51 @@ def save_monthly_files_with_chunks(unzip_dir="C:/Users/MD/Desktop/citi/data/unzi
     for file in unzip_path.rglob("*.csv"):
         if file.name.startswith("._"):  # Skip Mac junk files
             continue
-        match = re.search(r"(20\d{2})(\d{2})", file.name)
-        if match:
-            year, month = match.groups()
-            key = f"{year}_{month}"
+        key = _month_key(file.name)
+        if key:
             monthly_files.setdefault(key, []).append(file)
 
-    for key, file_list in monthly_files.items():
-        print(f"\n📦 Processing month: {key} with {len(file_list)} files")
-        monthly_data = []
-
-        for file in file_list:
-            try:
-                print(f"  🔄 Reading: {file.name}")
-                chunks = pd.read_csv(file, low_memory=False, dtype={"start_station_id": str, "end_station_id": str}, chunksize=chunk_size)
-                for chunk in chunks:
-                    monthly_data.append(chunk)
-            except Exception as e:
-                print(f"⚠️ Skipped {file.name} due to error: {e}")
-
-        if monthly_data:
-            combined = pd.concat(monthly_data, ignore_index=True)
-            output_file = output_path / f"rides_{key}.parquet"
-            combined.to_parquet(output_file, index=False)
-            print(f"✅ Saved: {output_file} with {len(combined)} rows")
-        else:
-            print(f"🚫 No valid data for {key}")
+    return _run_monthly_conversion(convert_month_from_csvs, monthly_files, output_path, chunk_size, max_workers, memory_limit_mb, incremental)
+
+def save_monthly_files_from_zips(
+    raw_dir="C:/Users/MD/Desktop/citi/data/raw",
+    output_dir="C:/Users/MD/Desktop/citi/data/processed/monthly",
+    chunk_size=500_000,
+    max_workers: int = 1,
+    memory_limit_mb: int = None,
+    incremental: bool = False,
+):
+    """
+    Read CSV members straight out of the downloaded zip archives and save each
+    month as a single .parquet file, without extracting anything to disk.
+
+    Months are independent, so ``max_workers > 1`` converts them on a process
+    pool; ``memory_limit_mb`` caps each worker. ``incremental=True`` skips
+    months whose inputs and output match the ingest manifest.
+    """
+    raw_path = Path(raw_dir)
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    monthly_members = {}
+
+    for zip_file_path in sorted(raw_path.glob("*.zip")):
+        try:
+            with zipfile.ZipFile(zip_file_path, "r") as zip_ref:
+                members = zip_ref.namelist()
+        except zipfile.BadZipFile as e:
+            print(f"⚠️ Skipped {zip_file_path.name}: {e}")
+            continue
+
+        for member in members:
+            name = Path(member).name
+            if not name.endswith(".csv") or name.startswith("._") or member.startswith("__MACOSX"):
+                continue
+            key = _month_key(name)
+            if key:
+                monthly_members.setdefault(key, []).append((zip_file_path, member))
+
+    return _run_monthly_conversion(convert_month_from_zips, monthly_members, output_path, chunk_size, max_workers, memory_limit_mb, incremental)
 
 # === Part 3: Run All ===
 
@@ -108,8 +419,9 @@ if __name__ == "__main__":
         "202503-citibike-tripdata.csv.zip"
     ]
 
-    # === First download and unzip
-    download_and_unzip_citibike_files(file_names)
+    # === First download the monthly archives
+    download_citibike_files(file_names, incremental=True)
 
-    # === Then group by month and save clean parquet
-    save_monthly_files_with_chunks()
+    # === Then stream CSVs out of the zips, grouped by month, into parquet
+    # (no per-worker memory cap: pass a generous memory_limit_mb to opt in)
+    save_monthly_files_from_zips(max_workers=os.cpu_count(), incremental=True)
@@ -45,8 +45,9 @@ past_hours = st.sidebar.slider(
 # Fetch data
 st.write(f"📦 Fetching data for {selected_station} (Station ID: {selected_station_id}) for the past {past_hours} hours...")
 
-df_actual = fetch_hourly_rides(past_hours)
-df_predicted = fetch_predictions(past_hours)
+# Only the selected station and the columns plotted below are transferred
+df_actual = fetch_hourly_rides(past_hours, stations=[selected_station_id], columns=["ride_count"])
+df_predicted = fetch_predictions(past_hours, stations=[selected_station_id], columns=["predicted_ride_count"])
 
 # Ensure both DataFrames have the required columns
 if "start_station_id" in df_actual.columns and "start_station_id" in df_predicted.columns:
@@ -0,0 +1,104 @@
+# src/hour_station_grid.py (FOR CITI BIKE PROJECT)
+
+import numpy as np
+import pandas as pd
+
+NS_PER_HOUR = 3_600 * 1_000_000_000
+
+# ==============================
+# 🧮 Dense Hour × Station Grid
+# ==============================
+
+class HourStationGrid:
+    """
+    Ride counts laid out as a dense ``(n_hours, n_stations)`` integer array.
+
+    Attributes
+    ----------
+    hours : pd.DatetimeIndex
+        One entry per row of ``counts`` (hourly, gap-free).
+    stations : pd.DataFrame
+        One row per column of ``counts`` with the station key columns.
+    counts : np.ndarray
+        ``counts[h, s]`` is the number of rides at ``stations.iloc[s]`` during ``hours[h]``.
+    """
+
+    def __init__(self, hours: pd.DatetimeIndex, stations: pd.DataFrame, counts: np.ndarray):
+        self.hours = hours
+        self.stations = stations.reset_index(drop=True)
+        self.counts = counts
+
+    @property
+    def shape(self):
+        return self.counts.shape
+
+    def to_long(self, time_col: str = "hour_ts", count_col: str = "ride_count") -> pd.DataFrame:
+        """
+        Expand to the long ``(time_col, *station_cols, count_col)`` frame,
+        hour-major like ``fill_missing_hour_station`` always returned.
+        """
+        n_hours, n_stations = self.counts.shape
+        station_idx = np.tile(np.arange(n_stations), n_hours)
+
+        long_df = pd.DataFrame({time_col: self.hours.repeat(n_stations)})
+        for col in self.stations.columns:
+            long_df[col] = self.stations[col].take(station_idx).reset_index(drop=True)
+        long_df[count_col] = self.counts.ravel()
+        return long_df
+
+def build_hour_station_grid(
+    df: pd.DataFrame,
+    time_col: str,
+    station_cols: list,
+    count_col: str = None,
+    hours: pd.DatetimeIndex = None,
+    stations: pd.DataFrame = None,
+    dtype=np.int32,
+) -> HourStationGrid:
+    """
+    Scatter per-(hour, station) counts into a preallocated dense grid.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Rows keyed by an hour-floored ``time_col`` and ``station_cols``.
+    count_col : str, optional
+        Column holding the counts; if omitted every row counts as one ride,
+        so raw trips can be passed without a prior groupby.
+    hours, stations : optional
+        Fix the grid's axes (e.g. to line months up); by default the hours
+        span ``df``'s min..max and stations are taken in order of appearance.
+        Rows falling outside fixed axes are ignored.
+
+    Returns
+    -------
+    HourStationGrid
+    """
+    times = pd.DatetimeIndex(pd.to_datetime(df[time_col]))
+
+    if hours is None:
+        hours = pd.date_range(start=times.min(), end=times.max(), freq="h")
+    if stations is None:
+        stations = df[station_cols].drop_duplicates()
+
+    station_index = pd.MultiIndex.from_frame(stations[station_cols])
+    station_idx = station_index.get_indexer(pd.MultiIndex.from_frame(df[station_cols]))
+
+    if len(hours):
+        hour_idx = (times.as_unit("ns").asi8 - hours[0].as_unit("ns").value) // NS_PER_HOUR
+    else:
+        hour_idx = np.empty(0, dtype=np.int64)
+
+    n_hours, n_stations = len(hours), len(station_index)
+    valid = (station_idx >= 0) & (hour_idx >= 0) & (hour_idx < n_hours)
+
+    flat_idx = hour_idx[valid] * n_stations + station_idx[valid]
+    weights = df[count_col].to_numpy()[valid] if count_col is not None else None
+    counts = np.bincount(flat_idx, weights=weights, minlength=n_hours * n_stations)
+
+    return HourStationGrid(hours, stations, counts.astype(dtype, copy=False).reshape(n_hours, n_stations))
+
+def fill_missing_hour_station(df: pd.DataFrame, time_col: str, station_cols: list, count_col: str) -> pd.DataFrame:
+    """Fill missing (hour, station) combinations with 0 ride counts."""
+    grid = build_hour_station_grid(df, time_col, station_cols, count_col, dtype=np.int64)
+    return grid.to_long(time_col, count_col)
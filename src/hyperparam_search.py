@@ -0,0 +1,325 @@
+# src/hyperparam_search.py (FOR CITI BIKE PROJECT)
+
+import json
+import math
+import os
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+
+from src.feature_spec import DEFAULT_FEATURE_SPEC, FeatureSpec
+from src.parallel_util import _limit_worker_memory
+from src.partitioned_dataset import FINAL_FEATURES_DIR
+from src.pipeline_util import get_pipeline
+from src.transform_ts_features_targets import build_lgb_dataset, dataset_cache_file
+from src.utils import walk_forward_splits
+
+TRIAL_STORE_DIR = Path(__file__).resolve().parent.parent / "data" / "hyperparam_trials"
+
+# Keys are ``get_pipeline`` / ``LGBMRegressor`` argument names, so the best
+# trial's params can be passed to ``get_pipeline(**params)`` as they are.
+SEARCH_SPACE = {
+    "num_leaves": ("int_log", 15, 255),
+    "learning_rate": ("log", 0.01, 0.2),
+    "min_child_samples": ("int", 5, 200),
+    "subsample": ("float", 0.5, 1.0),
+    "colsample_bytree": ("float", 0.3, 1.0),
+    "reg_lambda": ("log", 1e-3, 10.0),
+}
+
+BASE_PARAMS = {
+    "objective": "regression",
+    "subsample_freq": 1,  # without it LightGBM ignores subsample
+    "random_state": 42,
+}
+
+# Parameters fixed by the shared binned Dataset; trials must not vary them
+DATASET_PARAMS = {"max_bin": 255}
+
+# Relative MAE difference tolerated between a trial and its get_pipeline refit
+PIPELINE_MAE_TOLERANCE = 0.02
+
+# ==============================
+# 🎲 Search Space
+# ==============================
+
+def sample_params(rng: np.random.Generator, search_space: dict = SEARCH_SPACE) -> dict:
+    """Draw one configuration from ``search_space``."""
+    params = {}
+    for name, (kind, low, high) in search_space.items():
+        if kind == "int":
+            params[name] = int(rng.integers(low, high + 1))
+        elif kind == "int_log":
+            params[name] = int(round(math.exp(rng.uniform(math.log(low), math.log(high)))))
+        elif kind == "log":
+            params[name] = float(math.exp(rng.uniform(math.log(low), math.log(high))))
+        elif kind == "float":
+            params[name] = float(rng.uniform(low, high))
+        else:
+            raise ValueError(f"Unknown search space kind '{kind}' for {name}")
+    return params
+
+def rung_budgets(min_rounds: int, max_rounds: int, eta: int) -> list:
+    """Boosting rounds per rung: ``min_rounds * eta**k``, capped at ``max_rounds``."""
+    budgets = [min_rounds]
+    while budgets[-1] < max_rounds:
+        budgets.append(min(budgets[-1] * eta, max_rounds))
+    return budgets
+
+# ==============================
+# 🗃 Trial Store
+# ==============================
+
+class TrialStore:
+    """
+    Append-only JSONL file with one record per finished (trial, rung).
+    Safe to read while a search is still running. Records carry the
+    ``run_id`` of their search, so reruns of a study never mix.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def append(self, record: dict):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, sort_keys=True) + "\n")
+
+    def records(self) -> list:
+        if not self.path.exists():
+            return []
+        with open(self.path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def best(self, **match) -> dict:
+        """
+        Lowest-MAE record among the highest rung any trial reached, over the
+        records whose fields equal ``match`` (e.g. ``run_id=...``).
+        """
+        records = [r for r in self.records() if all(r.get(key) == value for key, value in match.items())]
+        if not records:
+            return None
+        top_rung = max(record["rung"] for record in records)
+        return min((r for r in records if r["rung"] == top_rung), key=lambda r: r["mae"])
+
+# ==============================
+# 👷 Worker
+# ==============================
+
+_DATASET = None
+_FOLDS = None
+
+def _init_worker(dataset_file: str, folds: list, memory_limit_mb):
+    """Load the shared binned Dataset once per worker process."""
+    global _DATASET, _FOLDS
+    _limit_worker_memory(memory_limit_mb)
+    _DATASET = lgb.Dataset(dataset_file, params={"verbose": -1}).construct()
+    _FOLDS = folds
+
+def _run_trial(trial_id: int, params: dict, rounds: int, num_threads: int, early_stopping_rounds: int) -> dict:
+    """Train ``params`` for up to ``rounds`` on every fold; return the mean holdout MAE."""
+    started = time.perf_counter()
+    train_params = {
+        **BASE_PARAMS, **params,
+        "metric": "l1", "verbose": -1, "num_threads": num_threads,
+    }
+
+    fold_maes, best_iterations = [], []
+    for train_idx, valid_idx in _FOLDS:
+        train_set = _DATASET.subset(train_idx)
+        valid_set = _DATASET.subset(valid_idx)
+        booster = lgb.train(
+            train_params,
+            train_set,
+            num_boost_round=rounds,
+            valid_sets=[valid_set],
+            callbacks=[lgb.early_stopping(early_stopping_rounds, verbose=False)],
+        )
+        fold_maes.append(float(booster.best_score["valid_0"]["l1"]))
+        best_iterations.append(int(booster.best_iteration or rounds))
+
+    return {
+        "trial_id": trial_id,
+        "params": params,
+        "rounds": rounds,
+        "mae": float(np.mean(fold_maes)),
+        "fold_maes": fold_maes,
+        "best_iterations": best_iterations,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+# ==============================
+# ✅ Pipeline Check
+# ==============================
+
+def verify_with_pipeline(
+    ts_data: pd.DataFrame,
+    record: dict,
+    folds: list,
+    spec: FeatureSpec = DEFAULT_FEATURE_SPEC,
+    tolerance: float = PIPELINE_MAE_TOLERANCE,
+) -> float:
+    """
+    Trials train raw boosters on the shared binned Dataset, not the
+    ``get_pipeline`` model that ships. Refit ``record``'s params through
+    ``get_pipeline`` on the last fold, with the trial's best iteration
+    count, and compare the holdout MAE with the trial's.
+
+    Returns the pipeline MAE; warns if it is off by more than ``tolerance``
+    (relative).
+    """
+    train_idx, valid_idx = folds[-1]
+    features, targets = spec.select_features(ts_data), ts_data[spec.target_col]
+
+    pipeline = get_pipeline(**{**BASE_PARAMS, **DATASET_PARAMS, **record["params"], "n_estimators": record["best_iterations"][-1]})
+    pipeline.fit(features.iloc[train_idx], targets.iloc[train_idx])
+    pipeline_mae = float(np.mean(np.abs(pipeline.predict(features.iloc[valid_idx]) - targets.iloc[valid_idx].to_numpy())))
+
+    trial_mae = record["fold_maes"][-1]
+    if abs(pipeline_mae - trial_mae) > tolerance * trial_mae:
+        print(f"⚠️ get_pipeline refit MAE {pipeline_mae:.4f} does not reproduce the trial's {trial_mae:.4f} on the last fold")
+    else:
+        print(f"✅ get_pipeline refit reproduces the trial's last-fold MAE ({pipeline_mae:.4f} vs {trial_mae:.4f})")
+    return pipeline_mae
+
+# ==============================
+# ✂️ Asynchronous Successive Halving
+# ==============================
+
+def run_search(
+    ts_data: pd.DataFrame,
+    spec: FeatureSpec = DEFAULT_FEATURE_SPEC,
+    n_trials: int = 64,
+    max_workers: int = None,
+    n_folds: int = 3,
+    min_rounds: int = 100,
+    max_rounds: int = 2700,
+    eta: int = 3,
+    early_stopping_rounds: int = 50,
+    search_space: dict = SEARCH_SPACE,
+    study_name: str = "lgbm_asha",
+    store_dir=None,
+    memory_limit_mb: int = None,
+    seed: int = 42,
+    verify: bool = True,
+) -> dict:
+    """
+    Tune LightGBM with asynchronous successive halving (ASHA) on a process pool.
+
+    ``ts_data`` is binned once into a cached ``lgb.Dataset`` that every
+    worker loads from disk; folds are the last ``n_folds`` monthly
+    walk-forward splits, taken as ``Dataset.subset`` views of it. New
+    trials start at ``min_rounds`` boosting rounds; whenever a worker is
+    free, a trial in the top ``1/eta`` of a rung is promoted to ``eta``
+    times the rounds (up to ``max_rounds``), otherwise a new trial starts.
+
+    Every finished (trial, rung) is appended to
+    ``<store_dir>/<study_name>.jsonl`` with this search's ``run_id``, the
+    spec version and the binned Dataset's key. Returns the best record of
+    this run only; with ``verify``, its ``pipeline_mae`` is the last-fold
+    MAE of the same params refit through ``get_pipeline``
+    (``verify_with_pipeline``).
+    """
+    run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    max_workers = max_workers or os.cpu_count() or 1
+    num_threads = max(1, (os.cpu_count() or 1) // max_workers)
+    rng = np.random.default_rng(seed)
+    store = TrialStore(Path(store_dir or TRIAL_STORE_DIR) / f"{study_name}.jsonl")
+
+    # Folds are positions, so the Dataset rows must be in hour_ts order
+    ts_data = ts_data.sort_values(spec.time_col, kind="stable").reset_index(drop=True)
+    folds = list(walk_forward_splits(ts_data, n_splits=n_folds, gap_hours=spec.horizon, time_col=spec.time_col))
+    if not folds:
+        raise ValueError("No walk-forward folds; not enough history to tune on.")
+
+    build_lgb_dataset(ts_data, spec, params=DATASET_PARAMS)
+    dataset_file = dataset_cache_file(ts_data, spec, DATASET_PARAMS)
+    if not dataset_file.exists():
+        raise RuntimeError(f"❌ Binned Dataset was not cached at {dataset_file}; workers load it from disk, so the search cannot start.")
+    dataset_key = dataset_file.stem
+    dataset_file = str(dataset_file)
+    if not verify:
+        del ts_data
+
+    budgets = rung_budgets(min_rounds, max_rounds, eta)
+    print(f"🔎 ASHA run {run_id}: {n_trials} trials, rungs {budgets} rounds, {len(folds)} folds, {max_workers} workers x {num_threads} threads")
+
+    configs = {}
+    rung_results = [dict() for _ in budgets]
+    promoted = [set() for _ in budgets]
+
+    def next_job():
+        # Promote first, from the top rung down, then start a new trial
+        for rung in reversed(range(len(budgets) - 1)):
+            finished = rung_results[rung]
+            n_top = len(finished) // eta
+            for trial_id in sorted(finished, key=finished.get)[:n_top]:
+                if trial_id not in promoted[rung]:
+                    promoted[rung].add(trial_id)
+                    return trial_id, rung + 1
+        if len(configs) < n_trials:
+            trial_id = len(configs)
+            configs[trial_id] = sample_params(rng, search_space)
+            return trial_id, 0
+        return None
+
+    started = time.perf_counter()
+    pending = {}
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_worker,
+        initargs=(dataset_file, folds, memory_limit_mb),
+    ) as executor:
+        while True:
+            while len(pending) < max_workers:
+                job = next_job()
+                if job is None:
+                    break
+                trial_id, rung = job
+                future = executor.submit(
+                    _run_trial, trial_id, configs[trial_id], budgets[rung], num_threads, early_stopping_rounds
+                )
+                pending[future] = (trial_id, rung)
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                trial_id, rung = pending.pop(future)
+                try:
+                    record = future.result()
+                except Exception as e:
+                    print(f"⚠️ Trial {trial_id} failed at rung {rung}: {e}")
+                    continue
+
+                record.update({
+                    "study": study_name, "run_id": run_id, "rung": rung,
+                    "spec_version": spec.version, "dataset_key": dataset_key,
+                })
+                rung_results[rung][trial_id] = record["mae"]
+                store.append(record)
+                print(f"⏱️ Trial {trial_id} rung {rung} ({record['rounds']} rounds): MAE {record['mae']:.4f} in {record['seconds']:.1f}s")
+
+    best = store.best(run_id=run_id)
+    if best is None:
+        raise RuntimeError(f"❌ All {n_trials} trials of run {run_id} failed; see the warnings above.")
+    print(f"🏆 Best trial {best['trial_id']}: MAE {best['mae']:.4f} with {best['params']} ({time.perf_counter() - started:.0f}s total)")
+
+    if verify:
+        best["pipeline_mae"] = verify_with_pipeline(ts_data, best, folds, spec)
+    return best
+
+# ==============================
+# MAIN
+# ==============================
+
+if __name__ == "__main__":
+    # Tune on the partitioned output of utils.build_final_features
+    best = run_search(pd.read_parquet(FINAL_FEATURES_DIR))
+    print(json.dumps({**BASE_PARAMS, **best["params"]}, indent=2))
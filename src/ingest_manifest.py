@@ -0,0 +1,165 @@
+# src/ingest_manifest.py (FOR CITI BIKE PROJECT)
+
+import hashlib
+import json
+from pathlib import Path
+
+from src.parallel_util import atomic_output_path
+
+MANIFEST_FILE_NAME = "_manifest.json"
+PARQUET_MAGIC = b"PAR1"
+
+# ==============================
+# 🔑 Fingerprints
+# ==============================
+
+def file_sha256(path, block_size: int = 4 * 1024 * 1024) -> str:
+    """Content hash of a file, read in blocks so large archives stay out of RAM."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def stat_fingerprint(paths) -> str:
+    """
+    Cheap fingerprint of input files from their name, size and mtime.
+    Used to notice changed inputs without hashing them again.
+    """
+    digest = hashlib.sha256()
+    for path in sorted(Path(p) for p in paths):
+        stat = path.stat()
+        digest.update(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+def schema_fingerprint(schema) -> str:
+    """Fingerprint of an Arrow schema (or anything with a stable ``str``)."""
+    return hashlib.sha256(str(schema).encode()).hexdigest()[:16]
+
+def _has_parquet_footer(path: Path) -> bool:
+    """A Parquet file that was cut short loses its trailing ``PAR1`` magic."""
+    with open(path, "rb") as f:
+        f.seek(-len(PARQUET_MAGIC), 2)
+        return f.read() == PARQUET_MAGIC
+
+# ==============================
+# 📒 Manifest
+# ==============================
+
+class IngestManifest:
+    """
+    Per-directory record of what each ingest stage has already produced.
+
+    Every ``(stage, key)`` entry stores the outputs' content hash, size,
+    mtime, row count, schema fingerprint, plus the fingerprint of the
+    inputs it was built from (for downloads, the remote ETag). A re-run
+    asks ``is_current`` before doing any work; the check is a ``stat`` call
+    in the common case, so unchanged months are skipped in milliseconds.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+        else:
+            self.data = {"stages": {}}
+
+    @classmethod
+    def for_directory(cls, directory) -> "IngestManifest":
+        return cls(Path(directory) / MANIFEST_FILE_NAME)
+
+    def entry(self, stage: str, key: str) -> dict:
+        return self.data["stages"].get(stage, {}).get(key)
+
+    def _file_stats(self, output_file) -> dict:
+        output_file = Path(output_file)
+        stat = output_file.stat()
+        return {
+            "file": output_file.relative_to(self.path.parent).as_posix()
+            if output_file.is_relative_to(self.path.parent) else output_file.name,
+            "sha256": file_sha256(output_file),
+            "bytes": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+
+    def _file_is_intact(self, output_file: Path, recorded: dict) -> bool:
+        try:
+            stat = output_file.stat()
+        except FileNotFoundError:
+            return False
+
+        if stat.st_size != recorded["bytes"]:
+            return False
+
+        if output_file.suffix == ".parquet" and not _has_parquet_footer(output_file):
+            return False
+
+        if stat.st_mtime_ns != recorded["mtime_ns"]:
+            # Same size but touched since: only the content hash can tell
+            return file_sha256(output_file) == recorded["sha256"]
+
+        return True
+
+    def is_current(self, stage: str, key: str, output_file, source: str = None, schema: str = None) -> bool:
+        """
+        True if ``output_file`` is exactly what was recorded for ``(stage, key)``
+        and was built from the same ``source`` / ``schema`` fingerprints.
+        Missing, truncated or modified outputs return False.
+
+        ``output_file`` may also be a list of files for stages that write
+        several files per month (e.g. a partitioned layout).
+        """
+        entry = self.entry(stage, key)
+        if entry is None or entry.get("source") != source or entry.get("schema") != schema:
+            return False
+
+        output_files = output_file if isinstance(output_file, (list, tuple)) else [output_file]
+        recorded = entry["files"]
+        if len(output_files) != len(recorded):
+            return False
+
+        return all(
+            self._file_is_intact(Path(path), stats)
+            for path, stats in zip(sorted(output_files, key=str), recorded)
+        )
+
+    def recorded_files(self, stage: str, key: str) -> list:
+        """Paths recorded for ``(stage, key)``, resolved against the manifest directory."""
+        entry = self.entry(stage, key)
+        if entry is None:
+            return []
+        return [self.path.parent / stats["file"] for stats in entry.get("files", [])]
+
+    def record(self, stage: str, key: str, output_file, rows: int = None, source: str = None,
+               schema: str = None, etag: str = None, **extra) -> dict:
+        """Hash ``output_file`` (or a list of files) and store the entry (call ``save`` to persist)."""
+        output_files = output_file if isinstance(output_file, (list, tuple)) else [output_file]
+
+        entry = {
+            "files": [self._file_stats(path) for path in sorted(output_files, key=str)],
+            "rows": rows,
+            "source": source,
+            "schema": schema,
+            "etag": etag,
+            **extra,
+        }
+        self.data["stages"].setdefault(stage, {})[key] = entry
+        return entry
+
+    def cached_value(self, stage: str, key: str, source: str):
+        """Return a small derived value stored for ``(stage, key)`` if its source still matches."""
+        entry = self.entry(stage, key)
+        if entry is not None and entry.get("source") == source:
+            return entry.get("value")
+        return None
+
+    def store_value(self, stage: str, key: str, value, source: str):
+        """Store a small derived value (e.g. per-month station counts) without an output file."""
+        self.data["stages"].setdefault(stage, {})[key] = {"source": source, "value": value}
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_output_path(self.path) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, indent=2, sort_keys=True)
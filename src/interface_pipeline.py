@@ -12,7 +12,8 @@ sys.path.append(os.path.abspath(os.path.join(os.getcwd(), "..")))
 # 🛠 Project imports
 import src.config as config
 from src.citi_interface import (
-    get_feature_store,
+    get_cached_feature_view,
+    load_feature_spec_for_model,
     load_model_from_local
 )
 
@@ -20,9 +21,8 @@ from src.citi_interface import (
 # 🔑 Hopsworks Connection
 # ==============================
 
-print("🔌 Connecting to Hopsworks...")
-
-feature_store = get_feature_store()
+# Logs in lazily, only if the local cache is missing rows
+feature_view = get_cached_feature_view()
 
 # ==============================
 # 🚲 Fetch Citi Bike Data
@@ -33,11 +33,6 @@ fetch_data_to = pd.Timestamp("2025-03-31 23:59:59", tz="Etc/UTC")
 
 print(f"📅 Fetching Citi Bike data from {fetch_data_from} to {fetch_data_to}...")
 
-feature_view = feature_store.get_feature_view(
-    name=config.FEATURE_VIEW_NAME,
-    version=config.FEATURE_VIEW_VERSION
-)
-
 ts_data = feature_view.get_batch_data(
     start_time=(fetch_data_from - timedelta(days=1)),
     end_time=(fetch_data_to + timedelta(days=1)),
@@ -59,10 +54,7 @@ if ts_data.empty:
 
 print("🛠 Creating manual features...")
 
-# Only add hour_sin and hour_cos
-ts_data["hour_sin"] = np.sin(2 * np.pi * ts_data["hour"] / 24)
-ts_data["hour_cos"] = np.cos(2 * np.pi * ts_data["hour"] / 24)
-
+# Calendar features the spec needs are joined in "Prepare Features" below
 # No need to create ride_count_roll3 manually - already there!
 
 # ==============================
@@ -70,28 +62,23 @@ ts_data["hour_cos"] = np.cos(2 * np.pi * ts_data["hour"] / 24)
 # ==============================
 
 model = load_model_from_local()
-print("✅ Model loaded successfully.")
+spec = load_feature_spec_for_model(model)
+print(f"✅ Model loaded successfully (feature spec v{spec.version}, {len(spec.feature_columns())} features).")
 
 # ==============================
 # ⚙️ Prepare Features for Prediction
 # ==============================
 
-non_feature_cols = ["hour_ts", "start_station_name", "time_of_day"]
-
-trained_features = [
-    "hour", "hour_sin", "hour_cos", "day_of_week", "is_holiday_or_weekend",
-    "month", "is_peak_hour", "day_of_year", "ride_count_roll3"
-] + [f"ride_count_lag_{i}" for i in range(1, 679)] + ["target_ride_count"]
-
-X = ts_data.drop(columns=non_feature_cols, errors="ignore")
+# The spec saved with the model decides the columns, so serving matches training
+X = ts_data.copy()
 
 # Fill missing trained features if needed
-for col in trained_features:
+for col in spec.lag_columns + spec.rolling_columns + list(spec.extra_features):
     if col not in X.columns:
         print(f"⚠️ Missing column: {col}. Filling with 0.")
         X[col] = 0
 
-X = X[trained_features]
+X = spec.select_features(X)
 
 print(f"✅ Final feature shape for prediction: {X.shape}")
 
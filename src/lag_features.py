@@ -0,0 +1,89 @@
+# src/lag_features.py (FOR CITI BIKE PROJECT)
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# ==============================
+# 🪟 Zero-Copy Lag Windows
+# ==============================
+
+def lag_window_view(values: np.ndarray, max_lag: int) -> np.ndarray:
+    """
+    Strided ``(n - max_lag, max_lag + 1)`` view over one station's hourly
+    counts. Row ``r`` describes hour ``t = r + max_lag`` and column
+    ``max_lag - k`` holds ``values[t - k]``, i.e. lag ``k``. Nothing is copied.
+    """
+    return sliding_window_view(values, max_lag + 1)
+
+# ==============================
+# 🚲 Per-Station Lag Features
+# ==============================
+
+def add_lag_features(
+    df: pd.DataFrame,
+    lags,
+    station_col: str = "start_station_id",
+    time_col: str = "hour_ts",
+    count_col: str = "ride_count",
+    target_col: str = "target_ride_count",
+    horizon: int = 8,
+    rolling_windows=(3,),
+    dtype=np.float32,
+) -> pd.DataFrame:
+    """
+    Add ``ride_count_lag_<k>`` (and ``ride_count_roll<w>``) features per station.
+
+    Each station's counts are one contiguous array and lags come from a
+    sliding-window view over it, so lags never reach into another station.
+    Only rows with a complete lag history (and a target, if one has to be
+    derived ``horizon`` hours ahead) are materialized, as a single
+    ``(rows, lags)`` block of ``dtype``. Rows are returned sorted by
+    station, then hour. Input hours are expected to be gap-free per station
+    (as written by ``transform_to_timeseries``). Input too short for any
+    full lag history gives an empty frame with the same columns.
+    """
+    lags = sorted(set(int(lag) for lag in lags))
+    max_lag = max(lags + list(rolling_windows))
+    lag_columns = [f"{count_col}_lag_{lag}" for lag in lags]
+
+    # Old lag columns are rebuilt, never carried over
+    base = df.drop(columns=[col for col in df.columns if col.startswith(f"{count_col}_lag_")])
+    base = base.sort_values([station_col, time_col], kind="stable").reset_index(drop=True)
+
+    need_target = target_col not in base.columns
+    counts = base[count_col].to_numpy().astype(dtype)
+
+    # Position of every row inside its station block
+    stations = base[station_col].to_numpy()
+    is_start = np.ones(len(base), dtype=bool)
+    is_start[1:] = stations[1:] != stations[:-1]
+    block_start = np.maximum.accumulate(np.where(is_start, np.arange(len(base)), 0))
+    block_end = np.append(np.flatnonzero(is_start)[1:], len(base))[np.cumsum(is_start) - 1]
+    position = np.arange(len(base)) - block_start
+
+    # Keep hours with a full lag history and a target inside the same station
+    valid = position >= max_lag
+    if need_target:
+        valid &= np.arange(len(base)) + horizon < block_end
+    else:
+        valid &= base[target_col].notna().to_numpy()
+    keep_rows = np.flatnonzero(valid)
+
+    # Window row r describes hour r + max_lag; one gather builds the whole block.
+    # With max_lag rows or fewer no row is kept and there is nothing to view.
+    if len(counts) <= max_lag:
+        windows = np.empty((0, max_lag + 1), dtype=dtype)
+    else:
+        windows = lag_window_view(counts, max_lag)
+    window_rows = keep_rows - max_lag
+    lag_matrix = windows[np.ix_(window_rows, max_lag - np.asarray(lags))]
+
+    result = base.iloc[keep_rows].reset_index(drop=True)
+    for window in rolling_windows:
+        result[f"{count_col}_roll{window}"] = windows[window_rows, max_lag - window:max_lag].mean(axis=1)
+    if need_target:
+        result[target_col] = counts[keep_rows + horizon]
+
+    lag_df = pd.DataFrame(lag_matrix, columns=lag_columns, copy=False)
+    return pd.concat([result, lag_df], axis=1)
@@ -0,0 +1,159 @@
+# src/model_export.py (FOR CITI BIKE PROJECT)
+
+import json
+from pathlib import Path
+
+import lightgbm as lgb
+import numpy as np
+
+from src.parallel_util import atomic_output_path
+from src.temporal_util import TEMPORAL_FEATURES, temporal_features
+
+# Only numpy, lightgbm and temporal_util are needed to load and predict;
+# sklearn, joblib and src.pipeline_util are never imported on that path.
+
+BOOSTER_FILE_NAME = "booster.txt"
+MODEL_SPEC_FILE_NAME = "model_spec.json"
+EXPORT_FORMAT = 1
+
+# ==============================
+# 📤 Export
+# ==============================
+
+def _final_booster(model) -> lgb.Booster:
+    """The LightGBM booster at the end of a pipeline, sklearn wrapper or booster."""
+    if isinstance(model, lgb.Booster):
+        return model
+    estimator = model.steps[-1][1] if hasattr(model, "steps") else model
+    return estimator.booster_
+
+def export_model(model, export_dir, feature_spec: dict = None, time_col: str = "hour_ts") -> Path:
+    """
+    Write ``model`` (a fitted ``get_pipeline`` pipeline, ``LGBMRegressor`` or
+    ``Booster``) as ``booster.txt`` in LightGBM's native format plus a
+    ``model_spec.json`` describing how to rebuild its inputs.
+
+    Booster features that are not input columns must be temporal features
+    derivable from ``time_col`` (what ``TemporalFeaturesTransformer`` adds);
+    the drop step needs no record since inputs are selected by name.
+    ``feature_spec`` (``FeatureSpec.to_dict()``) is stored alongside.
+
+    Returns the export directory.
+    """
+    export_dir = Path(export_dir)
+    export_dir.mkdir(parents=True, exist_ok=True)
+
+    booster = _final_booster(model)
+    booster_features = booster.feature_name()
+    input_columns = [str(col) for col in getattr(model, "feature_names_in_", booster_features)]
+
+    derived = [col for col in booster_features if col not in input_columns]
+    not_derivable = [col for col in derived if col not in TEMPORAL_FEATURES or time_col not in input_columns]
+    if not_derivable:
+        raise ValueError(f"❌ Cannot export: booster features {not_derivable} are neither inputs nor temporal features of '{time_col}'")
+
+    model_spec = {
+        "format": EXPORT_FORMAT,
+        "lightgbm_version": lgb.__version__,
+        "booster_features": booster_features,
+        "input_columns": input_columns,
+        "temporal_features": derived,
+        "time_col": time_col,
+        "feature_spec": feature_spec,
+    }
+
+    with atomic_output_path(export_dir / BOOSTER_FILE_NAME) as tmp_file:
+        booster.save_model(str(tmp_file))
+    with atomic_output_path(export_dir / MODEL_SPEC_FILE_NAME) as tmp_file:
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(model_spec, f, indent=2)
+
+    print(f"✅ Exported booster ({len(booster_features)} features, {booster.num_trees()} trees) to {export_dir}")
+    return export_dir
+
+# ==============================
+# 📥 Lean Loader
+# ==============================
+
+def _wall_clock_ns(values) -> np.ndarray:
+    """Local wall-clock int64 nanoseconds from a datetime column (pandas or numpy)."""
+    accessor = getattr(values, "dt", None)
+    if accessor is not None and accessor.tz is not None:
+        values = accessor.tz_localize(None)
+    return np.asarray(values, dtype="datetime64[ns]").view(np.int64)
+
+class LeanModel:
+    """
+    Prediction path rebuilt from an export: column selection by name,
+    temporal features from ``temporal_util`` and the native booster.
+
+    ``predict`` takes anything indexable by column name (a DataFrame or a
+    dict of arrays), like the pipeline it replaces.
+    """
+
+    def __init__(self, booster: lgb.Booster, model_spec: dict):
+        self.booster = booster
+        self.model_spec = model_spec
+        self.feature_spec = model_spec.get("feature_spec")
+        self.feature_names_in_ = np.asarray(model_spec["input_columns"], dtype=object)
+
+    def feature_matrix(self, data) -> np.ndarray:
+        booster_features = self.model_spec["booster_features"]
+        derived = self.model_spec["temporal_features"]
+
+        computed = {}
+        if derived:
+            computed = temporal_features(_wall_clock_ns(data[self.model_spec["time_col"]]), derived)
+
+        first = computed[derived[0]] if derived else data[booster_features[0]]
+        X = np.empty((len(first), len(booster_features)), dtype=np.float64)
+        for j, col in enumerate(booster_features):
+            X[:, j] = computed[col] if col in computed else np.asarray(data[col], dtype=np.float64)
+        return X
+
+    def predict(self, data) -> np.ndarray:
+        return self.booster.predict(self.feature_matrix(data))
+
+def export_dir_for(model_path) -> Path:
+    """Where the native export of ``model_path`` lives (``models/x.pkl`` -> ``models/x/``)."""
+    return Path(model_path).with_suffix("")
+
+def has_export(export_dir) -> bool:
+    export_dir = Path(export_dir)
+    return (export_dir / BOOSTER_FILE_NAME).exists() and (export_dir / MODEL_SPEC_FILE_NAME).exists()
+
+def load_lean_model(export_dir) -> LeanModel:
+    """Load an ``export_model`` directory without sklearn or pickles."""
+    export_dir = Path(export_dir)
+    with open(export_dir / MODEL_SPEC_FILE_NAME, "r", encoding="utf-8") as f:
+        model_spec = json.load(f)
+
+    if model_spec.get("format") != EXPORT_FORMAT:
+        raise ValueError(f"❌ Unsupported model export format {model_spec.get('format')} in {export_dir}")
+
+    booster = lgb.Booster(model_file=str(export_dir / BOOSTER_FILE_NAME))
+    return LeanModel(booster, model_spec)
+
+# ==============================
+# MAIN
+# ==============================
+
+if __name__ == "__main__":
+    # Convert a pickle once: python -m src.model_export [models/x.pkl] -> models/x/
+    # (default: the model the app loads, citi_interface.LOCAL_MODEL_PATH)
+    import sys
+
+    import joblib
+
+    from src.citi_interface import LOCAL_MODEL_PATH
+    from src.feature_spec import FeatureSpec, spec_path_for
+
+    model_path = Path(sys.argv[1]) if len(sys.argv) > 1 else LOCAL_MODEL_PATH
+    if not model_path.exists():
+        print(f"❌ No model pickle at {model_path}. Usage: python -m src.model_export [path/to/model.pkl]")
+        sys.exit(1)
+
+    spec_path = spec_path_for(model_path)
+    feature_spec = FeatureSpec.load(spec_path).to_dict() if spec_path.exists() else None
+    export_dir = export_model(joblib.load(model_path), export_dir_for(model_path), feature_spec=feature_spec)
+    print(f"✅ Exported {model_path.name} to {export_dir}")
@@ -1,103 +1,203 @@
 # src/model_training_pipeline.py
 
+import json
 import os
+import time
 import joblib
-from datetime import datetime, timedelta
+from pathlib import Path
 import pandas as pd
-from hsml.schema import Schema
-from hsml.model_schema import ModelSchema
 from sklearn.metrics import mean_absolute_error
 
 import src.config as config
+from src.feature_spec import DEFAULT_FEATURE_SPEC, FeatureSpec, spec_path_for
+from src.model_export import export_dir_for, export_model
+from src.partitioned_dataset import FINAL_FEATURES_DIR, latest_hour, partition_files
 from src.pipeline_util import get_pipeline
+from src.storage_backend import get_backend
 from src.citi_interface import (
-    get_feature_store,
-    get_hopsworks_project,
+    download_latest_registered_model,
+    get_cached_feature_view,
     load_metrics_from_registry,
-    save_model_to_registry,
+)
+from src.training_util import (
+    HOLDOUT_HOURS,
+    INCREMENTAL_HOLDOUT_HOURS,
+    TrainingState,
+    choose_training_mode,
+    fit_with_early_stopping,
+    is_drifted,
+    load_previous_training,
+    refit_from_partitions,
+    trailing_holdout,
+    train_from_partitions,
+    warm_start_booster,
 )
 from src.transform_ts_features_targets import transform_ts_data_into_features_and_targets
 
+TRAINING_PARAMS = dict(
+    objective="regression",
+    n_estimators=5000,  # upper bound; early stopping on the holdout picks the real count
+    learning_rate=0.02,
+    num_leaves=64,
+    min_child_samples=20,
+    subsample=0.8,
+    colsample_bytree=0.8,
+    random_state=42,
+    n_jobs=-1
+)
+
 # ==============================
-# 📦 Step 1: Fetch Data from Hopsworks
+# 🔀 Step 0: Full or Incremental Training
 # ==============================
 
-print("📦 Fetching Citi Bike data from feature store...")
+# TRAINING_SOURCE=partitions trains out of core on the Parquet partitions of
+# utils.build_final_features (FEATURES_DIR) instead of the feature view;
+# that is always a full retrain.
+training_source = os.environ.get("TRAINING_SOURCE", "feature_store")
+if training_source not in ("feature_store", "partitions"):
+    raise ValueError(f"Unknown training source '{training_source}' (expected feature_store or partitions)")
 
-# Connect to Feature Store
-feature_store = get_feature_store()
+# TRAINING_MODE=auto (default) warm-starts from the registered booster and
+# retrains from scratch on schedule, on drift, or when there is no usable
+# previous model; "full" / "incremental" force a mode.
+requested_mode = "full" if training_source == "partitions" else os.environ.get("TRAINING_MODE", "auto")
+now = pd.Timestamp.now(tz="UTC")
 
-# Load Feature View
-feature_view = feature_store.get_feature_view(
-    name=config.FEATURE_VIEW_NAME,
-    version=config.FEATURE_VIEW_VERSION
-)
+previous = load_previous_training(download_latest_registered_model(config.MODEL_NAME)) if requested_mode != "full" else None
+previous_booster, previous_state, previous_export_dir = previous if previous else (None, None, None)
 
-# Fetch full batch data for training
-ts_data = feature_view.get_batch_data()
+mode, reason = choose_training_mode(previous_state, now, requested=requested_mode)
 
-# (Optional) Fetch small batch to inspect schema
-start_time = pd.Timestamp.now(tz="UTC") - timedelta(days=1)
-end_time = pd.Timestamp.now(tz="UTC")
+spec = DEFAULT_FEATURE_SPEC
+if mode == "incremental":
+    with open(previous_export_dir / "model_spec.json", "r", encoding="utf-8") as f:
+        previous_spec = json.load(f).get("feature_spec")
+    if previous_spec is None or FeatureSpec.from_dict(previous_spec) != spec:
+        mode, reason = "full", "feature spec changed since the last model"
 
-print(f"Fetching Feature View data from {start_time} to {end_time}...")
-
-batch_data = feature_view.get_batch_data(
-    start_time=start_time,
-    end_time=end_time
-)
-
-# Print Feature View Columns
-print("\n✅ Columns in Feature View:")
-print(list(batch_data.columns))
-
-# ==============================
-# 🔄 Step 2: Transform Timeseries Data
-# ==============================
+print(f"🔀 Training mode: {mode} ({reason})")
 
-print("🔄 Preparing features and targets for training...")
+if training_source == "partitions":
+    # ==============================
+    # 📂 Steps 1-2: Feature Partitions (out of core)
+    # ==============================
 
-features, targets = transform_ts_data_into_features_and_targets(ts_data)
+    features_dir = Path(os.environ.get("FEATURES_DIR", FINAL_FEATURES_DIR))
+    print(f"📂 Training from feature partitions under {features_dir}...")
 
-# Handle no data case
-if features is None or targets is None:
-    print("❌ Feature creation failed. Exiting...")
-    exit(1)
+    # Only the newest partition is loaded, for the registry schema and input example
+    sample = pd.read_parquet(partition_files(features_dir)[-1]).dropna(subset=[spec.target_col])
+    features, targets = spec.select_features(sample), sample[spec.target_col]
+    holdout_hours = HOLDOUT_HOURS
 
-print(f"✅ Features shape: {features.shape}, Targets shape: {targets.shape}")
+else:
+    # ==============================
+    # 📦 Step 1: Fetch Data from Hopsworks
+    # ==============================
+
+    print("📦 Fetching Citi Bike data from feature store...")
+
+    # Feature view behind the local cache: only rows not fetched before go over the network
+    feature_view = get_cached_feature_view()
+
+    if mode == "incremental":
+        # Only rows newer than what the previous booster has seen
+        watermark = pd.Timestamp(previous_state.watermark)
+        ts_data = feature_view.get_batch_data(start_time=watermark, end_time=now)
+        ts_data = ts_data[pd.to_datetime(ts_data["hour_ts"], utc=True) > watermark]
+        print(f"✅ {len(ts_data)} new rows since watermark {watermark}")
+
+        if ts_data.empty:
+            print("⚠️ No new rows since the last training run. Nothing to do.")
+            exit(0)
+    else:
+        # Fetch full batch data for training
+        ts_data = feature_view.get_batch_data()
+
+    # Print Feature View Columns
+    print("\n✅ Columns in Feature View:")
+    print(list(ts_data.columns))
+
+    # ==============================
+    # 🔄 Step 2: Transform Timeseries Data
+    # ==============================
+
+    print("🔄 Preparing features and targets for training...")
+
+    features, targets = transform_ts_data_into_features_and_targets(ts_data, spec=spec)
+
+    # Handle no data case
+    if features is None or targets is None:
+        print("❌ Feature creation failed. Exiting...")
+        exit(1)
+
+    print(f"✅ Features shape: {features.shape}, Targets shape: {targets.shape}")
+
+    if mode == "incremental":
+        # How the previous model does on data it has never seen
+        recent_mae = mean_absolute_error(targets, previous_booster.predict(features))
+        print(f"📉 Previous model MAE on new rows: {recent_mae:.4f} (baseline {previous_state.baseline_mae})")
+
+        if is_drifted(recent_mae, previous_state.baseline_mae):
+            print("⚠️ Drift detected. Falling back to a full retrain...")
+            mode, reason = "full", "drift"
+            ts_data = feature_view.get_batch_data()
+            features, targets = transform_ts_data_into_features_and_targets(ts_data, spec=spec)
+            if features is None or targets is None:
+                print("❌ Feature creation failed. Exiting...")
+                exit(1)
+
+    # Trailing time-based holdout: the last hours validate, the rest trains
+    holdout_hours = INCREMENTAL_HOLDOUT_HOURS if mode == "incremental" else HOLDOUT_HOURS
+    train_idx, valid_idx = trailing_holdout(ts_data["hour_ts"], holdout_hours=holdout_hours, gap_hours=spec.horizon)
+    X_train, y_train = features.iloc[train_idx], targets.iloc[train_idx]
+    X_valid, y_valid = features.iloc[valid_idx], targets.iloc[valid_idx]
+
+    print(f"✅ Train rows: {len(X_train)}, holdout rows: {len(X_valid)} (last {holdout_hours}h)")
 
 # ==============================
 # 🚀 Step 3: Train LightGBM Pipeline
 # ==============================
 
-print("🚀 Training new Citi Bike model pipeline...")
-
-pipeline = get_pipeline(
-    objective="regression",
-    n_estimators=5000,
-    learning_rate=0.02,
-    num_leaves=64,
-    min_child_samples=20,
-    subsample=0.8,
-    colsample_bytree=0.8,
-    random_state=42,
-    n_jobs=-1
-)
-
-pipeline.fit(features, targets)
+if training_source == "partitions":
+    print("🚀 Training new Citi Bike booster from partitions...")
+    model, best_iteration, test_mae, train_seconds, trained_until = train_from_partitions(
+        features_dir, spec, TRAINING_PARAMS, holdout_hours=holdout_hours
+    )
+elif mode == "incremental":
+    print("🔥 Warm-starting the previous booster on new rows...")
+    started = time.perf_counter()
+    model = warm_start_booster(
+        previous_booster, X_train, y_train, previous_state.params or TRAINING_PARAMS, valid=(X_valid, y_valid)
+    )
+    train_seconds = time.perf_counter() - started
+    best_iteration = model.best_iteration or model.current_iteration()
+    trained_until = ts_data["hour_ts"].iloc[train_idx]  # holdout rows are picked up next week
+else:
+    print("🚀 Training new Citi Bike model pipeline...")
+    model, best_iteration, train_seconds = fit_with_early_stopping(TRAINING_PARAMS, X_train, y_train, X_valid, y_valid)
+    trained_until = ts_data["hour_ts"].iloc[train_idx]
 
 # ==============================
 # 🔍 Step 4: Evaluate
 # ==============================
 
-print("🔍 Evaluating model...")
+# test_mae is the holdout MAE of the early-stopped model. Full and partition
+# runs then register a refit on every row, holdout included, which has no
+# clean holdout left; its MAE is not measured, and test_mae stays the
+# early-stopped model's (as it was for every earlier version compared here).
+print("🔍 Evaluating model on the holdout...")
 
-predictions = pipeline.predict(features)
-test_mae = mean_absolute_error(targets, predictions)
+if training_source == "feature_store":
+    test_mae = mean_absolute_error(y_valid, model.predict(X_valid))
 
-metrics = load_metrics_from_registry()
+if mode == "incremental":
+    # Same holdout rows for both models: the update must beat keeping the old one
+    metrics = {"test_mae": mean_absolute_error(y_valid, previous_booster.predict(X_valid))}
+else:
+    metrics = load_metrics_from_registry()
 
-print(f"📈 New model MAE: {test_mae:.4f}")
+print(f"📈 Early-stopped model holdout MAE: {test_mae:.4f} (best iteration {best_iteration}, {train_seconds:.1f}s)")
 print(f"📉 Previous best MAE: {metrics['test_mae']:.4f}")
 
 # ==============================
@@ -107,33 +207,71 @@ print(f"📉 Previous best MAE: {metrics['test_mae']:.4f}")
 if test_mae < metrics.get("test_mae", float("inf")):
     print(f"🏆 New model is better! Proceeding to register the model...")
 
+    refit = training_source == "partitions" or mode == "full"
+    if training_source == "partitions":
+        print(f"🔁 Refitting on every partition row with {best_iteration} trees...")
+        model, refit_seconds = refit_from_partitions(features_dir, spec, TRAINING_PARAMS, best_iteration)
+        train_seconds += refit_seconds
+        trained_until = latest_hour(features_dir, spec)
+    elif mode == "full":
+        # Refit on every row, holdout included, with the early-stopped tree count
+        print(f"🔁 Refitting on all {len(features)} rows with {best_iteration} trees...")
+        started = time.perf_counter()
+        model = get_pipeline(**{**TRAINING_PARAMS, "n_estimators": best_iteration})
+        model.fit(features, targets)
+        train_seconds += time.perf_counter() - started
+        trained_until = ts_data["hour_ts"]
+
     model_name = config.MODEL_NAME
 
-    # Save model locally
-    model_dir = "models"
+    # Save model locally, with the feature spec it was trained on next to it
+    model_dir = os.path.join("models", model_name)
     os.makedirs(model_dir, exist_ok=True)
     model_path = os.path.join(model_dir, f"{model_name}.pkl")
-    joblib.dump(pipeline, model_path)
-
-    # Define input/output schema
-    input_schema = Schema(features)
-    output_schema = Schema(targets)
-    model_schema = ModelSchema(input_schema=input_schema, output_schema=output_schema)
-
-    # Register model in Hopsworks
-    project = get_hopsworks_project()
-    model_registry = project.get_model_registry()
-
-    model = model_registry.sklearn.create_model(
-        name=model_name,
-        metrics={"test_mae": test_mae},
-        input_example=features.sample(),
-        model_schema=model_schema,
-        description="Citi Bike Demand Prediction Model"
+    export_dir = export_dir_for(model_path)
+    writes_pickle = mode == "full" and training_source == "feature_store"
+    if writes_pickle:
+        joblib.dump(model, model_path)
+        spec.save(spec_path_for(model_path))
+
+    # Native booster + JSON spec for the lean inference loader (incremental
+    # and partition runs only produce this; the pickle stays with the last
+    # full feature-store retrain)
+    export_model(model, export_dir, feature_spec=spec.to_dict())
+
+    # Watermark and schedule for the next run
+    TrainingState(
+        watermark=str(pd.to_datetime(trained_until, utc=True).max()),
+        last_full_retrain=str(now) if mode == "full" else previous_state.last_full_retrain,
+        baseline_mae=test_mae,
+        mode=mode,
+        params=TRAINING_PARAMS,
+        best_iteration=int(best_iteration),
+        train_seconds=round(train_seconds, 1),
+    ).save(export_dir)
+
+    # Register model (Hopsworks, or the local store with STORAGE_BACKEND=local)
+    registered_model = get_backend().register_model(
+        model_name,
+        # The pickle, its feature spec and the native export together; runs
+        # without a pickle register the export only, not a stale pickle
+        model_dir if writes_pickle else export_dir,
+        metrics={
+            "test_mae": test_mae,
+            "best_iteration": int(best_iteration),
+            "train_seconds": round(train_seconds, 1),
+            "holdout_hours": holdout_hours,
+            "feature_spec_version": spec.version,
+        },
+        description=(
+            f"Citi Bike Demand Prediction Model ({mode} training); test_mae is the "
+            + ("early-stopped model's holdout MAE, the registered model is its refit on all rows" if refit else "holdout MAE")
+        ),
+        features=features,
+        targets=targets,
     )
-    model.save(model_path)
 
-    print(f"✅ Model registered successfully!")
+    print(f"✅ Model registered successfully as version {registered_model.version}!")
 
 else:
     print(f"⚠️ Skipping model registration. New model not better.")
@@ -0,0 +1,118 @@
+# src/parallel_util.py (FOR CITI BIKE PROJECT)
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource  # POSIX only
+except ImportError:
+    resource = None
+
+# ==============================
+# 💾 Atomic File Writes
+# ==============================
+
+@contextmanager
+def atomic_output_path(output_file):
+    """
+    Yield a temporary path next to ``output_file`` and move it into place
+    only if the block finishes without raising.
+
+    Readers never see a half-written file: either the previous version or
+    the complete new one. If nothing was written to the temporary path the
+    existing output is left untouched.
+    """
+    output_file = Path(output_file)
+    tmp_path = output_file.with_name(f".{output_file.name}.{os.getpid()}.tmp")
+
+    try:
+        yield tmp_path
+        if tmp_path.exists():
+            os.replace(tmp_path, output_file)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+# ==============================
+# 🚀 Month-Level Process Pool
+# ==============================
+
+def _limit_worker_memory(memory_limit_mb):
+    """
+    Cap the address space of a pool worker (no-op where unsupported).
+
+    ``RLIMIT_AS`` counts virtual memory, which pyarrow and numpy reserve
+    well beyond what they touch, so the cap is opt-in and has to be
+    generous (several GB); a tight one fails months that would fit in RAM.
+    """
+    if memory_limit_mb and resource is not None:
+        limit = int(memory_limit_mb) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def _timed_call(func, args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def run_monthly_tasks(func, tasks: dict, max_workers: int = 1, memory_limit_mb: int = None) -> dict:
+    """
+    Run ``func(*args)`` for every ``{month_key: args}`` entry in ``tasks``.
+
+    Parameters
+    ----------
+    func : callable
+        Module-level function (it must be picklable to reach the workers).
+    tasks : dict
+        Mapping of month key (e.g. ``"2024_01"``) to the positional args tuple.
+    max_workers : int
+        Number of worker processes. ``1`` runs everything inline.
+    memory_limit_mb : int, optional
+        Opt-in per-worker address-space cap in MB (see
+        ``_limit_worker_memory``; keep it generous). A month exceeding it
+        fails with ``MemoryError`` instead of taking the whole job down.
+        None (default) sets no cap.
+
+    Returns
+    -------
+    dict
+        ``{month_key: {"result": ..., "seconds": float, "error": str | None}}``
+    """
+    report = {}
+
+    def _record(key, result=None, seconds=0.0, error=None):
+        report[key] = {"result": result, "seconds": seconds, "error": error}
+        if error:
+            print(f"❌ {key} failed after {seconds:.1f}s: {error}")
+        else:
+            print(f"⏱️ {key} finished in {seconds:.1f}s")
+
+    if max_workers is None or max_workers <= 1:
+        for key, args in tasks.items():
+            start = time.perf_counter()
+            try:
+                result, seconds = _timed_call(func, args)
+                _record(key, result, seconds)
+            except Exception as e:
+                _record(key, seconds=time.perf_counter() - start, error=repr(e))
+        return report
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=min(max_workers, len(tasks)) or 1,
+        initializer=_limit_worker_memory,
+        initargs=(memory_limit_mb,),
+    ) as executor:
+        futures = {executor.submit(_timed_call, func, args): key for key, args in tasks.items()}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                result, seconds = future.result()
+                _record(key, result, seconds)
+            except Exception as e:
+                _record(key, seconds=time.perf_counter() - start, error=repr(e))
+
+    print(f"🏁 {len(tasks)} months processed in {time.perf_counter() - start:.1f}s with {max_workers} workers")
+    return {key: report[key] for key in tasks}
@@ -0,0 +1,148 @@
+# src/partitioned_dataset.py (FOR CITI BIKE PROJECT)
+
+from pathlib import Path
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from src.feature_spec import DEFAULT_FEATURE_SPEC, FeatureSpec
+
+# Default output of utils.build_final_features
+FINAL_FEATURES_DIR = Path(__file__).resolve().parent.parent / "data" / "processed" / "final_features"
+
+# ==============================
+# 📚 Parquet Row-Group Sequence
+# ==============================
+
+class ParquetFeatureSequence(lgb.Sequence):
+    """
+    The spec's feature columns of one Parquet file, exposed to LightGBM as
+    a ``Sequence`` and decoded one row group at a time (float64, which
+    LightGBM's sampling requires).
+
+    LightGBM reads it twice: a monotonic random sample for the bin
+    boundaries, then ``batch_size`` slices to push rows into the bins. The
+    last decoded row group is kept, so each pass decodes every row group
+    once and never holds more than one of them.
+    """
+
+    def __init__(self, path, spec: FeatureSpec = DEFAULT_FEATURE_SPEC, rows: np.ndarray = None):
+        self.path = Path(path)
+        self.columns = spec.feature_columns()
+        self.parquet_file = pq.ParquetFile(self.path)
+
+        metadata = self.parquet_file.metadata
+        group_sizes = [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+        self.group_starts = np.concatenate([[0], np.cumsum(group_sizes)]).astype(np.int64)
+
+        # Positions (in file order) of the rows this sequence exposes
+        self.rows = np.arange(self.group_starts[-1]) if rows is None else np.asarray(rows, dtype=np.int64)
+        self.batch_size = max(group_sizes) if group_sizes else 4096
+
+        self._cached_group = None
+        self._cached_matrix = None
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _row_group_matrix(self, group: int) -> np.ndarray:
+        if group != self._cached_group:
+            table = self.parquet_file.read_row_group(group, columns=self.columns)
+            matrix = np.empty((table.num_rows, len(self.columns)), dtype=np.float64)
+            for j, column in enumerate(self.columns):
+                matrix[:, j] = table.column(column).to_numpy()
+            self._cached_group, self._cached_matrix = group, matrix
+        return self._cached_matrix
+
+    def _take(self, file_rows: np.ndarray) -> np.ndarray:
+        groups = np.searchsorted(self.group_starts, file_rows, side="right") - 1
+        out = np.empty((len(file_rows), len(self.columns)), dtype=np.float64)
+        for group in np.unique(groups):
+            mask = groups == group
+            out[mask] = self._row_group_matrix(group)[file_rows[mask] - self.group_starts[group]]
+        return out
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self._take(self.rows[idx])
+        return self._take(self.rows[[idx]])[0]
+
+# ==============================
+# 🏗 Two-Pass Dataset Builder
+# ==============================
+
+def partition_files(root) -> list:
+    """Parquet files under a ``build_final_features`` output directory, in path order."""
+    return sorted(path for path in Path(root).rglob("*.parquet") if not path.name.startswith((".", "_")))
+
+def _bound(value, arrow_type) -> pa.Scalar:
+    """``value`` as a scalar comparable with a timestamp column (naive = column's timezone)."""
+    value = pd.Timestamp(value)
+    if arrow_type.tz is not None and value.tzinfo is None:
+        value = value.tz_localize(arrow_type.tz)
+    elif arrow_type.tz is None and value.tzinfo is not None:
+        value = value.tz_localize(None)
+    return pa.scalar(value, type=arrow_type)
+
+def build_partitioned_dataset(
+    root,
+    spec: FeatureSpec = DEFAULT_FEATURE_SPEC,
+    start=None,
+    end=None,
+    params: dict = None,
+    reference: lgb.Dataset = None,
+) -> lgb.Dataset:
+    """
+    Binned ``lgb.Dataset`` over the partitions under ``root`` without ever
+    loading them as one frame.
+
+    Only ``hour_ts`` and the target are read up front (to select rows in
+    ``[start, end)`` and build the label vector); features stream in via
+    ``ParquetFeatureSequence``. Pass ``reference`` for a validation set
+    that reuses the training bins.
+    """
+    params = {"verbose": -1, **(params or {})}
+    sequences, labels = [], []
+
+    for path in partition_files(root):
+        table = pq.read_table(path, columns=[spec.time_col, spec.target_col])
+        keep = pc.is_valid(table.column(spec.target_col))
+        hour_ts = table.column(spec.time_col)
+        if start is not None:
+            keep = pc.and_(keep, pc.greater_equal(hour_ts, _bound(start, hour_ts.type)))
+        if end is not None:
+            keep = pc.and_(keep, pc.less(hour_ts, _bound(end, hour_ts.type)))
+
+        rows = np.flatnonzero(keep.to_numpy(zero_copy_only=False))
+        if len(rows) == 0:
+            continue
+
+        sequences.append(ParquetFeatureSequence(path, spec, rows))
+        labels.append(table.column(spec.target_col).to_numpy()[rows].astype(np.float32))
+
+    if not sequences:
+        raise ValueError(f"No rows with a target between {start} and {end} under {root}")
+
+    dataset = lgb.Dataset(
+        sequences,
+        label=np.concatenate(labels),
+        feature_name=spec.feature_columns(),
+        params=params,
+        reference=reference,
+        free_raw_data=True,
+    )
+    return dataset.construct()
+
+def latest_hour(root, spec: FeatureSpec = DEFAULT_FEATURE_SPEC) -> pd.Timestamp:
+    """Last ``hour_ts`` with a target under ``root`` (reads one column per file)."""
+    latest = None
+    for path in partition_files(root):
+        hour_ts = pq.read_table(path, columns=[spec.time_col]).column(spec.time_col)
+        file_max = pc.max(hour_ts).as_py()
+        if file_max is not None and (latest is None or file_max > latest):
+            latest = file_max
+    return pd.Timestamp(latest) if latest is not None else None
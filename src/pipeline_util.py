@@ -1,10 +1,37 @@
 # src/pipeline_util.py (FOR CITI BIKE PROJECT)
 
 import lightgbm as lgb
+import numpy as np
 import pandas as pd
 from sklearn.pipeline import make_pipeline
 from sklearn.base import BaseEstimator, TransformerMixin
-from sklearn.preprocessing import FunctionTransformer
+
+from src.temporal_util import temporal_features
+
+MANUAL_TEMPORAL_COLUMNS = ["day", "week_of_year", "quarter", "is_start_of_month", "is_end_of_month"]
+
+# All transformers below take a shallow copy (``copy(deep=False)``) and only
+# add or delete whole columns on it, so the caller's frame is untouched and
+# the wide lag block is shared instead of copied. ``set_output(transform=
+# "pandas")`` works because every step reports ``get_feature_names_out``.
+
+def _local_wall_ns(hour_ts: pd.Series) -> np.ndarray:
+    """``hour_ts`` as int64 nanoseconds of local wall time (naive values read as UTC)."""
+    if not pd.api.types.is_datetime64_any_dtype(hour_ts):
+        hour_ts = pd.to_datetime(hour_ts, utc=True)
+    if hour_ts.dt.tz is not None:
+        hour_ts = hour_ts.dt.tz_localize(None)
+    return hour_ts.to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+def _input_feature_names(estimator, input_features):
+    if input_features is not None:
+        return np.asarray(input_features, dtype=object)
+    return np.asarray(getattr(estimator, "feature_names_in_", []), dtype=object)
+
+def _record_input_features(estimator, X):
+    if hasattr(X, "columns"):
+        estimator.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        estimator.n_features_in_ = len(X.columns)
 
 # ==============================
 # ✨ Manual Temporal Feature Engineering
@@ -13,25 +40,37 @@ from sklearn.preprocessing import FunctionTransformer
 def manual_temporal_features(X: pd.DataFrame) -> pd.DataFrame:
     """
     Add manual temporal features to Citi Bike timeseries data.
-    Assumes 'hour_ts' exists in X.
+    Assumes 'hour_ts' exists in X; computed with integer date arithmetic.
     """
-    X = X.copy()
-
-    if "hour_ts" in X.columns:
-        # ✅ Safe check for datetime type (works with timezone-aware datetime too)
-        if not pd.api.types.is_datetime64_any_dtype(X["hour_ts"]):
-            X["hour_ts"] = pd.to_datetime(X["hour_ts"], utc=True)
+    if "hour_ts" not in X.columns:
+        return X
 
-        X["day"] = X["hour_ts"].dt.day
-        X["week_of_year"] = X["hour_ts"].dt.isocalendar().week
-        X["quarter"] = X["hour_ts"].dt.quarter
-        X["is_start_of_month"] = (X["hour_ts"].dt.is_month_start).astype(int)
-        X["is_end_of_month"] = (X["hour_ts"].dt.is_month_end).astype(int)
+    X = X.copy(deep=False)
+    for name, values in temporal_features(_local_wall_ns(X["hour_ts"]), MANUAL_TEMPORAL_COLUMNS).items():
+        X[name] = values
 
     return X
 
-# ✅ Wrap into FunctionTransformer
-add_manual_temporal_features = FunctionTransformer(manual_temporal_features, validate=False)
+class TemporalFeaturesTransformer(BaseEstimator, TransformerMixin):
+    """
+    Pipeline step for ``manual_temporal_features``.
+    """
+
+    def fit(self, X, y=None):
+        _record_input_features(self, X)
+        return self
+
+    def transform(self, X, y=None):
+        return manual_temporal_features(X)
+
+    def get_feature_names_out(self, input_features=None):
+        names = _input_feature_names(self, input_features)
+        if "hour_ts" not in names:
+            return names
+        return np.concatenate([names, [col for col in MANUAL_TEMPORAL_COLUMNS if col not in names]]).astype(object)
+
+# ✅ Instantiate
+add_manual_temporal_features = TemporalFeaturesTransformer()
 
 # ==============================
 # 🛠 Drop Unnecessary Columns
@@ -43,14 +82,28 @@ class DropColumnsTransformer(BaseEstimator, TransformerMixin):
     """
 
     def __init__(self, columns_to_drop=None):
-        self.columns_to_drop = columns_to_drop or ["hour_ts", "start_station_name", "time_of_day"]
+        self.columns_to_drop = columns_to_drop
+
+    def _columns_to_drop(self):
+        return self.columns_to_drop or ["hour_ts", "start_station_name", "time_of_day"]
 
     def fit(self, X, y=None):
+        _record_input_features(self, X)
         return self
 
     def transform(self, X, y=None):
-        X = X.copy()
-        return X.drop(columns=self.columns_to_drop, errors="ignore")
+        present = [col for col in self._columns_to_drop() if col in X.columns]
+        if not present:
+            return X
+
+        X = X.copy(deep=False)
+        for col in present:
+            del X[col]
+        return X
+
+    def get_feature_names_out(self, input_features=None):
+        names = _input_feature_names(self, input_features)
+        return np.asarray([name for name in names if name not in self._columns_to_drop()], dtype=object)
 
 # ✅ Instantiate
 drop_unnecessary_columns = DropColumnsTransformer()
@@ -74,8 +127,8 @@ def get_pipeline(**hyper_params):
     sklearn.pipeline.Pipeline
     """
     pipeline = make_pipeline(
-        add_manual_temporal_features,
-        drop_unnecessary_columns,
+        TemporalFeaturesTransformer(),
+        DropColumnsTransformer(),
         lgb.LGBMRegressor(**hyper_params)
     )
     return pipeline
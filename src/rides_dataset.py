@@ -0,0 +1,199 @@
+# src/rides_dataset.py (FOR CITI BIKE PROJECT)
+
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from src.parallel_util import atomic_output_path
+from src.trip_schema import TRIP_SCHEMA
+
+# ==============================
+# 🗂 Partitioned Layout
+# ==============================
+#
+#   <root>/year=2024/month=1/station_bucket=7/part-rides_2024_01.parquet
+#
+# Every source month writes its own ``part-<month>.parquet`` files, so
+# re-validating one month replaces exactly its parts and nothing else.
+
+STATION_BUCKETS = 16
+ROW_GROUP_SIZE = 64_000  # about a week of rides for a busy station bucket
+TIMEZONE = "America/New_York"
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("year", pa.int16()), ("month", pa.int8()), ("station_bucket", pa.int16())]),
+    flavor="hive",
+)
+
+# Trip columns the cleaner keeps (clean_validate_data reads only these)
+VALIDATED_TRIP_COLUMNS = [
+    "start_station_id", "start_station_name", "start_lat", "start_lng",
+    "end_station_id", "end_station_name", "end_lat", "end_lng",
+    "started_at", "ended_at",
+]
+
+# Columns of a read from a root without any partitions, as validated months
+# carry them: the kept trip columns (timestamps in New York time) plus the
+# derived trip duration
+EMPTY_RIDES_SCHEMA = pa.schema(
+    [
+        field.with_type(pa.timestamp(field.type.unit, tz=TIMEZONE)) if pa.types.is_timestamp(field.type) else field
+        for field in (TRIP_SCHEMA.field(name) for name in VALIDATED_TRIP_COLUMNS)
+    ]
+    + [pa.field("duration_min", pa.float64())]
+)
+
+def station_bucket(station_ids, n_buckets: int = STATION_BUCKETS) -> np.ndarray:
+    """
+    Stable bucket number for each station id (crc32, so it never changes
+    between runs or machines, unlike Python's ``hash``).
+    """
+    codes, uniques = pd.factorize(pd.Series(station_ids).astype(str), sort=False)
+    unique_buckets = np.fromiter(
+        (zlib.crc32(station_id.encode()) % n_buckets for station_id in uniques),
+        dtype=np.int16,
+        count=len(uniques),
+    )
+    return unique_buckets[codes]
+
+def _with_uniform_dictionaries(table: pa.Table) -> pa.Table:
+    """
+    pandas picks int8/int16 dictionary indices depending on the number of
+    categories; cast them all to int32 so every fragment shares one schema.
+    """
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type) and field.type.index_type != pa.int32():
+            uniform = pa.dictionary(pa.int32(), field.type.value_type)
+            table = table.set_column(i, field.with_type(uniform), table.column(i).cast(uniform))
+    return table
+
+def write_partitioned_month(df: pd.DataFrame, root, month_key: str, row_group_size: int = ROW_GROUP_SIZE) -> list:
+    """
+    Write one cleaned month under ``root`` partitioned by year/month (of
+    ``started_at``) and station bucket. Rows are sorted by ``started_at`` so
+    row-group min/max statistics can prune time-range reads.
+
+    Returns the list of files written.
+    """
+    root = Path(root)
+    part_name = f"part-{month_key}.parquet"
+
+    # Drop this month's parts from a previous run before writing new ones
+    for stale in root.glob(f"year=*/month=*/station_bucket=*/{part_name}"):
+        stale.unlink()
+
+    if df.empty:
+        return []
+
+    df = df.sort_values("started_at", kind="stable")
+    started_at = df["started_at"]
+    partition_keys = pd.DataFrame({
+        "year": started_at.dt.year.to_numpy(),
+        "month": started_at.dt.month.to_numpy(),
+        "station_bucket": station_bucket(df["start_station_id"]),
+    }, index=df.index)
+
+    written = []
+    for (year, month, bucket), index in partition_keys.groupby(["year", "month", "station_bucket"], sort=True).groups.items():
+        partition_dir = root / f"year={year}" / f"month={month}" / f"station_bucket={bucket}"
+        partition_dir.mkdir(parents=True, exist_ok=True)
+
+        table = _with_uniform_dictionaries(pa.Table.from_pandas(df.loc[index], preserve_index=False))
+        output_file = partition_dir / part_name
+        with atomic_output_path(output_file) as tmp_file:
+            pq.write_table(table, tmp_file, row_group_size=row_group_size, write_statistics=True)
+        written.append(output_file)
+
+    return written
+
+# ==============================
+# 🔎 Reader
+# ==============================
+
+def _to_local_timestamp(value) -> pd.Timestamp:
+    value = pd.Timestamp(value)
+    if value.tzinfo is None:
+        return value.tz_localize(TIMEZONE)
+    return value.tz_convert(TIMEZONE)
+
+def _month_range(start: pd.Timestamp, end: pd.Timestamp) -> list:
+    months = pd.period_range(start.tz_localize(None).to_period("M"), end.tz_localize(None).to_period("M"), freq="M")
+    return [(period.year, period.month) for period in months]
+
+def read_validated_rides(
+    root,
+    station_ids: list = None,
+    start=None,
+    end=None,
+    columns: list = None,
+) -> pd.DataFrame:
+    """
+    Read rides from a partitioned validated dataset, touching only the
+    fragments that can match.
+
+    Parameters
+    ----------
+    root : str or Path
+        Root directory written by ``write_partitioned_month``.
+    station_ids : list, optional
+        Keep only these ``start_station_id`` values (prunes station buckets).
+    start, end : datetime-like, optional
+        Half-open ``[start, end)`` range on ``started_at``. Naive values are
+        taken as New York time. Prunes year/month partitions and row groups.
+    columns : list, optional
+        Columns to return (default: all data columns).
+
+    Returns
+    -------
+    pd.DataFrame
+        Matching rides sorted by ``started_at``. Empty, with the columns of
+        ``EMPTY_RIDES_SCHEMA``, if ``root`` has no partitions yet.
+    """
+    dataset = ds.dataset(root, format="parquet", partitioning=PARTITIONING) if Path(root).exists() else None
+    if dataset is None or not dataset.files:
+        names = EMPTY_RIDES_SCHEMA.names if columns is None else [name for name in columns if name in EMPTY_RIDES_SCHEMA.names]
+        return EMPTY_RIDES_SCHEMA.empty_table().select(names).to_pandas()
+
+    expression = None
+
+    def _and(condition):
+        return condition if expression is None else expression & condition
+
+    if station_ids is not None:
+        station_ids = [str(station_id) for station_id in station_ids]
+        buckets = sorted(set(station_bucket(station_ids).tolist()))
+        expression = _and(ds.field("station_bucket").isin(buckets))
+        expression = _and(ds.field("start_station_id").isin(station_ids))
+
+    if start is not None or end is not None:
+        start = _to_local_timestamp(start) if start is not None else None
+        end = _to_local_timestamp(end) if end is not None else None
+
+        if start is not None and end is not None:
+            month_filter = None
+            for year, month in _month_range(start, end):
+                condition = (ds.field("year") == year) & (ds.field("month") == month)
+                month_filter = condition if month_filter is None else month_filter | condition
+            expression = _and(month_filter)
+
+        started_at_type = dataset.schema.field("started_at").type
+        if start is not None:
+            expression = _and(ds.field("started_at") >= pa.scalar(start, type=started_at_type))
+        if end is not None:
+            expression = _and(ds.field("started_at") < pa.scalar(end, type=started_at_type))
+
+    if columns is None:
+        columns = [name for name in dataset.schema.names if name not in PARTITIONING.schema.names]
+
+    table = dataset.to_table(columns=columns, filter=expression)
+    df = table.to_pandas()
+
+    if "started_at" in df.columns:
+        df = df.sort_values("started_at", kind="stable").reset_index(drop=True)
+
+    return df
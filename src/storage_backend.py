@@ -0,0 +1,513 @@
+# src/storage_backend.py (FOR CITI BIKE PROJECT)
+
+import functools
+import importlib
+import json
+import operator
+import os
+import shutil
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+
+import src.config as config
+from src.parallel_util import atomic_output_path
+
+# hopsworks and hsml are imported where they are used, so the local
+# backend runs (and CI benchmarks) without them installed.
+
+LOCAL_STORE_DIR = Path(__file__).resolve().parent.parent / "data" / "local_store"
+SESSION_TTL = timedelta(hours=1)  # log in again after this, dropping every cached handle
+
+TIME_COL = "hour_ts"
+STATION_COL = "start_station_id"
+PARTITION_COL = "year_month"
+
+@dataclass
+class RegisteredModel:
+    """One version of a registered model, whichever backend holds it."""
+
+    name: str
+    version: int
+    metrics: dict = field(default_factory=dict)
+
+def _scalar(value):
+    """numpy scalars (e.g. from a DataFrame lookup) as plain Python values for a filter."""
+    return value.item() if isinstance(value, np.generic) else value
+
+def _selected_columns(columns) -> list:
+    """``columns`` plus the key columns every read keeps, or None for all."""
+    return None if columns is None else list(dict.fromkeys([TIME_COL, STATION_COL, *columns]))
+
+# ===============================
+# 🧩 Backend Interface
+# ===============================
+
+class StorageBackend(ABC):
+    """
+    Everything the pipelines read and write: feature groups, feature views,
+    predictions and a model registry.
+
+    ``read_feature_group`` takes the time range, station list and column
+    list the caller needs and pushes them down to the store. ``remote``
+    backends pay a network round trip per read; ``CachedFeatureView`` is
+    meant for them.
+    """
+
+    remote = True
+
+    @abstractmethod
+    def read_feature_group(self, name: str, version: int = 1, start=None, end=None, stations=None, columns=None) -> pd.DataFrame:
+        """
+        Rows with ``start <= hour_ts < end`` for ``stations``, with only
+        ``columns`` (``hour_ts`` and ``start_station_id`` always come
+        along). ``None`` means no restriction.
+        """
+
+    @abstractmethod
+    def insert_feature_group(self, name: str, df: pd.DataFrame, version: int = 1):
+        """Append ``df`` to a feature group."""
+
+    @abstractmethod
+    def feature_view(self, name: str, version: int = 1):
+        """A feature view: anything with ``get_batch_data(start_time=None, end_time=None)``."""
+
+    @abstractmethod
+    def latest_model(self, name: str) -> RegisteredModel:
+        """Highest registered version of ``name``, or None."""
+
+    @abstractmethod
+    def download_model(self, name: str, version: int = None) -> Path:
+        """Local directory with the files of a registered version (default: latest), or None."""
+
+    @abstractmethod
+    def register_model(
+        self,
+        name: str,
+        model_dir,
+        metrics: dict,
+        description: str = "",
+        features: pd.DataFrame = None,
+        targets: pd.Series = None,
+    ) -> RegisteredModel:
+        """Register the files in ``model_dir`` as a new version, with the training frame's schema."""
+
+    # Predictions are a feature group on every backend
+
+    def read_predictions(self, start=None, end=None, stations=None, columns=None) -> pd.DataFrame:
+        return self.read_feature_group(config.FEATURE_GROUP_MODEL_PREDICTION, 1, start, end, stations, columns)
+
+    def insert_predictions(self, df: pd.DataFrame):
+        self.insert_feature_group(config.FEATURE_GROUP_MODEL_PREDICTION, df, version=1)
+
+# ===============================
+# 🔌 Hopsworks Session
+# ===============================
+
+class HopsworksSession:
+    """
+    Process-wide Hopsworks connection: logs in once and caches the project,
+    feature store, feature group, feature view and model registry handles
+    it hands out. All of them are dropped together once the login is older
+    than ``ttl`` or after ``reset()``; the next call logs in again.
+    """
+
+    def __init__(self, ttl: timedelta = SESSION_TTL):
+        self.ttl = ttl
+        self._handles = {}
+        self._logged_in_at = None
+        self._lock = threading.RLock()
+
+    def reset(self):
+        with self._lock:
+            self._handles.clear()
+            self._logged_in_at = None
+
+    def _handle(self, key, factory):
+        with self._lock:
+            if self._logged_in_at is not None and time.monotonic() - self._logged_in_at > self.ttl.total_seconds():
+                print("🔌 Hopsworks session expired. Logging in again...")
+                self.reset()
+            if key not in self._handles:
+                self._handles[key] = factory()
+            return self._handles[key]
+
+    def _login(self):
+        import hopsworks
+
+        project = hopsworks.login(
+            project=config.HOPSWORKS_PROJECT_NAME,
+            api_key_value=config.HOPSWORKS_API_KEY
+        )
+        self._logged_in_at = time.monotonic()
+        return project
+
+    def project(self):
+        return self._handle("project", self._login)
+
+    def feature_store(self):
+        return self._handle("feature_store", lambda: self.project().get_feature_store())
+
+    def model_registry(self):
+        return self._handle("model_registry", lambda: self.project().get_model_registry())
+
+    def feature_group(self, name: str, version: int = 1):
+        return self._handle(
+            ("feature_group", name, version),
+            lambda: self.feature_store().get_feature_group(name=name, version=version),
+        )
+
+    def feature_view(self, name: str, version: int = 1):
+        return self._handle(
+            ("feature_view", name, version),
+            lambda: self.feature_store().get_feature_view(name=name, version=version),
+        )
+
+_SESSION = HopsworksSession()
+
+def get_session() -> HopsworksSession:
+    return _SESSION
+
+# Modules where the Hopsworks client libraries define RestAPIError
+REST_API_ERROR_MODULES = (
+    "hopsworks_common.client.exceptions",
+    "hopsworks.client.exceptions",
+    "hsfs.client.exceptions",
+    "hsml.client.exceptions",
+)
+AUTH_ERROR_STATUS_CODES = (401, 403)
+
+def _is_reconnectable(error: Exception) -> bool:
+    """
+    Whether a fresh session can fix ``error``: a dropped connection or
+    timeout, or a REST call rejected for authentication (expired token).
+    Anything else (bad arguments, missing feature groups, ...) would fail
+    again the same way.
+    """
+    import requests
+
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+
+    for module_name in REST_API_ERROR_MODULES:
+        try:
+            rest_api_error = importlib.import_module(module_name).RestAPIError
+        except (ImportError, AttributeError):
+            continue
+        if isinstance(error, rest_api_error):
+            return getattr(getattr(error, "response", None), "status_code", None) in AUTH_ERROR_STATUS_CODES
+    return False
+
+def _reconnecting(func):
+    """Retry ``func`` once on a fresh session after a connection or authentication error."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if not _is_reconnectable(e):
+                raise
+            print(f"⚠️ Hopsworks call failed ({e}). Reconnecting and retrying once...")
+            get_session().reset()
+            return func(*args, **kwargs)
+    return wrapper
+
+# ===============================
+# ☁️ Hopsworks Backend
+# ===============================
+
+class HopsworksBackend(StorageBackend):
+    """Hopsworks feature store and model registry, through the shared ``HopsworksSession``."""
+
+    def __init__(self, session: HopsworksSession = None):
+        self.session = session or get_session()
+
+    @_reconnecting
+    def read_feature_group(self, name: str, version: int = 1, start=None, end=None, stations=None, columns=None) -> pd.DataFrame:
+        fg = self.session.feature_group(name, version=version)
+
+        selected = _selected_columns(columns)
+        query = fg.select_all() if selected is None else fg.select(selected)
+
+        conditions = []
+        if start is not None:
+            conditions.append(fg.get_feature(TIME_COL) >= start)
+        if end is not None:
+            conditions.append(fg.get_feature(TIME_COL) < end)
+        if stations is not None:
+            conditions.append(fg.get_feature(STATION_COL).isin([_scalar(station) for station in stations]))
+
+        if conditions:
+            query = query.filter(functools.reduce(operator.and_, conditions))
+        return query.read()
+
+    def insert_feature_group(self, name: str, df: pd.DataFrame, version: int = 1):
+        self.session.feature_group(name, version=version).insert(df, write_options={"wait_for_job": False})
+
+    def feature_view(self, name: str, version: int = 1):
+        return self.session.feature_view(name, version)
+
+    @_reconnecting
+    def _registered_versions(self, name: str) -> list:
+        return self.session.model_registry().get_models(name=name) or []
+
+    def latest_model(self, name: str) -> RegisteredModel:
+        models = self._registered_versions(name)
+        if not models:
+            return None
+        model = max(models, key=lambda model: model.version)
+        return RegisteredModel(name, model.version, dict(model.training_metrics or {}))
+
+    def download_model(self, name: str, version: int = None) -> Path:
+        models = self._registered_versions(name)
+        if version is not None:
+            models = [model for model in models if model.version == version]
+        if not models:
+            return None
+        return Path(max(models, key=lambda model: model.version).download())
+
+    def register_model(
+        self,
+        name: str,
+        model_dir,
+        metrics: dict,
+        description: str = "",
+        features: pd.DataFrame = None,
+        targets: pd.Series = None,
+    ) -> RegisteredModel:
+        from hsml.model_schema import ModelSchema
+        from hsml.schema import Schema
+
+        model_schema = None
+        if features is not None and targets is not None:
+            model_schema = ModelSchema(input_schema=Schema(features), output_schema=Schema(targets))
+
+        registered_model = self.session.model_registry().sklearn.create_model(
+            name=name,
+            metrics=metrics,
+            input_example=features.sample() if features is not None else None,
+            model_schema=model_schema,
+            description=description,
+        )
+        registered_model.save(str(model_dir))
+        return RegisteredModel(name, registered_model.version, metrics)
+
+# ===============================
+# 💾 Local Backend
+# ===============================
+
+def _utc(value) -> pd.Timestamp:
+    """``value`` as a UTC Timestamp (naive values are taken as UTC)."""
+    value = pd.Timestamp(value)
+    return value.tz_localize("UTC") if value.tzinfo is None else value.tz_convert("UTC")
+
+def _station_value_set(stations, arrow_type) -> pa.Array:
+    """
+    ``stations`` cast to the stored station column's type, so ``"1"`` finds
+    an int64 ``1`` (and ``1`` a string ``"1"``), as a Hopsworks filter does.
+    """
+    if pa.types.is_dictionary(arrow_type):
+        arrow_type = arrow_type.value_type
+    values = pa.array([_scalar(station) for station in stations])
+    try:
+        return values.cast(arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+        raise ValueError(f"❌ Station ids {list(stations)[:5]} do not match the stored {STATION_COL} type {arrow_type}: {e}") from e
+
+def _timestamp_scalar(value: pd.Timestamp, arrow_type) -> pa.Scalar:
+    """A UTC Timestamp as a scalar comparable with a timestamp column (naive columns hold UTC)."""
+    if arrow_type.tz is None:
+        value = value.tz_localize(None)
+    return pa.scalar(value, type=arrow_type)
+
+class LocalFeatureGroupView:
+    """Local feature view: a column selection over one local feature group."""
+
+    def __init__(self, backend: "LocalBackend", feature_group: str, feature_group_version: int = 1, columns=None):
+        self.backend = backend
+        self.feature_group = feature_group
+        self.feature_group_version = feature_group_version
+        self.columns = columns
+
+    def get_batch_data(self, start_time=None, end_time=None, **kwargs) -> pd.DataFrame:
+        return self.backend.read_feature_group(
+            self.feature_group, self.feature_group_version, start=start_time, end=end_time, columns=self.columns
+        )
+
+class LocalBackend(StorageBackend):
+    """
+    Single-node backend on local files under ``root``, for offline
+    development, CI benchmarks and low-latency single-machine serving.
+
+    Feature groups are hive-partitioned Parquet,
+    ``feature_groups/<name>_v<version>/year_month=YYYY-MM/part-*.parquet``
+    (UTC months of ``hour_ts``). Reads are memory-mapped Arrow datasets:
+    time bounds prune partitions and row groups, station lists filter
+    during the scan, and unselected columns are never decoded. Feature
+    views are JSON definitions over a feature group (``create_feature_view``);
+    registered models are version directories under ``models/<name>/``.
+    """
+
+    remote = False
+
+    def __init__(self, root=LOCAL_STORE_DIR):
+        self.root = Path(root)
+        self._filesystem = pafs.LocalFileSystem(use_mmap=True)
+
+    # ---------- feature groups ----------
+
+    def _group_dir(self, name: str, version: int) -> Path:
+        return self.root / "feature_groups" / f"{name}_v{version}"
+
+    def insert_feature_group(self, name: str, df: pd.DataFrame, version: int = 1):
+        group_dir = self._group_dir(name, version)
+        part_name = f"part-{uuid.uuid4().hex}.parquet"
+
+        months = pd.to_datetime(df[TIME_COL], utc=True).dt.strftime("%Y-%m")
+        for month, index in df.groupby(months.to_numpy(), sort=True).groups.items():
+            partition_dir = group_dir / f"{PARTITION_COL}={month}"
+            partition_dir.mkdir(parents=True, exist_ok=True)
+            with atomic_output_path(partition_dir / part_name) as tmp_file:
+                df.loc[index].to_parquet(tmp_file, index=False)
+
+    def read_feature_group(self, name: str, version: int = 1, start=None, end=None, stations=None, columns=None) -> pd.DataFrame:
+        group_dir = self._group_dir(name, version)
+        if not group_dir.exists():
+            raise FileNotFoundError(f"❌ No local feature group '{name}' v{version} under {self.root}")
+
+        dataset = ds.dataset(str(group_dir), format="parquet", partitioning="hive", filesystem=self._filesystem)
+        schema = dataset.schema
+
+        conditions = []
+        if start is not None:
+            start = _utc(start)
+            conditions.append(ds.field(PARTITION_COL) >= start.strftime("%Y-%m"))
+            conditions.append(ds.field(TIME_COL) >= _timestamp_scalar(start, schema.field(TIME_COL).type))
+        if end is not None:
+            end = _utc(end)
+            conditions.append(ds.field(PARTITION_COL) <= end.strftime("%Y-%m"))
+            conditions.append(ds.field(TIME_COL) < _timestamp_scalar(end, schema.field(TIME_COL).type))
+        if stations is not None:
+            conditions.append(ds.field(STATION_COL).isin(_station_value_set(stations, schema.field(STATION_COL).type)))
+
+        selected = _selected_columns(columns)
+        if selected is None:
+            selected = [column for column in schema.names if column != PARTITION_COL]
+
+        table = dataset.to_table(
+            columns=selected,
+            filter=functools.reduce(operator.and_, conditions) if conditions else None,
+        )
+        return table.to_pandas()
+
+    # ---------- feature views ----------
+
+    def _view_file(self, name: str, version: int) -> Path:
+        return self.root / "feature_views" / f"{name}_v{version}.json"
+
+    def create_feature_view(self, name: str, version: int, feature_group: str, feature_group_version: int = 1, columns=None):
+        view_file = self._view_file(name, version)
+        view_file.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_output_path(view_file) as tmp_file:
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump({
+                    "feature_group": feature_group,
+                    "feature_group_version": feature_group_version,
+                    "columns": columns,
+                }, f, indent=2)
+        return self.feature_view(name, version)
+
+    def feature_view(self, name: str, version: int = 1) -> LocalFeatureGroupView:
+        view_file = self._view_file(name, version)
+        if not view_file.exists():
+            raise FileNotFoundError(f"❌ No local feature view '{name}' v{version}; create it with LocalBackend.create_feature_view")
+        with open(view_file, "r", encoding="utf-8") as f:
+            definition = json.load(f)
+        return LocalFeatureGroupView(self, **definition)
+
+    # ---------- model registry ----------
+
+    def _model_dir(self, name: str) -> Path:
+        return self.root / "models" / name
+
+    def _versions(self, name: str) -> list:
+        model_dir = self._model_dir(name)
+        if not model_dir.exists():
+            return []
+        return sorted(int(path.name) for path in model_dir.iterdir() if path.is_dir() and path.name.isdigit())
+
+    def latest_model(self, name: str) -> RegisteredModel:
+        versions = self._versions(name)
+        if not versions:
+            return None
+        with open(self._model_dir(name) / f"{versions[-1]}.json", "r", encoding="utf-8") as f:
+            record = json.load(f)
+        return RegisteredModel(name, versions[-1], record.get("metrics", {}))
+
+    def download_model(self, name: str, version: int = None) -> Path:
+        versions = self._versions(name)
+        if version is None:
+            version = versions[-1] if versions else None
+        if version not in versions:
+            return None
+        return self._model_dir(name) / str(version)
+
+    def register_model(
+        self,
+        name: str,
+        model_dir,
+        metrics: dict,
+        description: str = "",
+        features: pd.DataFrame = None,
+        targets: pd.Series = None,
+    ) -> RegisteredModel:
+        versions = self._versions(name)
+        version = versions[-1] + 1 if versions else 1
+        registry_dir = self._model_dir(name)
+        registry_dir.mkdir(parents=True, exist_ok=True)
+
+        # Copy next to the target first, so a version directory is never partial
+        tmp_dir = registry_dir / f".{version}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        shutil.copytree(model_dir, tmp_dir)
+        with open(registry_dir / f"{version}.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "metrics": metrics,
+                "description": description,
+                "input_columns": list(map(str, features.columns)) if features is not None else None,
+            }, f, indent=2)
+        os.replace(tmp_dir, registry_dir / str(version))
+        return RegisteredModel(name, version, metrics)
+
+# ===============================
+# 🔀 Backend Selection
+# ===============================
+
+_BACKEND = None
+
+def get_backend() -> StorageBackend:
+    """
+    The process-wide backend chosen by ``STORAGE_BACKEND``: ``hopsworks``
+    (default) or ``local`` (under ``LOCAL_STORE_DIR``, default
+    ``data/local_store/``).
+    """
+    global _BACKEND
+    if _BACKEND is None:
+        kind = os.environ.get("STORAGE_BACKEND", "hopsworks")
+        if kind == "hopsworks":
+            _BACKEND = HopsworksBackend()
+        elif kind == "local":
+            _BACKEND = LocalBackend(os.environ.get("LOCAL_STORE_DIR", LOCAL_STORE_DIR))
+        else:
+            raise ValueError(f"Unknown storage backend '{kind}' (expected hopsworks or local)")
+    return _BACKEND
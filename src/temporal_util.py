@@ -0,0 +1,101 @@
+# src/temporal_util.py (FOR CITI BIKE PROJECT)
+
+import numpy as np
+
+# numpy only on purpose: the model loader uses this module without pandas
+
+NS_PER_HOUR = 3_600 * 1_000_000_000
+HOURS_PER_DAY = 24
+PEAK_HOURS = (7, 8, 9, 16, 17, 18, 19)
+
+TEMPORAL_FEATURES = (
+    "hour", "hour_sin", "hour_cos", "day_of_week", "is_weekend", "month", "is_peak_hour",
+    "day_of_year", "day", "week_of_year", "quarter", "is_start_of_month", "is_end_of_month",
+)
+
+# ==============================
+# 📆 Civil Calendar Arithmetic
+# ==============================
+#
+# Proleptic Gregorian date <-> days since 1970-01-01, using only integer
+# operations on whole arrays (H. Hinnant's ``civil_from_days`` algorithm).
+
+def civil_from_days(days: np.ndarray):
+    """Split days since the epoch into ``(year, month, day)`` int64 arrays."""
+    z = np.asarray(days, dtype=np.int64) + 719_468
+    era = np.floor_divide(z, 146_097)
+    doe = z - era * 146_097
+    yoe = (doe - doe // 1_460 + doe // 36_524 - doe // 146_096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = np.where(mp < 10, mp + 3, mp - 9)
+    year = yoe + era * 400 + (month <= 2)
+    return year, month, day
+
+def days_from_civil(year: np.ndarray, month: np.ndarray, day: np.ndarray) -> np.ndarray:
+    """Days since the epoch of the given dates (inverse of ``civil_from_days``)."""
+    year = np.asarray(year, dtype=np.int64) - (np.asarray(month) <= 2)
+    month = np.asarray(month, dtype=np.int64)
+    era = np.floor_divide(year, 400)
+    yoe = year - era * 400
+    doy = (153 * np.where(month > 2, month - 3, month + 9) + 2) // 5 + np.asarray(day, dtype=np.int64) - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146_097 + doe - 719_468
+
+# ==============================
+# 🕰 Temporal Features
+# ==============================
+
+def temporal_features(local_ns: np.ndarray, names=TEMPORAL_FEATURES) -> dict:
+    """
+    Compute temporal features from local wall-clock times given as int64
+    nanoseconds since the epoch (i.e. ``hour_ts`` with the timezone dropped).
+
+    Matches pandas' ``.dt`` accessors (``dayofweek``, ``isocalendar().week``,
+    ``is_month_end``, ...) without building Timestamp objects. Returns a
+    dict ``{name: np.ndarray}`` with only the requested ``names``.
+    """
+    unknown = set(names) - set(TEMPORAL_FEATURES)
+    if unknown:
+        raise ValueError(f"Unknown temporal features: {sorted(unknown)}")
+
+    hours = np.floor_divide(np.asarray(local_ns, dtype=np.int64), NS_PER_HOUR)
+    days = np.floor_divide(hours, HOURS_PER_DAY)
+    hour = hours - days * HOURS_PER_DAY
+    day_of_week = (days + 3) % 7  # 1970-01-01 was a Thursday; Monday = 0
+    year, month, day = civil_from_days(days)
+
+    features = {}
+    for name in names:
+        if name == "hour":
+            features[name] = hour
+        elif name == "hour_sin":
+            features[name] = np.sin(2 * np.pi * hour / HOURS_PER_DAY)
+        elif name == "hour_cos":
+            features[name] = np.cos(2 * np.pi * hour / HOURS_PER_DAY)
+        elif name == "day_of_week":
+            features[name] = day_of_week
+        elif name == "is_weekend":
+            features[name] = (day_of_week >= 5).astype(np.int64)
+        elif name == "month":
+            features[name] = month
+        elif name == "is_peak_hour":
+            features[name] = np.isin(hour, PEAK_HOURS).astype(np.int64)
+        elif name == "day_of_year":
+            features[name] = days - days_from_civil(year, 1, 1) + 1
+        elif name == "day":
+            features[name] = day
+        elif name == "week_of_year":
+            # ISO week: the week (Mon-Sun) belongs to the year of its Thursday
+            thursday = days - day_of_week + 3
+            iso_year, _, _ = civil_from_days(thursday)
+            features[name] = (thursday - days_from_civil(iso_year, 1, 1)) // 7 + 1
+        elif name == "quarter":
+            features[name] = (month - 1) // 3 + 1
+        elif name == "is_start_of_month":
+            features[name] = (day == 1).astype(np.int64)
+        elif name == "is_end_of_month":
+            features[name] = (civil_from_days(days + 1)[2] == 1).astype(np.int64)
+
+    return features
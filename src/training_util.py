@@ -0,0 +1,286 @@
+# src/training_util.py (FOR CITI BIKE PROJECT)
+
+import json
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+
+from src.feature_spec import FeatureSpec
+from src.model_export import BOOSTER_FILE_NAME, has_export
+from src.parallel_util import atomic_output_path
+from src.partitioned_dataset import build_partitioned_dataset, latest_hour
+from src.pipeline_util import get_pipeline
+
+TRAINING_STATE_FILE_NAME = "training_state.json"
+
+FULL_RETRAIN_EVERY = pd.Timedelta(days=28)  # rebuild from the full history every 4 weeks
+DRIFT_TOLERANCE = 1.25                      # recent MAE > 1.25x the model's baseline = drift
+INCREMENTAL_ROUNDS = 200                    # trees added per weekly update
+REFIT_DECAY_RATE = 0.9                      # weight kept on the old leaf values when refitting
+HOLDOUT_HOURS = 7 * 24                      # trailing validation window of a full retrain
+INCREMENTAL_HOLDOUT_HOURS = 24              # ... and of a weekly warm start
+EARLY_STOPPING_ROUNDS = 100
+
+# ==============================
+# 📌 Training State
+# ==============================
+
+@dataclass
+class TrainingState:
+    """
+    What the next training run needs to know about the current model,
+    stored as ``training_state.json`` next to its exported booster.
+
+    ``watermark`` is the last ``hour_ts`` the model has seen (ISO format);
+    incremental runs fetch only rows after it. ``baseline_mae`` is the
+    out-of-sample MAE on the trailing holdout.
+    """
+
+    watermark: str
+    last_full_retrain: str
+    baseline_mae: float = None
+    mode: str = "full"
+    params: dict = field(default_factory=dict)
+    best_iteration: int = None
+    train_seconds: float = None
+
+    def save(self, directory) -> Path:
+        path = Path(directory) / TRAINING_STATE_FILE_NAME
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_output_path(path) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(asdict(self), f, indent=2)
+        return path
+
+    @classmethod
+    def load(cls, directory) -> "TrainingState":
+        with open(Path(directory) / TRAINING_STATE_FILE_NAME, "r", encoding="utf-8") as f:
+            return cls(**json.load(f))
+
+def find_export_dir(root) -> Path:
+    """The directory under ``root`` (a downloaded model) holding a booster export, or None."""
+    if root is None:
+        return None
+    root = Path(root)
+    if has_export(root):
+        return root
+    for booster_file in sorted(root.rglob(BOOSTER_FILE_NAME)):
+        if has_export(booster_file.parent):
+            return booster_file.parent
+    return None
+
+def load_previous_training(root):
+    """
+    ``(booster, state, export_dir)`` of a previously registered model, or
+    None if it has no export or no training state (then only a full
+    retrain is possible).
+    """
+    export_dir = find_export_dir(root)
+    if export_dir is None or not (export_dir / TRAINING_STATE_FILE_NAME).exists():
+        return None
+
+    booster = lgb.Booster(model_file=str(export_dir / BOOSTER_FILE_NAME))
+    return booster, TrainingState.load(export_dir), export_dir
+
+# ==============================
+# 🔀 Full vs. Incremental
+# ==============================
+
+def choose_training_mode(
+    state: TrainingState,
+    now: pd.Timestamp,
+    requested: str = "auto",
+    full_retrain_every: pd.Timedelta = FULL_RETRAIN_EVERY,
+) -> tuple:
+    """
+    Decide between ``"full"`` and ``"incremental"`` training.
+
+    Returns ``(mode, reason)``. ``requested`` may force either mode; a forced
+    incremental run still falls back to full without a previous model.
+    Drift is checked separately, once the new rows are loaded (``is_drifted``).
+    """
+    if requested not in ("auto", "full", "incremental"):
+        raise ValueError(f"Unknown training mode '{requested}' (expected auto, full or incremental)")
+
+    if requested == "full":
+        return "full", "requested"
+    if state is None:
+        return "full", "no previous model with a training state"
+
+    if requested == "auto" and now - pd.Timestamp(state.last_full_retrain) >= full_retrain_every:
+        return "full", f"scheduled (last full retrain {state.last_full_retrain})"
+
+    return "incremental", f"new rows after {state.watermark}"
+
+def is_drifted(recent_mae: float, baseline_mae: float, tolerance: float = DRIFT_TOLERANCE) -> bool:
+    """True if the previous model does clearly worse on new data than when it was trained."""
+    if baseline_mae is None or not np.isfinite(baseline_mae) or baseline_mae <= 0:
+        return False
+    return recent_mae > tolerance * baseline_mae
+
+# ==============================
+# ⏳ Holdout & Early Stopping
+# ==============================
+
+def trailing_holdout(hour_ts: pd.Series, holdout_hours: int = HOLDOUT_HOURS, gap_hours: int = 8) -> tuple:
+    """
+    Positional ``(train_idx, valid_idx)``: the last ``holdout_hours`` hours
+    validate, and training stops ``gap_hours`` (the forecast horizon)
+    before them so no training target falls inside the validation window.
+    Rows need not be sorted.
+    """
+    times = pd.to_datetime(hour_ts, utc=True).to_numpy()
+    cutoff = times.max() - np.timedelta64(holdout_hours - 1, "h")
+
+    valid_idx = np.flatnonzero(times >= cutoff)
+    train_idx = np.flatnonzero(times < cutoff - np.timedelta64(gap_hours, "h"))
+
+    if len(train_idx) == 0 or len(valid_idx) == 0:
+        raise ValueError(f"Not enough history for a {holdout_hours}h holdout with a {gap_hours}h gap")
+    return train_idx, valid_idx
+
+def fit_with_early_stopping(
+    params: dict,
+    X_train: pd.DataFrame,
+    y_train: pd.Series,
+    X_valid: pd.DataFrame,
+    y_valid: pd.Series,
+    early_stopping_rounds: int = EARLY_STOPPING_ROUNDS,
+):
+    """
+    Fit ``get_pipeline(**params)`` with ``n_estimators`` as an upper bound,
+    stopping once validation L1 has not improved for
+    ``early_stopping_rounds`` rounds.
+
+    Returns ``(pipeline, best_iteration, train_seconds)``.
+    """
+    pipeline = get_pipeline(**params)
+
+    # The eval set skips the pipeline's transform steps, so transform it here
+    X_valid_transformed = pipeline[:-1].fit(X_train, y_train).transform(X_valid)
+
+    started = time.perf_counter()
+    pipeline.fit(
+        X_train,
+        y_train,
+        lgbmregressor__eval_set=[(X_valid_transformed, y_valid)],
+        lgbmregressor__eval_metric="l1",
+        lgbmregressor__callbacks=[lgb.early_stopping(early_stopping_rounds, verbose=False)],
+    )
+    train_seconds = time.perf_counter() - started
+
+    best_iteration = pipeline[-1].best_iteration_ or params.get("n_estimators")
+    print(f"⏱️ Early stopping at {best_iteration} of {params.get('n_estimators')} rounds ({train_seconds:.1f}s)")
+    return pipeline, best_iteration, train_seconds
+
+def _booster_params(params: dict) -> tuple:
+    """``lgb.train`` params and round count from ``get_pipeline``-style params."""
+    train_params = {**params, "metric": "l1", "verbose": -1}
+    return train_params, train_params.pop("n_estimators", 1000)
+
+def train_from_partitions(
+    root,
+    spec: FeatureSpec,
+    params: dict,
+    holdout_hours: int = HOLDOUT_HOURS,
+    early_stopping_rounds: int = EARLY_STOPPING_ROUNDS,
+):
+    """
+    Out-of-core counterpart of ``fit_with_early_stopping``: train and
+    holdout Datasets are streamed from the Parquet partitions under
+    ``root`` (see ``build_partitioned_dataset``), so peak memory follows
+    the binned data rather than a float64 frame.
+
+    Returns ``(booster, best_iteration, holdout_mae, train_seconds, trained_until)``.
+    """
+    last_hour = latest_hour(root, spec)
+    if last_hour is None:
+        raise ValueError(f"No feature partitions under {root}")
+
+    cutoff = last_hour - pd.Timedelta(hours=holdout_hours - 1)
+    train_end = cutoff - pd.Timedelta(hours=spec.horizon)
+
+    train_params, num_boost_round = _booster_params(params)
+
+    started = time.perf_counter()
+    train_set = build_partitioned_dataset(root, spec, end=train_end, params=train_params)
+    valid_set = build_partitioned_dataset(root, spec, start=cutoff, params=train_params, reference=train_set)
+    print(f"✅ Streamed {train_set.num_data()} train / {valid_set.num_data()} holdout rows from {root}")
+
+    booster = lgb.train(
+        train_params,
+        train_set,
+        num_boost_round=num_boost_round,
+        valid_sets=[valid_set],
+        callbacks=[lgb.early_stopping(early_stopping_rounds, verbose=False)],
+    )
+    train_seconds = time.perf_counter() - started
+
+    best_iteration = booster.best_iteration or booster.current_iteration()
+    holdout_mae = float(booster.best_score["valid_0"]["l1"])
+    print(f"⏱️ Early stopping at {best_iteration} of {num_boost_round} rounds ({train_seconds:.1f}s)")
+    return booster, best_iteration, holdout_mae, train_seconds, train_end - pd.Timedelta(hours=1)
+
+def refit_from_partitions(root, spec: FeatureSpec, params: dict, num_boost_round: int) -> tuple:
+    """
+    Retrain on every row under ``root``, holdout included, with the tree
+    count ``train_from_partitions`` early-stopped at.
+
+    Returns ``(booster, train_seconds)``.
+    """
+    train_params, _ = _booster_params(params)
+
+    started = time.perf_counter()
+    train_set = build_partitioned_dataset(root, spec, params=train_params)
+    booster = lgb.train(train_params, train_set, num_boost_round=num_boost_round)
+    return booster, time.perf_counter() - started
+
+# ==============================
+# 🔥 Warm Start
+# ==============================
+
+def warm_start_booster(
+    booster: lgb.Booster,
+    X: np.ndarray,
+    y: np.ndarray,
+    params: dict,
+    num_boost_round: int = INCREMENTAL_ROUNDS,
+    decay_rate: float = REFIT_DECAY_RATE,
+    valid: tuple = None,
+    early_stopping_rounds: int = EARLY_STOPPING_ROUNDS,
+) -> lgb.Booster:
+    """
+    Update ``booster`` with recent data only: refit its leaf values on
+    ``(X, y)`` (keeping ``decay_rate`` of the old values), then continue
+    boosting up to ``num_boost_round`` trees from it via ``init_model``,
+    early-stopped on ``valid=(X_valid, y_valid)`` if given.
+
+    Cost scales with ``len(X)``, not with the history the booster saw.
+    """
+    feature_names = booster.feature_name()
+    refitted = booster.refit(X, y, decay_rate=decay_rate)
+
+    train_set = lgb.Dataset(X, label=y, feature_name=feature_names, free_raw_data=False)
+    params = {**params, "verbose": -1}
+    params.pop("n_estimators", None)
+
+    valid_sets, callbacks = [], []
+    if valid is not None:
+        valid_sets = [lgb.Dataset(valid[0], label=valid[1], reference=train_set, free_raw_data=False)]
+        callbacks = [lgb.early_stopping(early_stopping_rounds, verbose=False)]
+        params["metric"] = "l1"
+
+    updated = lgb.train(
+        params,
+        train_set,
+        num_boost_round=num_boost_round,
+        init_model=refitted,
+        valid_sets=valid_sets,
+        callbacks=callbacks,
+    )
+    print(f"✅ Warm-started booster: {booster.num_trees()} -> {updated.num_trees()} trees on {len(X)} new rows")
+    return updated
@@ -1,20 +1,11 @@
 import pandas as pd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from pathlib import Path
-import holidays
 
-def fill_missing_hour_station(df, time_col, station_cols, count_col):
-    df[time_col] = pd.to_datetime(df[time_col])
-    full_hours = pd.date_range(start=df[time_col].min(), end=df[time_col].max(), freq="H")
-    all_stations = df[station_cols].drop_duplicates()
-
-    full_combinations = pd.DataFrame([
-        [hour] + list(station) for hour in full_hours for station in all_stations.values
-    ], columns=[time_col] + station_cols)
-
-    merged = pd.merge(full_combinations, df, on=[time_col] + station_cols, how="left")
-    merged[count_col] = merged[count_col].fillna(0).astype(int)
-    return merged
+from src.calendar_features import add_calendar_features
+from src.hour_station_grid import build_hour_station_grid
+from src.parallel_util import atomic_output_path
 
 def to_new_york(series):
     if pd.api.types.is_datetime64tz_dtype(series):
@@ -22,82 +13,171 @@ def to_new_york(series):
     else:
         return series.dt.tz_localize("UTC", ambiguous='NaT', nonexistent='shift_forward').dt.tz_convert("America/New_York")
 
-def map_time_of_day(hour):
-    if 0 <= hour <= 5:
-        return "Night"
-    elif 6 <= hour <= 11:
-        return "Morning"
-    elif 12 <= hour <= 17:
-        return "Afternoon"
+ROLLING_WINDOW = 3  # hours behind ride_count_roll3
+MAX_CARRY_GAP = pd.Timedelta(hours=3)  # a few quiet night hours at a month boundary, not a missing month
+STATION_COLS = ["start_station_name", "start_station_id"]
+
+class StationTail:
+    """
+    The last ``ROLLING_WINDOW`` hourly counts of every station seen so far,
+    carried from one monthly file into the next so lag/rolling features
+    continue across the month boundary.
+    """
+
+    def __init__(self, stations: pd.DataFrame, counts: np.ndarray, last_hour: pd.Timestamp):
+        self.stations = stations
+        self.counts = counts
+        self.last_hour = last_hour
+
+def prepare_rides(df: pd.DataFrame) -> pd.DataFrame:
+    """Clean timestamps/station ids of one validated month and add ``hour_ts``."""
+    # Convert timestamps safely
+    df["started_at"] = to_new_york(pd.to_datetime(df["started_at"], errors="coerce"))
+    df["ended_at"] = to_new_york(pd.to_datetime(df["ended_at"], errors="coerce"))
+
+    # Convert start_station_id to int (✅ added here)
+    if "start_station_id" in df.columns:
+        df["start_station_id"] = pd.to_numeric(df["start_station_id"], errors="coerce").dropna().astype(int)
+
+    # Drop any rows with invalid or missing timestamps (and stations without a numeric id)
+    df = df.dropna(subset=["started_at", "ended_at"] + STATION_COLS)
+
+    # ✅ FINAL DST FIX
+    df = df[~((df["started_at"].dt.month == 11) & 
+              (df["started_at"].dt.day == 3) & 
+              (df["started_at"].dt.hour == 1))]
+
+    # Floor to hour
+    df = df.assign(hour_ts=df["started_at"].dt.floor("H"))
+    return df
+
+def transform_month_to_timeseries(df: pd.DataFrame, tail: StationTail = None):
+    """
+    Turn one month of rides into the hourly per-station time series.
+
+    ``tail`` is the state returned for the previous month (None for the
+    first one). The month's grid starts right after ``tail.last_hour`` so
+    there is no gap between files, and the lag/rolling windows look back
+    into the carried counts instead of starting from NaN. Windows are
+    computed per station column of the grid, so they never mix stations.
+
+    If the month's first ride is more than ``MAX_CARRY_GAP`` after
+    ``tail.last_hour`` (a missing or empty month), the tail is dropped and
+    the month starts fresh, rather than filling the gap with zero counts.
+
+    Returns
+    -------
+    (pd.DataFrame, StationTail)
+        The month's rows (with lag features) and the state for the next month.
+    """
+    rides = prepare_rides(df)
+    if rides.empty:
+        return pd.DataFrame(), tail
+
+    first_hour = rides["hour_ts"].min()
+    if tail is not None and first_hour - tail.last_hour > MAX_CARRY_GAP:
+        # Whole months strictly between the two
+        missing = pd.period_range(
+            tail.last_hour.tz_localize(None).to_period("M") + 1, first_hour.tz_localize(None).to_period("M") - 1, freq="M"
+        )
+        print(
+            f"⚠️ No rides between {tail.last_hour} and {first_hour}"
+            f"{' (missing ' + ', '.join(map(str, missing)) + ')' if len(missing) else ''}. "
+            f"Starting fresh instead of filling the gap with zeros."
+        )
+        tail = None
+
+    month_stations = rides[STATION_COLS].drop_duplicates()
+    if tail is None:
+        stations = month_stations.reset_index(drop=True)
+        start_hour = first_hour
     else:
-        return "Evening"
-
-def transform_to_timeseries(input_dir="C:/Users/MD/Desktop/citi/data/processed/validated", output_dir="C:/Users/MD/Desktop/citi/data/processed/timeseries"):
+        # Carried stations keep their columns; new stations are appended
+        stations = pd.concat([tail.stations, month_stations]).drop_duplicates(ignore_index=True)
+        start_hour = tail.last_hour + pd.Timedelta(hours=1)
+        overlap = int((rides["hour_ts"] < start_hour).sum())
+        if overlap:
+            print(f"⚠️ Ignoring {overlap} rides already covered by the previous month")
+
+    hours = pd.date_range(start=start_hour, end=rides["hour_ts"].max(), freq="h")
+    if len(hours) == 0:
+        return pd.DataFrame(), tail
+
+    grid = build_hour_station_grid(rides, "hour_ts", STATION_COLS, hours=hours, stations=stations, dtype=np.int64)
+    n_hours, n_stations = grid.shape
+
+    # History rows before the month: carried counts, or NaN for the very first month
+    history = np.full((ROLLING_WINDOW, n_stations), np.nan)
+    if tail is not None:
+        history[:, :tail.counts.shape[1]] = tail.counts
+    extended = np.vstack([history, grid.counts])
+
+    lag_1 = extended[ROLLING_WINDOW - 1:ROLLING_WINDOW - 1 + n_hours]
+    roll = sliding_window_view(extended, ROLLING_WINDOW, axis=0)[:n_hours].mean(axis=-1)
+
+    # Long frame ordered by station name, then hour
+    order = np.argsort(stations["start_station_name"].astype(str).to_numpy(), kind="stable")
+    station_idx = np.repeat(order, n_hours)
+    hour_idx = np.tile(np.arange(n_hours), n_stations)
+
+    grouped = pd.DataFrame({"hour_ts": hours.take(hour_idx)})
+    for col in STATION_COLS:
+        grouped[col] = stations[col].take(station_idx).reset_index(drop=True)
+    grouped["ride_count"] = grid.counts[hour_idx, station_idx]
+
+    # === Feature Engineering (joined from the cached calendar table) ===
+    grouped = add_calendar_features(grouped, columns=[
+        "hour", "hour_sin", "hour_cos", "day_of_week", "is_holiday_or_weekend",
+        "month", "is_peak_hour", "day_of_year", "time_of_day",
+    ])
+
+    # === Lag Features ===
+    grouped["ride_count_lag_1"] = lag_1[hour_idx, station_idx]
+    grouped["ride_count_roll3"] = roll[hour_idx, station_idx]
+
+    # === Remove rows where lag features are missing (only the very first hours) ===
+    grouped = grouped.dropna(subset=["ride_count_lag_1", "ride_count_roll3"]).reset_index(drop=True)
+
+    return grouped, StationTail(stations, extended[-ROLLING_WINDOW:], hours[-1])
+
+def transform_to_timeseries(
+    input_dir="C:/Users/MD/Desktop/citi/data/processed/validated",
+    output_dir="C:/Users/MD/Desktop/citi/data/processed/timeseries",
+    carry_state: bool = True,
+):
+    """
+    Stream monthly validated files in time order into hourly time series.
+
+    Each file is read once and only one month is in memory. With
+    ``carry_state=True`` a small per-station tail is passed between months,
+    so no rows are lost at month boundaries; ``False`` treats every month
+    on its own (the first hours of each month are dropped).
+    """
     input_path = Path(input_dir)
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
 
+    tail = None
+
     for file in sorted(input_path.glob("rides_*.parquet")):
         print(f"\n🔁 Transforming: {file.name}")
         try:
             df = pd.read_parquet(file)
         except Exception as e:
             print(f"⚠️ Failed to read {file.name}: {e}")
+            tail = None  # a missing month breaks the continuity
+            continue
+
+        grouped, tail = transform_month_to_timeseries(df, tail if carry_state else None)
+
+        if grouped.empty:
+            print(f"🚫 No rides left in {file.name}")
             continue
-        
-        # Convert timestamps safely
-        df["started_at"] = to_new_york(pd.to_datetime(df["started_at"], errors="coerce"))
-        df["ended_at"] = to_new_york(pd.to_datetime(df["ended_at"], errors="coerce"))
-
-        # Convert start_station_id to int (✅ added here)
-        if "start_station_id" in df.columns:
-            df["start_station_id"] = pd.to_numeric(df["start_station_id"], errors="coerce").dropna().astype(int)
-
-        # Drop any rows with invalid or missing timestamps
-        df = df.dropna(subset=["started_at", "ended_at"])
-
-        # ✅ FINAL DST FIX
-        df = df[~((df["started_at"].dt.month == 11) & 
-                  (df["started_at"].dt.day == 3) & 
-                  (df["started_at"].dt.hour == 1))]
-
-        # Floor to hour
-        df["hour_ts"] = df["started_at"].dt.floor("H")
-        year_detected = df["hour_ts"].dt.year.max()
-
-        # Create US holidays for detected year
-        us_holidays = holidays.US(years=[year_detected])
-
-        # Group
-        grouped = df.groupby(["start_station_name", "start_station_id", "hour_ts"]).size().reset_index(name="ride_count")
-        grouped = fill_missing_hour_station(grouped, "hour_ts", ["start_station_name", "start_station_id"], "ride_count")
-        
-        # === Feature Engineering ===
-        grouped["hour"] = grouped["hour_ts"].dt.hour
-        grouped["hour_sin"] = np.sin(2 * np.pi * grouped["hour"] / 24)
-        grouped["hour_cos"] = np.cos(2 * np.pi * grouped["hour"] / 24)
-        grouped["day_of_week"] = grouped["hour_ts"].dt.dayofweek
-        
-        is_weekend = (grouped["day_of_week"] >= 5).astype(int)
-        is_holiday = pd.to_datetime(grouped["hour_ts"].dt.date).isin(us_holidays).astype(int)
-
-        grouped["is_holiday_or_weekend"] = ((is_weekend + is_holiday) >= 1).astype(int)
-        grouped["month"] = grouped["hour_ts"].dt.month
-        grouped["is_peak_hour"] = grouped["hour"].isin([7, 8, 9, 16, 17, 18, 19]).astype(int)
-        grouped["day_of_year"] = grouped["hour_ts"].dt.dayofyear
-        grouped["time_of_day"] = grouped["hour"].apply(map_time_of_day)
-        
-        # === Lag Features ===
-        grouped = grouped.sort_values(["start_station_name", "hour_ts"])
-        grouped["ride_count_lag_1"] = grouped.groupby("start_station_name")["ride_count"].shift(1)
-        grouped["ride_count_roll3"] = grouped.groupby("start_station_name")["ride_count"].shift(1).rolling(3).mean()
-
-        # === Remove rows where lag features are missing ===
-        grouped = grouped.dropna(subset=["ride_count_lag_1", "ride_count_roll3"])
 
         # Save cleaned output
         output_file = output_path / file.name
-        grouped.to_parquet(output_file, index=False)
+        with atomic_output_path(output_file) as tmp_file:
+            grouped.to_parquet(tmp_file, index=False)
         print(f"✅ Saved: {output_file} with {len(grouped)} rows (after cleaning)")
 
 # Run the function
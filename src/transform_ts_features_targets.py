@@ -1,12 +1,26 @@
 # src/transform_ts_features_targets.py (FINAL FOR HOPSWORKS)
 
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
 
+from src.calendar_features import add_calendar_features
+from src.feature_spec import DEFAULT_FEATURE_SPEC, FeatureSpec
+from src.parallel_util import atomic_output_path
+
+DATASET_CACHE_DIR = Path(__file__).resolve().parent.parent / "data" / "lgb_cache"
+
+# Dataset parameters that change the binned result (and so the cache key)
+BINNING_PARAMS = ("max_bin", "min_data_in_bin", "bin_construct_sample_cnt", "categorical_feature", "linear_tree")
+
 # ==========================================
 # 🚀 Transform directly from Hopsworks Feature View Data
 # ==========================================
 
-def transform_ts_data_into_features_and_targets(ts_data):
+def transform_ts_data_into_features_and_targets(ts_data, spec: FeatureSpec = DEFAULT_FEATURE_SPEC, as_matrix: bool = False):
     """
     Create features and targets dynamically from Hopsworks Feature View data.
 
@@ -14,6 +28,11 @@ def transform_ts_data_into_features_and_targets(ts_data):
     ----------
     ts_data : pd.DataFrame
         The full batch of data fetched from Feature View.
+    spec : FeatureSpec
+        Which lag, rolling and calendar columns make up the features.
+    as_matrix : bool
+        Return a C-contiguous float32 ``np.ndarray`` pair instead of pandas
+        objects (see ``features_to_matrix``; ``build_lgb_dataset`` bins and caches it).
 
     Returns
     -------
@@ -27,32 +46,127 @@ def transform_ts_data_into_features_and_targets(ts_data):
         print("⚠️ No data provided for feature creation. Returning None.")
         return None, None
 
-    ts_data = ts_data.copy()
-
-    # ✅ Manual temporal features
-    ts_data["hour"] = ts_data["hour_ts"].dt.hour
-    ts_data["day_of_week"] = ts_data["hour_ts"].dt.dayofweek
-    ts_data["month"] = ts_data["hour_ts"].dt.month
-
-    # ✅ No need to create ride_count_roll3 again — already exists from Hopsworks!
-
     # ✅ Check if target column exists
-    if "target_ride_count" not in ts_data.columns:
-        print("❌ 'target_ride_count' column missing!")
+    if spec.target_col not in ts_data.columns:
+        print(f"❌ '{spec.target_col}' column missing!")
         return None, None
 
-    # ✅ Define final features: only use columns that surely exist
-    feature_columns = [
-        "start_station_id", "hour", "day_of_week", "month", "ride_count_roll3"
-    ] + [col for col in ts_data.columns if col.startswith("ride_count_lag_")]
+    # ✅ Spec columns only; missing calendar features are joined from the cached table
+    try:
+        if as_matrix:
+            features, targets = features_to_matrix(ts_data, spec)
+            print(f"✅ Feature matrix ready: {features.shape} float32, Targets ready: {targets.shape}")
+            return features, targets
+        features = spec.select_features(ts_data)
+    except KeyError as e:
+        print(f"❌ Feature View data does not match feature spec v{spec.version}: {e}")
+        return None, None
 
-    # ✅ Prepare features and targets
-    features = ts_data[feature_columns]
-    targets = ts_data["target_ride_count"]
+    targets = ts_data[spec.target_col]
 
     print(f"✅ Features ready: {features.shape}, Targets ready: {targets.shape}")
     return features, targets
 
+# ==========================================
+# 🧱 Float32 Matrix & Cached LightGBM Dataset
+# ==========================================
+
+def features_to_matrix(ts_data: pd.DataFrame, spec: FeatureSpec = DEFAULT_FEATURE_SPEC):
+    """
+    Fill one preallocated C-contiguous float32 ``(rows, features)`` matrix
+    straight from ``ts_data``'s columns, in ``spec.feature_columns()`` order,
+    without an intermediate DataFrame copy.
+
+    Returns ``(X, y)``; ``y`` is float32, or None without a target column.
+    """
+    columns = spec.feature_columns()
+    missing_calendar = [col for col in spec.calendar_features if col not in ts_data.columns]
+    calendar = add_calendar_features(ts_data[[spec.time_col]], spec.time_col, missing_calendar) if missing_calendar else None
+
+    missing = [col for col in columns if col not in ts_data.columns and col not in missing_calendar]
+    if missing:
+        raise KeyError(f"Missing {len(missing)} feature columns for spec v{spec.version}: {missing[:5]}...")
+
+    X = np.empty((len(ts_data), len(columns)), dtype=np.float32, order="C")
+    for j, col in enumerate(columns):
+        source = calendar if col in missing_calendar else ts_data
+        X[:, j] = source[col].to_numpy()
+
+    y = ts_data[spec.target_col].to_numpy(dtype=np.float32) if spec.target_col in ts_data.columns else None
+    return X, y
+
+def dataset_cache_key(ts_data: pd.DataFrame, spec: FeatureSpec = DEFAULT_FEATURE_SPEC, params: dict = None) -> str:
+    """
+    Key of a binned Dataset: the feature spec, the data range (first/last
+    hour, row count, stations), a fingerprint of the rows' time, station,
+    feature and target values (in order), and the parameters that affect
+    binning. Restated or backfilled values change the key even when the
+    range does not.
+    """
+    hour_ts = pd.to_datetime(ts_data[spec.time_col])
+    stations = sorted(map(str, pd.unique(ts_data[spec.station_col]))) if spec.station_col in ts_data.columns else []
+    columns = [
+        col for col in dict.fromkeys([spec.time_col, spec.station_col, *spec.feature_columns(), spec.target_col])
+        if col in ts_data.columns
+    ]
+    row_hashes = pd.util.hash_pandas_object(ts_data[columns], index=False).to_numpy()
+    payload = {
+        "spec": spec.to_dict(),
+        "first_hour": str(hour_ts.min()),
+        "last_hour": str(hour_ts.max()),
+        "rows": len(ts_data),
+        "stations": stations,
+        "content": hashlib.sha256(row_hashes.tobytes()).hexdigest(),
+        "params": {key: (params or {}).get(key) for key in BINNING_PARAMS},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()[:20]
+
+def dataset_cache_file(ts_data: pd.DataFrame, spec: FeatureSpec = DEFAULT_FEATURE_SPEC, params: dict = None, cache_dir=None) -> Path:
+    """Path of the cached binary Dataset for ``ts_data`` (see ``build_lgb_dataset``)."""
+    return Path(cache_dir or DATASET_CACHE_DIR) / f"dataset_{dataset_cache_key(ts_data, spec, params)}.bin"
+
+def build_lgb_dataset(
+    ts_data: pd.DataFrame,
+    spec: FeatureSpec = DEFAULT_FEATURE_SPEC,
+    params: dict = None,
+    cache_dir=None,
+) -> "lgb.Dataset":
+    """
+    Binned ``lgb.Dataset`` for ``ts_data``, reloaded from
+    ``<cache_dir>/<key>.bin`` when the same data range, spec and binning
+    parameters were seen before; otherwise built once from the float32
+    matrix and saved there. Pass ``cache_dir=False`` to skip the cache.
+    """
+    import lightgbm as lgb  # only the training paths need it
+
+    params = dict(params or {})
+    params.setdefault("verbose", -1)
+
+    cache_file = None
+    if cache_dir is not False:
+        cache_file = dataset_cache_file(ts_data, spec, params, cache_dir)
+        if cache_file.exists():
+            print(f"♻️ Reusing binned dataset {cache_file.name}")
+            return lgb.Dataset(str(cache_file), params=params).construct()
+
+    X, y = features_to_matrix(ts_data, spec)
+    if y is None:
+        raise KeyError(f"'{spec.target_col}' column missing; cannot build a training Dataset.")
+
+    dataset = lgb.Dataset(X, label=y, feature_name=spec.feature_columns(), params=params, free_raw_data=True).construct()
+    print(f"✅ Binned dataset built: {X.shape[0]} rows x {X.shape[1]} features")
+
+    if cache_file is not None:
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with atomic_output_path(cache_file) as tmp_file:
+                dataset.save_binary(str(tmp_file))
+            print(f"💾 Cached binned dataset at {cache_file}")
+        except (OSError, lgb.basic.LightGBMError) as e:
+            print(f"⚠️ Could not cache binned dataset at {cache_file}: {e}")
+
+    return dataset
+
 # ==========================================
 # 🧪 Manual Testing Block
 # ==========================================
@@ -0,0 +1,85 @@
+# src/trip_schema.py (FOR CITI BIKE PROJECT)
+
+import pandas as pd
+import pyarrow as pa
+
+# ==============================
+# 📐 Raw Trip Schema
+# ==============================
+
+# Low-cardinality text: a few thousand stations, two bike types, two rider types.
+CATEGORICAL_COLUMNS = [
+    "rideable_type",
+    "start_station_name", "start_station_id",
+    "end_station_name", "end_station_id",
+    "member_casual",
+]
+COORDINATE_COLUMNS = ["start_lat", "start_lng", "end_lat", "end_lng"]
+TIMESTAMP_COLUMNS = ["started_at", "ended_at"]
+
+_DICTIONARY = pa.dictionary(pa.int32(), pa.string())
+
+# Shared by fetch_raw_data (writing monthly files) and clean_validate_data.
+# Timestamps are stored as int64 epoch milliseconds (Parquet TIMESTAMP_MILLIS),
+# so they are parsed from text exactly once, at ingest.
+TRIP_SCHEMA = pa.schema([
+    ("ride_id", pa.string()),
+    ("rideable_type", _DICTIONARY),
+    ("started_at", pa.timestamp("ms")),
+    ("ended_at", pa.timestamp("ms")),
+    ("start_station_name", _DICTIONARY),
+    ("start_station_id", _DICTIONARY),
+    ("end_station_name", _DICTIONARY),
+    ("end_station_id", _DICTIONARY),
+    ("start_lat", pa.float32()),
+    ("start_lng", pa.float32()),
+    ("end_lat", pa.float32()),
+    ("end_lng", pa.float32()),
+    ("member_casual", _DICTIONARY),
+])
+
+# dtypes handed to pd.read_csv so text never materialises as object columns
+CSV_DTYPES = {
+    "ride_id": str,
+    **{col: "category" for col in CATEGORICAL_COLUMNS},
+    **{col: "float32" for col in COORDINATE_COLUMNS},
+}
+
+# ==============================
+# 🔄 Conversions
+# ==============================
+
+def to_compact_trip_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cast whichever trip columns are present in ``df`` to the compact schema
+    dtypes. Columns that already have the right dtype are left untouched.
+    """
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+
+    for col in COORDINATE_COLUMNS:
+        if col in df.columns and df[col].dtype != "float32":
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float32")
+
+    for col in TIMESTAMP_COLUMNS:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], format="ISO8601", errors="coerce").astype("datetime64[ms]")
+
+    return df
+
+def trip_chunk_to_table(chunk: pd.DataFrame) -> pa.Table:
+    """
+    Convert one CSV chunk into an Arrow table that matches ``TRIP_SCHEMA``
+    exactly (missing columns become nulls, unknown columns are dropped).
+    """
+    chunk = to_compact_trip_frame(chunk)
+
+    arrays = []
+    for field in TRIP_SCHEMA:
+        if field.name in chunk.columns:
+            arrays.append(pa.array(chunk[field.name], from_pandas=True).cast(field.type))
+        else:
+            arrays.append(pa.nulls(len(chunk), type=field.type))
+
+    return pa.Table.from_arrays(arrays, schema=TRIP_SCHEMA)
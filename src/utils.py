@@ -1,29 +1,37 @@
 # src/utils.py
 
+import re
 import pandas as pd
 import numpy as np
+import pyarrow.parquet as pq
 from pathlib import Path
 from datetime import datetime
-import holidays
-from typing import Tuple
+from typing import Iterator, Tuple
 import pytz
 
-# ========= BASIC HELPERS ==========
-
-def fill_missing_hour_station(df: pd.DataFrame, time_col: str, station_cols: list, count_col: str) -> pd.DataFrame:
-    """Fill missing (hour, station) combinations with 0 ride counts."""
-    df[time_col] = pd.to_datetime(df[time_col])
-    full_hours = pd.date_range(start=df[time_col].min(), end=df[time_col].max(), freq="H")
-    all_stations = df[station_cols].drop_duplicates()
-
-    full_combinations = pd.DataFrame(
-        [[hour] + list(station) for hour in full_hours for station in all_stations.values],
-        columns=[time_col] + station_cols
-    )
+from src.calendar_features import add_calendar_features, map_time_of_day
+from src.hour_station_grid import fill_missing_hour_station
+from src.feature_spec import DEFAULT_FEATURE_SPEC, FeatureSpec
+from src.parallel_util import atomic_output_path
+
+# add_calendar_features, map_time_of_day and fill_missing_hour_station live in
+# their own modules; they are re-exported here for the notebooks that import
+# them from src.utils.
+__all__ = [
+    "FEATURE_INPUT_PATTERN",
+    "FEATURE_MONTH_PATTERN",
+    "PARTITION_ROW_GROUP_SIZE",
+    "add_calendar_features",
+    "build_final_features",
+    "create_final_features",
+    "fill_missing_hour_station",
+    "map_time_of_day",
+    "split_time_series_data",
+    "to_new_york",
+    "walk_forward_splits",
+]
 
-    merged = pd.merge(full_combinations, df, on=[time_col] + station_cols, how="left")
-    merged[count_col] = merged[count_col].fillna(0).astype(int)
-    return merged
+# ========= BASIC HELPERS ==========
 
 def to_new_york(series: pd.Series) -> pd.Series:
     """Ensure datetime is localized to New York timezone."""
@@ -32,118 +40,150 @@ def to_new_york(series: pd.Series) -> pd.Series:
     else:
         return series.dt.tz_localize("UTC", ambiguous='NaT', nonexistent='shift_forward').dt.tz_convert("America/New_York")
 
-def map_time_of_day(hour: int) -> str:
-    """Categorize hour into parts of day."""
-    if 0 <= hour <= 5:
-        return "Night"
-    elif 6 <= hour <= 11:
-        return "Morning"
-    elif 12 <= hour <= 17:
-        return "Afternoon"
-    else:
-        return "Evening"
-
 # ========= FINAL FEATURE CREATION =========
 
-def create_final_features(
-    input_dir: str = r"C:/Users/MD/Desktop/citi/data/processed/feature_eng_all_id", 
-    output_dir: str = r"C:/Users/MD/Desktop/citi/data/processed/final_features"
-) -> None:
-    """Load 8-hour prediction monthly files, merge into 2024 and 2025, add lags, and save."""
+FEATURE_INPUT_PATTERN = "citibike_features_targets_8hours_*.parquet"
+FEATURE_MONTH_PATTERN = re.compile(r"(20\d{2})_(\d{2})")
+PARTITION_ROW_GROUP_SIZE = 65_536  # rows per Parquet row group; the unit partitioned_dataset decodes
+
+def _feature_input_months(input_path: Path) -> list:
+    """Monthly input files as ``(period, path)`` pairs in time order."""
+    months = []
+    for file in input_path.glob(FEATURE_INPUT_PATTERN):
+        match = FEATURE_MONTH_PATTERN.search(file.stem)
+        if match is None:
+            print(f"⚠️ Skipping {file.name}: no YYYY_MM in file name")
+            continue
+        months.append((pd.Period(year=int(match.group(1)), month=int(match.group(2)), freq="M"), file))
+    return sorted(months, key=lambda item: item[0])
+
+def _read_feature_input(file: Path, count_col: str) -> pd.DataFrame:
+    """Read a monthly input without its stale lag columns (they are rebuilt anyway)."""
+    names = pq.read_schema(file).names
+    columns = [name for name in names if not name.startswith(f"{count_col}_lag_")]
+    df = pd.read_parquet(file, columns=columns)
+    df["hour_ts"] = pd.to_datetime(df["hour_ts"])
+    return df
+
+def _as_bound(value, tz):
+    """Make a user-given timestamp comparable with data in ``tz`` (naive = New York)."""
+    if value is None:
+        return None
+    value = pd.Timestamp(value)
+    if tz is None:
+        return value.tz_localize(None) if value.tzinfo is not None else value
+    return value.tz_localize("America/New_York") if value.tzinfo is None else value.tz_convert(tz)
+
+def build_final_features(
+    input_dir,
+    output_dir,
+    start=None,
+    end=None,
+    spec: FeatureSpec = DEFAULT_FEATURE_SPEC,
+) -> list:
+    """
+    Stream monthly 8-hour input files in time order and write final features
+    for hours in ``[start, end)`` (default: everything) as a partitioned
+    dataset ``output_dir/year_month=YYYY-MM/part-<source month>.parquet``
+    (one key, since ``month`` is already a feature column).
 
+    Only one month plus a per-station lookback buffer (``spec.max_lag`` +
+    ``spec.horizon`` hours) is in memory at a time, so lags and targets
+    run across month and year boundaries without loading whole years.
+    Months before ``start`` are read only as far back as the lookback needs.
+
+    Returns the list of files written.
+    """
     input_path = Path(input_dir)
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
 
+    lookback_hours = spec.max_lag + spec.horizon
+    start_month = pd.Timestamp(start).tz_localize(None).to_period("M") if start is not None else None
+    first_month = start_month - (lookback_hours // (28 * 24) + 1) if start is not None else None
+    last_month = pd.Timestamp(end).tz_localize(None).to_period("M") + 1 if end is not None else None
+
     print(f"📂 Scanning {input_path} for 8-hour monthly parquet files...")
 
-    dfs_2024 = []
-    dfs_2025 = []
+    buffer = None
+    emitted_until = None
+    written = []
+
+    for period, file in _feature_input_months(input_path):
+        if (first_month is not None and period < first_month) or (last_month is not None and period > last_month):
+            continue
 
-    for file in sorted(input_path.glob("citibike_features_targets_8hours_*.parquet")):
         print(f"🔄 Reading {file.name}")
         try:
-            df = pd.read_parquet(file)
-            df["hour_ts"] = pd.to_datetime(df["hour_ts"])
-            year = df["hour_ts"].dt.year.iloc[0]
-            if year == 2024:
-                dfs_2024.append(df)
-            elif year == 2025:
-                dfs_2025.append(df)
-            else:
-                print(f"⚠️ Skipping unknown year in {file.name}")
+            month_df = _read_feature_input(file, spec.count_col)
         except Exception as e:
             print(f"⚠️ Failed to read {file.name}: {e}")
+            buffer = None  # a missing month breaks lag continuity
             continue
 
-    # === Function to process a full year of data ===
-    def process_year_data(dfs, year):
-        if not dfs:
-            print(f"❌ No data found for {year}. Skipping.")
-            return
-
-        merged_df = pd.concat(dfs, ignore_index=True)
-        merged_df = merged_df.sort_values("hour_ts").reset_index(drop=True)
-
-        print(f"\n📋 Merged {year} data shape before cleaning: {merged_df.shape}")
-
-        # 🧹 Drop old lag columns (if they exist)
-        lag_cols = [col for col in merged_df.columns if col.startswith("ride_count_lag_")]
-        if lag_cols:
-            print(f"⚡ Dropping {len(lag_cols)} old lag columns before creating new.")
-            merged_df = merged_df.drop(columns=lag_cols)
-
-        # === Now create new lag features
-        lag_features = []
-        for lag in range(1, 673):
-            lag_col = merged_df["ride_count"].shift(lag)
-            lag_features.append(lag_col.rename(f"ride_count_lag_{lag}"))
-        lag_df = pd.concat(lag_features, axis=1)
-        merged_df = pd.concat([merged_df, lag_df], axis=1)
-
-        # 3-hour rolling mean
-        merged_df["ride_count_roll3"] = merged_df["ride_count"].shift(1).rolling(3, min_periods=1).mean()
-
-        # 8-hour ahead target
-        if "target_ride_count" not in merged_df.columns:
-            merged_df["target_ride_count"] = merged_df["ride_count"].shift(-8)
-
-        # Drop missing rows caused by lagging, rolling
-        merged_df = merged_df.dropna(subset=[f"ride_count_lag_{lag}" for lag in range(1, 673)] + ["ride_count_roll3", "target_ride_count"])
-        merged_df = merged_df.reset_index(drop=True)
-
-        print(f"✅ After dropping missing: {merged_df.shape}")
-
-        # Time-based features
-        merged_df["hour"] = merged_df["hour_ts"].dt.hour
-        merged_df["hour_sin"] = np.sin(2 * np.pi * merged_df["hour"] / 24)
-        merged_df["hour_cos"] = np.cos(2 * np.pi * merged_df["hour"] / 24)
-        merged_df["day_of_week"] = merged_df["hour_ts"].dt.dayofweek
-        merged_df["month"] = merged_df["hour_ts"].dt.month
-        merged_df["day_of_year"] = merged_df["hour_ts"].dt.dayofyear
-        merged_df["time_of_day"] = merged_df["hour"].apply(map_time_of_day)
+        history = month_df if buffer is None else pd.concat([buffer, month_df], ignore_index=True)
+        history = history.sort_values([spec.station_col, spec.time_col], kind="stable").reset_index(drop=True)
 
-        try:
-            us_holidays = holidays.US(years=[year])
-        except:
-            us_holidays = holidays.US(years=[])
+        # Keep just enough raw history for the next month's lags and targets
+        buffer = history.groupby(spec.station_col, observed=True, sort=False).tail(lookback_hours)
+
+        if start_month is not None and period < start_month:
+            print(f"📥 {file.name} read as lookback only")
+            continue
 
-        is_weekend = (merged_df["day_of_week"] >= 5).astype(int)
-        is_holiday = merged_df["hour_ts"].dt.date.isin(us_holidays).astype(int)
+        # History shorter than the longest lag (e.g. a partial first month)
+        # gives an empty frame: nothing is emitted and the buffer carries on
+        features = spec.build_features(history, extra_calendar=["time_of_day"])
+
+        # Rows already written (from the previous month's buffer) are skipped
+        hour_ts = features[spec.time_col]
+        keep = pd.Series(True, index=features.index)
+        if emitted_until is not None:
+            keep &= hour_ts > emitted_until
+        start_bound, end_bound = _as_bound(start, hour_ts.dt.tz), _as_bound(end, hour_ts.dt.tz)
+        if start_bound is not None:
+            keep &= hour_ts >= start_bound
+        if end_bound is not None:
+            keep &= hour_ts < end_bound
+        features = features[keep.to_numpy()]
+
+        if features.empty:
+            print(f"🚫 No rows with a full lag history in {file.name} yet")
+            continue
 
-        merged_df["is_holiday_or_weekend"] = ((is_weekend + is_holiday) >= 1).astype(int)
-        merged_df["is_peak_hour"] = merged_df["hour"].isin([7, 8, 9, 16, 17, 18, 19]).astype(int)
+        emitted_until = features[spec.time_col].max()
 
-        print(f"✅ Time-based features added for {year}. Final shape: {merged_df.shape}")
+        # Replace this source month's parts from a previous run
+        part_name = f"part-{period.year}_{period.month:02d}.parquet"
+        for stale in output_path.glob(f"year_month=*/{part_name}"):
+            stale.unlink()
 
-        # Save the processed dataset
-        save_path = output_path / f"rides_citibike_final_{year}_with_lags.parquet"
-        merged_df.to_parquet(save_path, index=False)
-        print(f"✅ Saved final dataset for {year} at: {save_path}")
+        hours = features[spec.time_col]
+        for (year, month), index in features.groupby([hours.dt.year, hours.dt.month], sort=True).groups.items():
+            partition_dir = output_path / f"year_month={year}-{month:02d}"
+            partition_dir.mkdir(parents=True, exist_ok=True)
+            output_file = partition_dir / part_name
+            with atomic_output_path(output_file) as tmp_file:
+                features.loc[index].to_parquet(tmp_file, index=False, row_group_size=PARTITION_ROW_GROUP_SIZE)
+            written.append(output_file)
 
-    # Process for 2024 and 2025
-    process_year_data(dfs_2024, 2024)
-    process_year_data(dfs_2025, 2025)
+        print(f"✅ {file.name}: {len(features)} rows with {len(spec.lags)} lags (spec v{spec.version}), buffer {len(buffer)} rows")
+
+    spec.save(output_path / "_feature_spec.json")
+    print(f"✅ Wrote {len(written)} partition files under {output_path}")
+    return written
+
+def create_final_features(
+    input_dir: str = r"C:/Users/MD/Desktop/citi/data/processed/feature_eng_all_id", 
+    output_dir: str = r"C:/Users/MD/Desktop/citi/data/processed/final_features",
+    spec: FeatureSpec = DEFAULT_FEATURE_SPEC,
+) -> list:
+    """
+    Build final features for every monthly input file into a partitioned
+    dataset under ``output_dir`` (read it back with ``pd.read_parquet(output_dir)``).
+    See ``build_final_features`` for date ranges.
+    """
+    return build_final_features(input_dir, output_dir, spec=spec)
 
 # ========= SPLITTING FUNCTION =========
 
@@ -154,27 +194,92 @@ def split_time_series_data(
 ) -> Tuple[pd.DataFrame, pd.Series, pd.DataFrame, pd.Series]:
     """
     Split CitiBike data based on hour_ts into training and testing sets.
+    ``df`` is left untouched.
     """
     if "hour_ts" not in df.columns:
         raise ValueError("Expected a column named 'hour_ts' for time-based splitting.")
 
-    df["hour_ts"] = pd.to_datetime(df["hour_ts"], errors="coerce")
+    hour_ts = pd.to_datetime(df["hour_ts"], errors="coerce")
 
     if not cutoff_date.tzinfo:
         cutoff_date = pytz.timezone("America/New_York").localize(cutoff_date)
 
-    train_data = df[df["hour_ts"] < cutoff_date].reset_index(drop=True)
-    test_data = df[df["hour_ts"] >= cutoff_date].reset_index(drop=True)
+    is_train = (hour_ts < cutoff_date).to_numpy()
+    is_test = (hour_ts >= cutoff_date).to_numpy()
+    feature_columns = [col for col in df.columns if col != target_column]
 
-    X_train = train_data.drop(columns=[target_column])
-    y_train = train_data[target_column]
-    X_test = test_data.drop(columns=[target_column])
-    y_test = test_data[target_column]
+    # One masked take per output; the new RangeIndex is set in place (no extra copy)
+    X_train, y_train = df.loc[is_train, feature_columns], df.loc[is_train, target_column]
+    X_test, y_test = df.loc[is_test, feature_columns], df.loc[is_test, target_column]
+    for part in (X_train, y_train, X_test, y_test):
+        part.index = pd.RangeIndex(len(part))
 
     print(f"✅ Split complete: {len(X_train)} train samples, {len(X_test)} test samples")
 
     return X_train, y_train, X_test, y_test
 
+def walk_forward_splits(
+    df: pd.DataFrame,
+    n_splits: int = 12,
+    freq: str = "MS",
+    cutoffs: list = None,
+    gap_hours: int = 8,
+    train_hours: int = None,
+    time_col: str = "hour_ts",
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Walk-forward (rolling-origin) cross-validation over an ``hour_ts``-sorted frame.
+
+    Fold ``i`` tests ``[cutoff_i, cutoff_{i+1})`` (the last fold runs to the
+    end of the data) and trains on hours before ``cutoff_i - gap_hours``, so
+    no training target (``gap_hours`` ahead) falls inside the test window.
+    Training windows expand from the first hour, or roll over the last
+    ``train_hours`` hours if given.
+
+    Parameters
+    ----------
+    n_splits, freq : int, str
+        Without explicit ``cutoffs``, use the last ``n_splits`` boundaries of
+        ``pd.date_range(..., freq=freq)`` (month starts by default).
+    cutoffs : list, optional
+        Explicit fold boundaries (naive values are New York time).
+
+    Yields
+    ------
+    (train_idx, test_idx) : Tuple[np.ndarray, np.ndarray]
+        Positional, contiguous index arrays; the frame itself is never copied
+        (use ``iloc`` or ``lgb.Dataset.subset`` on them).
+    """
+    times = pd.DatetimeIndex(pd.to_datetime(df[time_col]))
+    if not times.is_monotonic_increasing:
+        raise ValueError(f"walk_forward_splits needs rows sorted by '{time_col}'; sort once before splitting.")
+    if times.empty:
+        return
+
+    if cutoffs is None:
+        boundaries = pd.date_range(start=times[0].normalize(), end=times[-1], freq=freq)
+        cutoffs = [cutoff for cutoff in boundaries if cutoff > times[0]][-n_splits:]
+    cutoffs = sorted(_as_bound(cutoff, times.tz) for cutoff in cutoffs)
+
+    values = times.as_unit("ns").asi8
+    hour = pd.Timedelta(hours=1)
+
+    def _position(moment) -> int:
+        return int(np.searchsorted(values, pd.Timestamp(moment).as_unit("ns").value, side="left"))
+
+    for i, cutoff in enumerate(cutoffs):
+        test_start = _position(cutoff)
+        test_end = _position(cutoffs[i + 1]) if i + 1 < len(cutoffs) else len(values)
+
+        train_end = _position(cutoff - gap_hours * hour)
+        train_start = _position(cutoff - (gap_hours + train_hours) * hour) if train_hours else 0
+
+        if train_end <= train_start or test_end <= test_start:
+            print(f"⚠️ Skipping fold at {cutoff}: empty train or test window")
+            continue
+
+        yield np.arange(train_start, train_end), np.arange(test_start, test_end)
+
 # ========= MAIN ==========
 
 if __name__ == "__main__":
@@ -0,0 +1,36 @@
+# tests/test_build_final_features.py (FOR CITI BIKE PROJECT)
+
+import numpy as np
+import pandas as pd
+
+from src.feature_spec import DEFAULT_FEATURE_SPEC
+from src.utils import build_final_features
+
+STATIONS = ["1", "2", "3", "4", "5"]
+
+def _write_month(input_dir, start: str, end: str, month_key: str):
+    """Hourly counts for every station in ``[start, end]``, written as a monthly 8-hour input file."""
+    hours = pd.date_range(start, end, freq="h", tz="America/New_York")
+    df = pd.DataFrame({
+        "hour_ts": np.tile(hours, len(STATIONS)),
+        "start_station_id": np.repeat(STATIONS, len(hours)),
+        "ride_count": np.tile(np.arange(len(hours)), len(STATIONS)) % 17,
+    })
+    df.to_parquet(input_dir / f"citibike_features_targets_8hours_{month_key}.parquet", index=False)
+
+def test_partial_first_month_is_carried_into_the_next(tmp_path):
+    input_dir, output_dir = tmp_path / "input", tmp_path / "output"
+    input_dir.mkdir()
+
+    # 5 days x 5 stations: fewer rows than the longest lag (672 hours)
+    _write_month(input_dir, "2025-01-27 00:00", "2025-01-31 23:00", "2025_01")
+    _write_month(input_dir, "2025-02-01 00:00", "2025-02-28 23:00", "2025_02")
+
+    written = build_final_features(input_dir, output_dir)
+
+    # January emits nothing; February's rows use January's hours as lag history
+    assert written and all("part-2025_02" in file.name for file in written)
+    features = pd.concat([pd.read_parquet(file) for file in written], ignore_index=True)
+    first_hour = pd.Timestamp("2025-01-27 00:00", tz="America/New_York") + pd.Timedelta(hours=DEFAULT_FEATURE_SPEC.max_lag)
+    assert features["hour_ts"].min() == first_hour
+    assert features["start_station_id"].nunique() == len(STATIONS)
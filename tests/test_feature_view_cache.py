@@ -0,0 +1,82 @@
+# tests/test_feature_view_cache.py (FOR CITI BIKE PROJECT)
+
+import pandas as pd
+
+import src.feature_view_cache as feature_view_cache
+from src.feature_view_cache import CachedFeatureView
+from src.storage_backend import LocalBackend
+
+GROUP, VIEW = "citi_rides", "citi_rides_view"
+
+class SpyFeatureView:
+    """Wraps a feature view and records the ``(start_time, end_time)`` of every fetch."""
+
+    def __init__(self, feature_view):
+        self.feature_view = feature_view
+        self.calls = []
+
+    def get_batch_data(self, start_time=None, end_time=None):
+        self.calls.append((start_time, end_time))
+        return self.feature_view.get_batch_data(start_time=start_time, end_time=end_time)
+
+def _hours(start: str, periods: int) -> pd.DataFrame:
+    hour_ts = pd.date_range(start, periods=periods, freq="h", tz="UTC")
+    return pd.DataFrame({
+        "hour_ts": hour_ts.repeat(2),
+        "start_station_id": ["1", "2"] * periods,
+        "ride_count": range(2 * periods),
+    })
+
+def _store(tmp_path, df: pd.DataFrame):
+    backend = LocalBackend(tmp_path / "store")
+    backend.insert_feature_group(GROUP, df)
+    view = SpyFeatureView(backend.create_feature_view(VIEW, 1, GROUP))
+    return backend, view, CachedFeatureView(view, tmp_path / "cache")
+
+def _sorted(df: pd.DataFrame) -> pd.DataFrame:
+    return df.sort_values(["hour_ts", "start_station_id"]).reset_index(drop=True)[["hour_ts", "start_station_id", "ride_count"]]
+
+def test_only_the_tail_after_the_high_water_mark_is_fetched(tmp_path):
+    backend, view, cache = _store(tmp_path, _hours("2025-01-01", 48))
+    cache.get_batch_data()
+    high_water = cache.high_water_mark()
+    assert high_water == pd.Timestamp("2025-01-02 23:00", tz="UTC")
+
+    backend.insert_feature_group(GROUP, _hours("2025-01-03", 24))
+    df = cache.get_batch_data()
+
+    assert view.calls[-1] == (high_water, None)
+    assert cache.high_water_mark() == pd.Timestamp("2025-01-03 23:00", tz="UTC")
+    pd.testing.assert_frame_equal(_sorted(df), _sorted(view.feature_view.get_batch_data()))
+
+    # A range the cache covers is answered without fetching
+    calls = len(view.calls)
+    covered = cache.get_batch_data(start_time="2025-01-02", end_time="2025-01-03")
+    assert len(view.calls) == calls
+    assert len(covered) == 2 * 24
+
+def test_history_before_covered_from_is_backfilled(tmp_path):
+    _, view, cache = _store(tmp_path, _hours("2025-01-01", 72))
+    cache.get_batch_data(start_time="2025-01-02")
+
+    df = cache.get_batch_data(start_time="2025-01-01", end_time="2025-01-04")
+
+    covered_from = pd.Timestamp("2025-01-02", tz="UTC")
+    assert (pd.Timestamp("2025-01-01", tz="UTC"), covered_from) in view.calls
+    pd.testing.assert_frame_equal(_sorted(df), _sorted(view.feature_view.get_batch_data()))
+
+def test_loose_parts_are_compacted_into_monthly_parts(tmp_path, monkeypatch):
+    monkeypatch.setattr(feature_view_cache, "MAX_CACHE_PARTS", 2)
+    backend, view, cache = _store(tmp_path, _hours("2025-01-31 20:00", 2))
+    cache.get_batch_data()
+
+    # Two tail fetches across the month boundary: the third loose part triggers compaction
+    for start in ("2025-01-31 22:00", "2025-02-01 00:00"):
+        backend.insert_feature_group(GROUP, _hours(start, 2))
+        df = cache.get_batch_data()
+
+    state = cache._load_state()
+    assert sorted(part["month"] for part in state["parts"]) == ["2025-01", "2025-02"]
+    assert sorted(path.name for path in cache.cache_dir.glob("part-*.parquet")) == sorted(part["file"] for part in state["parts"])
+    assert sum(part["rows"] for part in state["parts"]) == 2 * 6
+    pd.testing.assert_frame_equal(_sorted(df), _sorted(view.feature_view.get_batch_data()))
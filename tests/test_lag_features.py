@@ -0,0 +1,44 @@
+# tests/test_lag_features.py (FOR CITI BIKE PROJECT)
+
+import numpy as np
+import pandas as pd
+
+from src.lag_features import add_lag_features
+
+def _hourly_counts(n_stations: int, n_hours: int) -> pd.DataFrame:
+    """Gap-free hourly counts; station ``s`` counts ``1000 * s + hour index``, so values name their row."""
+    hours = pd.date_range("2025-01-01", periods=n_hours, freq="h", tz="America/New_York")
+    return pd.DataFrame({
+        "hour_ts": np.tile(hours, n_stations),
+        "start_station_id": np.repeat([str(s) for s in range(n_stations)], n_hours),
+        "ride_count": (1000 * np.repeat(np.arange(n_stations), n_hours) + np.tile(np.arange(n_hours), n_stations)),
+    })
+
+def test_input_shorter_than_the_longest_lag_gives_an_empty_frame():
+    df = _hourly_counts(n_stations=2, n_hours=100)
+
+    short = add_lag_features(df, lags=(1, 672), horizon=8)
+    normal = add_lag_features(_hourly_counts(n_stations=2, n_hours=700), lags=(1, 672), horizon=8)
+
+    assert short.empty
+    assert list(short.columns) == list(normal.columns)
+    assert short.dtypes.equals(normal.dtypes)
+
+def test_lags_and_targets_stay_inside_their_station():
+    df = _hourly_counts(n_stations=3, n_hours=40)
+
+    # Shuffled input: rows are regrouped by station, then hour
+    result = add_lag_features(df.sample(frac=1, random_state=0), lags=(1, 24), horizon=8, rolling_windows=(3,))
+
+    station = result["start_station_id"].astype(int).to_numpy()
+    count = result["ride_count"].to_numpy()
+    position = count - 1000 * station
+
+    # Only hours with 24 hours of history and a target 8 hours ahead survive
+    assert (position >= 24).all() and (position + 8 < 40).all()
+    assert len(result) == 3 * (40 - 24 - 8)
+
+    np.testing.assert_array_equal(result["ride_count_lag_1"], count - 1)
+    np.testing.assert_array_equal(result["ride_count_lag_24"], count - 24)
+    np.testing.assert_array_equal(result["target_ride_count"], count + 8)
+    np.testing.assert_allclose(result["ride_count_roll3"], count - 2)
@@ -0,0 +1,18 @@
+# tests/test_storage_backend.py (FOR CITI BIKE PROJECT)
+
+import pandas as pd
+import pytest
+
+from src.storage_backend import LocalBackend
+
+def test_station_filter_casts_ids_to_the_stored_type(tmp_path):
+    backend = LocalBackend(tmp_path)
+    hour_ts = pd.date_range("2025-01-01", periods=2, freq="h", tz="UTC")
+    backend.insert_feature_group("ints", pd.DataFrame({"hour_ts": hour_ts, "start_station_id": [1, 2], "ride_count": [5, 6]}))
+    backend.insert_feature_group("strs", pd.DataFrame({"hour_ts": hour_ts, "start_station_id": ["1", "2"], "ride_count": [5, 6]}))
+
+    assert backend.read_feature_group("ints", stations=["1"])["ride_count"].tolist() == [5]
+    assert backend.read_feature_group("strs", stations=[2])["ride_count"].tolist() == [6]
+
+    with pytest.raises(ValueError, match="do not match the stored start_station_id type"):
+        backend.read_feature_group("ints", stations=["HB101"])
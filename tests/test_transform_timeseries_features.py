@@ -0,0 +1,34 @@
+# tests/test_transform_timeseries_features.py (FOR CITI BIKE PROJECT)
+
+import numpy as np
+import pandas as pd
+
+from src.transform_timeseries_features import transform_month_to_timeseries
+
+def _month_of_rides(month: str, seed: int) -> pd.DataFrame:
+    """A ride at every hour of ``month`` for two stations (UTC timestamps, as validated files store them)."""
+    rng = np.random.default_rng(seed)
+    hours = pd.date_range(pd.Period(month).start_time, pd.Period(month).end_time.floor("h"), freq="h", tz="America/New_York")
+    started = np.repeat(hours, 2) + pd.to_timedelta(rng.integers(0, 3600, 2 * len(hours)), unit="s")
+    return pd.DataFrame({
+        "started_at": started.tz_convert("UTC").tz_localize(None),
+        "ended_at": (started + pd.Timedelta(minutes=20)).tz_convert("UTC").tz_localize(None),
+        "start_station_name": np.tile(["A", "B"], len(hours)),
+        "start_station_id": np.tile(["1", "2"], len(hours)),
+    })
+
+def test_consecutive_months_continue_from_the_tail():
+    _, tail = transform_month_to_timeseries(_month_of_rides("2025-01", 0))
+    february, _ = transform_month_to_timeseries(_month_of_rides("2025-02", 1), tail)
+
+    # The carried counts fill the first hours' lags, so no row is dropped
+    assert february["hour_ts"].min() == pd.Timestamp("2025-02-01 00:00", tz="America/New_York")
+
+def test_skipped_month_starts_fresh_instead_of_filling_zeros():
+    _, tail = transform_month_to_timeseries(_month_of_rides("2025-01", 0))
+    march, _ = transform_month_to_timeseries(_month_of_rides("2025-03", 2), tail)
+
+    # No zero-filled February rows, and March's lags restart from NaN
+    assert march["hour_ts"].min() >= pd.Timestamp("2025-03-01", tz="America/New_York")
+    assert not (march["hour_ts"].dt.month == 2).any()
+    assert (march["ride_count_lag_1"] > 0).all()